@@ -0,0 +1,139 @@
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+from segmenter import split_sentences
+
+# One question per 150-200 words of passage
+WORDS_PER_QUESTION = 175
+
+_TOKEN_ESTIMATE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE token count (words plus punctuation) for when no tokenizer is available"""
+    return int(len(_TOKEN_ESTIMATE.findall(text)) * 1.2)
+
+
+class TokenCounter:
+    """
+    Counts tokens with a model's own tokenizer, loaded on first use.
+
+    Falls back to estimate_tokens() if transformers or the tokenizer files are
+    not available, so chunking never depends on being able to reach the hub.
+    """
+
+    def __init__(self, tokenizer_name: str):
+        self.tokenizer_name = tokenizer_name
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _get_tokenizer(self):
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    from transformers import AutoTokenizer
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                except Exception as e:
+                    print(f"Tokenizer {self.tokenizer_name} unavailable ({str(e)}); estimating token counts")
+            return self._tokenizer
+
+    def load(self):
+        """Load the tokenizer now (e.g. while the service warms up) instead of on the first count"""
+        self._get_tokenizer()
+
+    def __call__(self, text: str) -> int:
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return estimate_tokens(text)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def _bounded_sentences(text, count_tokens, max_tokens):
+    """Sentences of text, with any sentence over max_tokens cut into word windows that fit"""
+    for sentence in split_sentences(text):
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            yield sentence, tokens
+            continue
+        words = sentence.split()
+        step = max(1, int(len(words) * max_tokens / tokens))
+        for start in range(0, len(words), step):
+            piece = ' '.join(words[start:start + step])
+            yield piece, count_tokens(piece)
+
+
+def chunk_passage(text: str,
+                  count_tokens: Optional[Callable[[str], int]] = None,
+                  questions_per_chunk: int = 2,
+                  words_per_question: int = WORDS_PER_QUESTION,
+                  max_chunk_tokens: int = 600,
+                  overlap_words: int = 40) -> List[Dict]:
+    """
+    Split a passage into windows sized for question generation.
+
+    Sentences are packed into chunks of about questions_per_chunk *
+    words_per_question words, never exceeding max_chunk_tokens as measured by
+    count_tokens. Each chunk after the first starts with the last sentences
+    (up to overlap_words words) of the previous one, so questions about ideas
+    spanning a boundary still have their context.
+
+    Args:
+        text (str): Passage to split
+        count_tokens (callable): Returns the token count of a string (defaults to estimate_tokens)
+        questions_per_chunk (int): Questions each full chunk should yield
+        words_per_question (int): Passage words per question (the 150-200 word rule)
+        max_chunk_tokens (int): Hard token budget for a chunk's text
+        overlap_words (int): Words of trailing context repeated at the start of the next chunk
+
+    Returns:
+        list: Dicts with 'text', 'word_count', 'token_count' and 'num_questions'
+    """
+    count_tokens = count_tokens or estimate_tokens
+    target_words = max(1, questions_per_chunk * words_per_question)
+
+    chunks = []
+    current = []        # (sentence, words, tokens)
+    current_words = 0
+    current_tokens = 0
+    new_words = 0       # words not repeated from the previous chunk
+
+    def flush():
+        chunk_text = ' '.join(sentence for sentence, _, _ in current)
+        chunks.append({
+            'text': chunk_text,
+            'word_count': current_words,
+            'token_count': current_tokens,
+            'num_questions': max(1, round(new_words / words_per_question)),
+        })
+
+    for sentence, tokens in _bounded_sentences(text, count_tokens, max_chunk_tokens):
+        words = len(sentence.split())
+        if current and new_words and (current_words + words > target_words or
+                                      current_tokens + tokens > max_chunk_tokens):
+            flush()
+            # Carry the trailing sentences into the next chunk as overlap
+            overlap = []
+            overlap_count = 0
+            for item in reversed(current):
+                if overlap_count + item[1] > overlap_words:
+                    break
+                overlap.insert(0, item)
+                overlap_count += item[1]
+            # Overlap never pushes the next chunk over its token budget
+            while overlap and sum(item[2] for item in overlap) + tokens > max_chunk_tokens:
+                overlap_count -= overlap.pop(0)[1]
+            current = overlap
+            current_words = overlap_count
+            current_tokens = sum(item[2] for item in overlap)
+            new_words = 0
+        current.append((sentence, words, tokens))
+        current_words += words
+        current_tokens += tokens
+        new_words += words
+
+    if current and new_words:
+        flush()
+    return chunks
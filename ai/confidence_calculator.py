@@ -1,37 +1,76 @@
-from typing import List, Dict, Tuple
+import os
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional
 import numpy as np
-from transformers import AutoTokenizer, AutoModel
-import torch
-import torch.nn.functional as F
+
+from embedding_cache import EmbeddingCache
+from metrics import stage
+from model_registry import DEFAULT_EMBEDDING_MODEL, registry, variant_name
+
+if TYPE_CHECKING:
+    import torch
 
 class ConfidenceCalculator:
-    def __init__(self):
-        # Initialize the model and tokenizer for semantic similarity
-        self.model_name = "sentence-transformers/all-MiniLM-L6-v2"
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.model = AutoModel.from_pretrained(self.model_name)
+    def __init__(self, embedding_cache: Optional[EmbeddingCache] = None, quantize: Optional[bool] = None,
+                 model_name: Optional[str] = None):
+        # The model and tokenizer for semantic similarity are loaded lazily from the
+        # shared registry, and torch is imported on first use, so importing this
+        # module and constructing a calculator are cheap. The model is fixed here
+        # because the embedding cache is keyed on it
+        self.model_name = model_name or DEFAULT_EMBEDDING_MODEL
+        if quantize is None:
+            quantize = os.getenv('CONFIDENCE_MODEL_QUANTIZE', '').lower() in ('1', 'true', 'yes')
+        self.quantize = quantize
+        # Embeddings are memoized across calls (and, via the disk tier, processes)
+        self.embedding_cache = embedding_cache or EmbeddingCache(variant_name(self.model_name, quantize))
+
+    @property
+    def tokenizer(self):
+        return registry.get(self.model_name, quantize=self.quantize).tokenizer
+
+    @property
+    def model(self):
+        return registry.get(self.model_name, quantize=self.quantize).model
         
-    def _mean_pooling(self, model_output: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    def _mean_pooling(self, model_output: 'torch.Tensor', attention_mask: 'torch.Tensor') -> 'torch.Tensor':
         """Calculate mean pooling of token embeddings"""
+        import torch
         token_embeddings = model_output[0]
         input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
         return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
     
-    def _get_embeddings(self, texts: List[str]) -> torch.Tensor:
-        """Get embeddings for a list of texts"""
+    def _get_embeddings(self, texts: List[str]) -> 'torch.Tensor':
+        """Get embeddings for a list of texts, computing only those not already cached"""
+        import torch
+        dim = self.model.config.hidden_size
+        cached = self.embedding_cache.get_many(texts, dim=dim)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        if missing:
+            computed = self._compute_embeddings(missing).numpy()
+            self.embedding_cache.put_many(missing, computed)
+            computed_by_text = dict(zip(missing, computed))
+            cached = [computed_by_text[text] if vector is None else vector
+                      for text, vector in zip(texts, cached)]
+        return torch.from_numpy(np.stack(cached))
+
+    def _compute_embeddings(self, texts: List[str]) -> 'torch.Tensor':
+        """Run the model over a list of texts and return normalized embeddings"""
+        import torch
+        import torch.nn.functional as F
         encoded_input = self.tokenizer(texts, padding=True, truncation=True, return_tensors='pt')
-        with torch.no_grad():
+        with stage('embed'), torch.no_grad():
             model_output = self.model(**encoded_input)
         sentence_embeddings = self._mean_pooling(model_output, encoded_input['attention_mask'])
         return F.normalize(sentence_embeddings, p=2, dim=1)
     
     def calculate_semantic_similarity(self, text1: str, text2: str) -> float:
         """Calculate semantic similarity between two texts"""
+        import torch
         embeddings = self._get_embeddings([text1, text2])
         return float(torch.cosine_similarity(embeddings[0], embeddings[1], dim=0))
     
     def calculate_option_distinctiveness(self, options: List[str]) -> List[float]:
         """Calculate how distinct each option is from others"""
+        import torch
         embeddings = self._get_embeddings(options)
         n_options = len(options)
         distinctiveness_scores = []
@@ -56,35 +95,113 @@ class ConfidenceCalculator:
         relevance = 1 - abs(0.5 - similarity)
         return relevance
     
+    def _embed_texts(self, texts: List[str], batch_size: int = 64) -> 'torch.Tensor':
+        """Embed many texts in a few padded batches, embedding each unique text once"""
+        import torch
+        unique_texts = list(dict.fromkeys(texts))
+        # Sort by length so each padded batch holds similarly sized inputs
+        order = sorted(range(len(unique_texts)), key=lambda i: len(unique_texts[i]))
+        unique_embeddings = [None] * len(unique_texts)
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            batch_embeddings = self._get_embeddings([unique_texts[i] for i in batch_indices])
+            for i, embedding in zip(batch_indices, batch_embeddings):
+                unique_embeddings[i] = embedding
+        position = {text: i for i, text in enumerate(unique_texts)}
+        return torch.stack([unique_embeddings[position[text]] for text in texts])
+
+    def _scores_from_embeddings(self,
+                                options: List[str],
+                                correct_answer: str,
+                                question_embedding: 'torch.Tensor',
+                                answer_embedding: 'torch.Tensor',
+                                option_embeddings: 'torch.Tensor') -> 'torch.Tensor':
+        """Combine precomputed (normalized) embeddings into per-option confidence scores, in option order"""
+        import torch
+        n_options = len(options)
+        # Embeddings are L2-normalized, so every cosine similarity is a dot product
+        option_similarities = option_embeddings @ option_embeddings.T
+        # Higher score means more distinct (less similar to others)
+        other_similarity_sums = option_similarities.sum(dim=1) - option_similarities.diagonal()
+        # A lone option has nothing to be confused with
+        distinctiveness_scores = (1 - other_similarity_sums / (n_options - 1) if n_options > 1
+                                  else torch.ones(n_options))
+
+        answer_similarities = option_embeddings @ answer_embedding
+        # Score peaks at 0.5 similarity to the question and decreases towards 0 and 1
+        relevance_scores = 1 - (0.5 - option_embeddings @ question_embedding).abs()
+
+        is_correct = torch.tensor([option == correct_answer for option in options])
+        # Semantic similarity with correct answer (lower is better for distractors)
+        semantic_scores = torch.where(is_correct, answer_similarities, 1 - answer_similarities)
+        # For the correct answer we want high similarity and relevance; for distractors
+        # low similarity but high relevance and distinctiveness
+        return torch.where(
+            is_correct,
+            0.4 * semantic_scores + 0.4 * relevance_scores + 0.2 * distinctiveness_scores,
+            0.3 * semantic_scores + 0.4 * relevance_scores + 0.3 * distinctiveness_scores,
+        )
+
     def calculate_confidence_scores(self, 
                                   question: str,
                                   options: List[str],
                                   correct_answer: str) -> Dict[str, float]:
         """Calculate confidence scores for all options"""
-        # Calculate distinctiveness for all options
-        distinctiveness_scores = self.calculate_option_distinctiveness(options)
-        
-        # Calculate confidence scores for each option
-        confidence_scores = {}
-        for i, option in enumerate(options):
-            # Semantic similarity with correct answer (lower is better for distractors)
-            semantic_similarity = self.calculate_semantic_similarity(option, correct_answer)
-            semantic_score = 1 - semantic_similarity if option != correct_answer else semantic_similarity
-            
-            # Relevance to question
-            relevance_score = self.calculate_relevance_to_question(question, option)
-            
-            # Distinctiveness from other options
-            distinctiveness_score = distinctiveness_scores[i]
-            
-            # Combine scores with weights
-            if option == correct_answer:
-                # For correct answer, we want high similarity and relevance
-                confidence = 0.4 * semantic_score + 0.4 * relevance_score + 0.2 * distinctiveness_score
-            else:
-                # For distractors, we want low similarity but high relevance and distinctiveness
-                confidence = 0.3 * semantic_score + 0.4 * relevance_score + 0.3 * distinctiveness_score
-            
-            confidence_scores[option] = float(confidence)
-        
-        return confidence_scores
\ No newline at end of file
+        return self.calculate_confidence_scores_batch([{
+            'question': question,
+            'options': options,
+            'correct_answer': correct_answer
+        }])[0]
+
+    def calculate_confidence_scores_batch(self,
+                                          mcqs: List[Dict],
+                                          batch_size: int = 64) -> List[Dict[str, float]]:
+        """
+        Calculate confidence scores for a list of MCQs.
+
+        The question, correct answer and options of every MCQ are embedded together
+        in a few padded forward passes, and all similarities for an MCQ are computed
+        as matrix products over those embeddings.
+
+        Args:
+            mcqs (list): Dicts with 'question', 'options' and 'correct_answer' keys
+            batch_size (int): Maximum number of texts per model forward pass
+
+        Returns:
+            list: One {option: confidence} dict per MCQ, in input order
+        """
+        return [{option: float(confidence) for option, confidence in zip(mcq['options'], scores.tolist())}
+                for mcq, scores in zip(mcqs, self.calculate_confidence_arrays(mcqs, batch_size=batch_size))]
+
+    def calculate_confidence_arrays(self, mcqs: List, batch_size: int = 64) -> List[np.ndarray]:
+        """
+        Like calculate_confidence_scores_batch, but return each MCQ's scores as a
+        float32 array in option order (so repeated option texts keep their own score).
+
+        Args:
+            mcqs (list): MCQ records or dicts with 'question', 'options' and 'correct_answer'
+        """
+        texts = []
+        for mcq in mcqs:
+            texts.append(mcq['question'])
+            texts.append(mcq['correct_answer'])
+            texts.extend(mcq['options'])
+        if not texts:
+            return []
+
+        with stage('score'):
+            embeddings = self._embed_texts(texts, batch_size=batch_size)
+
+            all_scores = []
+            offset = 0
+            for mcq in mcqs:
+                n_options = len(mcq['options'])
+                all_scores.append(self._scores_from_embeddings(
+                    mcq['options'],
+                    mcq['correct_answer'],
+                    embeddings[offset],
+                    embeddings[offset + 1],
+                    embeddings[offset + 2:offset + 2 + n_options]
+                ).numpy().astype(np.float32))
+                offset += 2 + n_options
+        return all_scores
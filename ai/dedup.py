@@ -0,0 +1,112 @@
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Cosine similarity at or above which two questions count as paraphrases
+DEFAULT_QUESTION_THRESHOLD = 0.9
+
+
+def threshold_from_env() -> Optional[float]:
+    """QUESTION_DEDUP_THRESHOLD as a float, or None when semantic dedup is disabled"""
+    value = os.getenv('QUESTION_DEDUP_THRESHOLD', '').strip()
+    return float(value) if value else None
+
+
+def cluster_by_similarity(embeddings: np.ndarray, threshold: float, block_size: int = 1024) -> np.ndarray:
+    """
+    Group rows whose cosine similarity is at least threshold (transitively).
+
+    Similarities are computed one row block at a time against the rows after it,
+    so memory stays at block_size x n floats however many rows there are.
+
+    Args:
+        embeddings (np.ndarray): (n, d) L2-normalized embeddings
+        threshold (float): Minimum cosine similarity for two rows to be linked
+        block_size (int): Rows per block of the similarity product
+
+    Returns:
+        np.ndarray: Cluster label per row (the index of the cluster's first row)
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n = embeddings.shape[0]
+    parent = np.arange(n)
+
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    for start in range(0, n, block_size):
+        block = embeddings[start:start + block_size]
+        # Upper triangle only: compare this block with itself and every later row
+        similarities = block @ embeddings[start:].T
+        rows, cols = np.nonzero(similarities >= threshold)
+        for row, col in zip(rows + start, cols + start):
+            if col <= row:
+                continue
+            a, b = find(row), find(col)
+            if a != b:
+                # Keep the smaller index as root so labels point at the earliest row
+                parent[max(a, b)] = min(a, b)
+
+    return np.array([find(i) for i in range(n)])
+
+
+def select_representatives(labels: np.ndarray, scores: Optional[Sequence[float]] = None) -> List[int]:
+    """
+    Pick one index per cluster: the highest-scoring one, or the earliest without scores.
+
+    Returns:
+        list: Kept indices in their original order
+    """
+    best: Dict[int, int] = {}
+    for i, label in enumerate(labels):
+        current = best.get(label)
+        if current is None or (scores is not None and scores[i] > scores[current]):
+            best[label] = i
+    return sorted(best.values())
+
+
+def deduplicate_texts(texts: List[str],
+                      calculator,
+                      threshold: float = DEFAULT_QUESTION_THRESHOLD,
+                      scores: Optional[Sequence[float]] = None) -> List[int]:
+    """
+    Indices of texts to keep after collapsing near-duplicates.
+
+    Args:
+        texts (list): Texts to compare (e.g. questions)
+        calculator: ConfidenceCalculator whose embeddings (and cache) are used
+        threshold (float): Cosine similarity at which two texts are duplicates
+        scores (list): Optional quality score per text; the best per cluster is kept
+    """
+    if len(texts) < 2:
+        return list(range(len(texts)))
+    embeddings = calculator._embed_texts(texts).numpy()
+    return select_representatives(cluster_by_similarity(embeddings, threshold), scores)
+
+
+def mcq_quality(confidence_scores: Dict[str, float]) -> float:
+    """Overall quality of an MCQ: mean confidence across its options"""
+    return float(np.mean(list(confidence_scores.values()))) if confidence_scores else 0.0
+
+
+def deduplicate_mcqs(mcqs: List[Dict],
+                     calculator,
+                     threshold: float = DEFAULT_QUESTION_THRESHOLD,
+                     scores: Optional[Sequence[float]] = None) -> List[Dict]:
+    """
+    Drop paraphrased duplicate MCQs, keeping the best-scoring question of each cluster.
+
+    Without scores, each MCQ is scored with calculator.calculate_confidence_scores_batch.
+    """
+    if len(mcqs) < 2:
+        return list(mcqs)
+    if scores is None:
+        scores = [mcq_quality(s) for s in calculator.calculate_confidence_scores_batch(mcqs)]
+    keep = deduplicate_texts([mcq['question'] for mcq in mcqs], calculator, threshold, scores)
+    return [mcqs[i] for i in keep]
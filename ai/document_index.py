@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from segmenter import iter_page_segments
+
+# Default on-disk location, shared by every process running from this checkout
+DEFAULT_INDEX_DIR = Path(__file__).parent.parent / 'cache' / 'documents'
+
+# Words of page text per indexed chunk
+CHUNK_WORDS = 200
+
+DOCUMENT_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def file_sha256(path) -> str:
+    """Hex SHA-256 of a file's contents, used as its document id"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_pages(pages: Iterable[Tuple[int, str]], chunk_words: int = CHUNK_WORDS) -> List[Dict]:
+    """
+    Group the sentences of a document into chunks of about chunk_words words.
+
+    Returns:
+        list: Dicts with 'text', 'first_page' and 'last_page'
+    """
+    chunks = []
+    current = []
+    current_words = 0
+    first_page = last_page = None
+    for page_number, segment in iter_page_segments(pages):
+        if not current:
+            first_page = page_number
+        current.append(segment)
+        current_words += len(segment.split())
+        last_page = page_number
+        if current_words >= chunk_words:
+            chunks.append({'text': ' '.join(current), 'first_page': first_page, 'last_page': last_page})
+            current = []
+            current_words = 0
+    if current:
+        chunks.append({'text': ' '.join(current), 'first_page': first_page, 'last_page': last_page})
+    return chunks
+
+
+class DocumentIndex:
+    """
+    Chunk embeddings of one document, loaded from its index directory.
+
+    The directory holds the (n_chunks, dim) float32 matrix, memory-mapped
+    rather than read so large documents cost no heap, the chunk texts and
+    page ranges, and the page texts the chunks were built from.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        with open(self.directory / 'meta.json') as f:
+            self.meta = json.load(f)
+        with open(self.directory / 'chunks.json') as f:
+            self.chunks = json.load(f)
+        n_chunks, dim = len(self.chunks), self.meta['dim']
+        self.embeddings = (np.memmap(self.directory / 'embeddings.f32', dtype=np.float32, mode='r',
+                                     shape=(n_chunks, dim))
+                           if n_chunks else np.zeros((0, dim), dtype=np.float32))
+
+    @property
+    def document_id(self) -> str:
+        return self.meta['document_id']
+
+    def pages(self) -> List[Tuple[int, str]]:
+        """The extracted (page_number, text) pairs of the document"""
+        with open(self.directory / 'pages.json') as f:
+            return [tuple(page) for page in json.load(f)]
+
+    def search_vector(self, query: np.ndarray, k: int = 5) -> List[Dict]:
+        """Top-k chunks by cosine similarity to an L2-normalized query embedding"""
+        if not self.chunks or k <= 0:
+            return []
+        scores = self.embeddings @ np.asarray(query, dtype=np.float32)
+        k = min(k, len(scores))
+        # Partial selection, then sort only the k winners
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self.chunks[i], chunk=int(i), score=float(scores[i])) for i in top]
+
+
+class DocumentIndexStore:
+    """
+    Per-document chunk indexes under one directory, keyed by file hash.
+
+    Each document lives in <directory>/<sha256>/. An index is written to a
+    temporary directory and renamed into place, so other processes only ever
+    see complete indexes; re-uploading an unchanged file finds the existing one.
+    An index built with a different embedding model than the current one is
+    stale: it is treated as missing and replaced when the document is indexed
+    again.
+    """
+
+    def __init__(self,
+                 directory: Optional[Path] = None,
+                 calculator=None,
+                 chunk_words: int = CHUNK_WORDS,
+                 max_loaded: int = 32):
+        self.directory = Path(directory or os.getenv('DOCUMENT_INDEX_DIR') or DEFAULT_INDEX_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.chunk_words = chunk_words
+        self.max_loaded = max_loaded
+        self._calculator = calculator
+        self._loaded: 'OrderedDict[str, DocumentIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def calculator(self):
+        # Deferred so listing and loading indexes does not import torch
+        if self._calculator is None:
+            from confidence_calculator import ConfidenceCalculator
+            self._calculator = ConfidenceCalculator()
+        return self._calculator
+
+    @property
+    def model_name(self) -> str:
+        """The embedding model (and variant) that indexes and queries are embedded with"""
+        return self.calculator.embedding_cache.model_name
+
+    def _is_stale(self, directory: Path) -> bool:
+        try:
+            with open(directory / 'meta.json') as f:
+                return json.load(f).get('model') != self.model_name
+        except (OSError, ValueError):
+            return False
+
+    def get(self, document_id: str) -> Optional[DocumentIndex]:
+        """Load a document's index, or None if it has not been built"""
+        if not DOCUMENT_ID_PATTERN.match(document_id or ''):
+            return None
+        with self._lock:
+            index = self._loaded.get(document_id)
+            if index is not None:
+                self._loaded.move_to_end(document_id)
+                return index
+        directory = self.directory / document_id
+        if not (directory / 'meta.json').exists():
+            return None
+        index = DocumentIndex(directory)
+        if index.meta.get('model') != self.model_name:
+            return None
+        with self._lock:
+            self._loaded[document_id] = index
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return index
+
+    def find(self, name_or_id: str) -> Optional[DocumentIndex]:
+        """Look a document up by id or by file name (the most recently indexed match wins)"""
+        index = self.get(name_or_id)
+        if index is not None:
+            return index
+        name = os.path.basename(name_or_id or '').lower()
+        best = None
+        for document in self.list():
+            if document['filename'].lower() == name and (best is None or document['created_at'] > best['created_at']):
+                best = document
+        return self.get(best['document_id']) if best else None
+
+    def list(self) -> List[Dict]:
+        """Metadata of every indexed document"""
+        documents = []
+        for meta_path in self.directory.glob('*/meta.json'):
+            try:
+                with open(meta_path) as f:
+                    documents.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return documents
+
+    def _embed(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Embed chunk texts in length-sorted batches (bypassing the shared embedding cache)"""
+        calculator = self.calculator
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = None
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            computed = calculator._compute_embeddings([texts[i] for i in batch]).numpy()
+            if embeddings is None:
+                embeddings = np.empty((len(texts), computed.shape[1]), dtype=np.float32)
+            embeddings[batch] = computed
+        return embeddings
+
+    def build(self, document_id: str, pages: List[Tuple[int, str]], filename: str = '') -> DocumentIndex:
+        """Chunk and embed a document's pages and store them as its index"""
+        chunks = chunk_pages(pages, self.chunk_words)
+        embeddings = self._embed([chunk['text'] for chunk in chunks]) if chunks else None
+        dim = embeddings.shape[1] if embeddings is not None else self.calculator.model.config.hidden_size
+
+        tmp_dir = self.directory / f'.{document_id}.{uuid.uuid4().hex}.tmp'
+        tmp_dir.mkdir()
+        try:
+            with open(tmp_dir / 'embeddings.f32', 'wb') as f:
+                if embeddings is not None:
+                    f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+            with open(tmp_dir / 'chunks.json', 'w') as f:
+                json.dump(chunks, f)
+            with open(tmp_dir / 'pages.json', 'w') as f:
+                json.dump([list(page) for page in pages], f)
+            with open(tmp_dir / 'meta.json', 'w') as f:
+                json.dump({
+                    'document_id': document_id,
+                    'filename': filename,
+                    'model': self.model_name,
+                    'dim': int(dim),
+                    'n_chunks': len(chunks),
+                    'n_pages': len(pages),
+                    'created_at': time.time(),
+                }, f)
+            target = self.directory / document_id
+            if self._is_stale(target):
+                # Move the old model's index aside, then remove it
+                stale_dir = self.directory / f'.{document_id}.{uuid.uuid4().hex}.stale'
+                try:
+                    os.rename(target, stale_dir)
+                except OSError:
+                    pass
+                shutil.rmtree(stale_dir, ignore_errors=True)
+            try:
+                os.rename(tmp_dir, target)
+            except OSError:
+                # Another process indexed the same document first; keep its copy
+                pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return self.get(document_id)
+
+    def get_or_build(self, pdf_path, filename: str = '', pages: Optional[List[Tuple[int, str]]] = None,
+                     document_id: Optional[str] = None) -> DocumentIndex:
+        """
+        Return the index of a PDF, building it only if this exact file has not been indexed.
+
+        Args:
+            pdf_path (str): Path to the PDF
+            filename (str): Name to find the document by later (defaults to the file's name)
+            pages (list): Already extracted (page_number, text) pairs, to skip extraction
+            document_id (str): The file's SHA-256, if the caller already computed it
+        """
+        document_id = document_id or file_sha256(pdf_path)
+        index = self.get(document_id)
+        if index is not None:
+            return index
+        if pages is None:
+            from process_pdf import iter_pdf_pages
+            pages = list(iter_pdf_pages(pdf_path))
+        return self.build(document_id, pages, filename or os.path.basename(pdf_path))
+
+    def search(self, name_or_id: str, query: str, k: int = 5) -> List[Dict]:
+        """
+        Top-k chunks of a document most relevant to a query.
+
+        Returns:
+            list: Chunk dicts ('text', 'first_page', 'last_page', 'chunk', 'score'), best first
+
+        Raises:
+            KeyError: If the document has not been indexed
+        """
+        index = self.find(name_or_id)
+        if index is None:
+            raise KeyError(name_or_id)
+        query_embedding = self.calculator._embed_texts([query])[0].numpy()
+        return index.search_vector(query_embedding, k)
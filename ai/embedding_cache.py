@@ -0,0 +1,273 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from metrics import registry
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a process-local lock
+    fcntl = None
+
+LOOKUPS = registry.counter('eduquery_embedding_cache_lookups_total',
+                           'Embedding cache lookups by result (memory_hit, disk_hit, miss)', ('result',))
+
+# Default on-disk location, shared by every process running from this checkout
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / 'cache' / 'embeddings'
+# Default size bound of the disk tier, per embedding dimension
+DEFAULT_DISK_MAX_MB = 1024
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies of a text share one entry"""
+    return ' '.join(text.split())
+
+
+def cache_key(model_name: str, text: str) -> str:
+    """Content address for an embedding: hash of model name + normalized text"""
+    digest = hashlib.sha256()
+    digest.update(model_name.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_text(text).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class DiskEmbeddingStore:
+    """
+    Append-only embedding store shared between processes.
+
+    Vectors live in a float32 matrix file that readers memory-map; an index file
+    maps each key to its row. Writers append the vectors first and the index lines
+    second (under a file lock), so any row a reader finds in the index is complete.
+
+    Rows are never rewritten, so the store does not evict: once it holds
+    max_bytes of vectors, new embeddings are no longer added (they are still
+    cached in memory). Delete the directory to start over.
+    """
+
+    def __init__(self, directory: Path, dim: int, max_bytes: Optional[int] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.matrix_path = self.directory / f'embeddings-{dim}.f32'
+        self.index_path = self.directory / f'index-{dim}.tsv'
+        self.lock_path = self.directory / f'.lock-{dim}'
+        self._row_bytes = dim * np.dtype(np.float32).itemsize
+        self.max_rows = None if max_bytes is None else max_bytes // self._row_bytes
+        self._index: Dict[str, int] = {}
+        self._index_offset = 0
+        self._matrix: Optional[np.memmap] = None
+        self._thread_lock = threading.Lock()
+        self.matrix_path.touch(exist_ok=True)
+        self.index_path.touch(exist_ok=True)
+
+    def _file_lock(self):
+        return _FileLock(self.lock_path)
+
+    def _refresh_index(self):
+        """Pick up index lines appended by other processes since the last read"""
+        if os.path.getsize(self.index_path) == self._index_offset:
+            # Nothing new; a stat is much cheaper than reopening the file
+            return
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # Only consume complete lines; a partial trailing line is read next time
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            key, row = line.decode('ascii').split('\t')
+            self._index[key] = int(row)
+        self._index_offset += end
+
+    def _row(self, row: int) -> np.ndarray:
+        if self._matrix is None or row >= self._matrix.shape[0]:
+            n_rows = os.path.getsize(self.matrix_path) // self._row_bytes
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(n_rows, self.dim))
+        return np.array(self._matrix[row])
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._thread_lock:
+            if key not in self._index:
+                self._refresh_index()
+            row = self._index.get(key)
+            if row is None:
+                return None
+            return self._row(row)
+
+    def put(self, key: str, vector: np.ndarray):
+        self.put_many([key], np.asarray(vector)[np.newaxis])
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        """Append the vectors whose keys are not stored yet, with one lock and one fsync for the batch"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of shape (n, {self.dim}), got {vectors.shape}")
+        with self._thread_lock, self._file_lock():
+            self._refresh_index()
+            new = {}
+            for i, key in enumerate(keys):
+                if key not in self._index and key not in new:
+                    new[key] = i
+            if self.max_rows is not None:
+                room = max(0, self.max_rows - os.path.getsize(self.matrix_path) // self._row_bytes)
+                new = dict(list(new.items())[:room])
+            if not new:
+                return
+            with open(self.matrix_path, 'ab') as f:
+                first_row = f.tell() // self._row_bytes
+                f.write(vectors[list(new.values())].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, 'ab') as f:
+                f.write(''.join(f"{key}\t{first_row + i}\n" for i, key in enumerate(new)).encode('ascii'))
+            self._refresh_index()
+
+    def __len__(self) -> int:
+        with self._thread_lock:
+            self._refresh_index()
+            return len(self._index)
+
+
+class _FileLock:
+    """Exclusive advisory lock on a file (no-op where fcntl is unavailable)"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by model name + normalized text hash.
+
+    Lookups go to an in-process LRU bounded by a byte budget first, then to an
+    optional memory-mapped disk store shared by all workers. Disk hits are
+    promoted into the LRU.
+    """
+
+    def __init__(self,
+                 model_name: str,
+                 max_memory_bytes: int = 64 * 1024 * 1024,
+                 cache_dir: Optional[Path] = None,
+                 use_disk: bool = True,
+                 max_disk_bytes: Optional[int] = None):
+        self.model_name = model_name
+        self.max_memory_bytes = max_memory_bytes
+        self.cache_dir = Path(cache_dir or os.getenv('EMBEDDING_CACHE_DIR') or DEFAULT_CACHE_DIR)
+        self.use_disk = use_disk
+        if max_disk_bytes is None:
+            max_disk_bytes = int(float(os.getenv('EMBEDDING_CACHE_MAX_MB', str(DEFAULT_DISK_MAX_MB))) * 1024 * 1024)
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_stores: Dict[int, DiskEmbeddingStore] = {}
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _disk_store(self, dim: int) -> DiskEmbeddingStore:
+        # Created under the lock, so threads never append through two stores for one dim
+        with self._lock:
+            store = self._disk_stores.get(dim)
+            if store is None:
+                store = DiskEmbeddingStore(self.cache_dir, dim, max_bytes=self.max_disk_bytes)
+                self._disk_stores[dim] = store
+            return store
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Insert into the LRU tier, evicting least recently used entries over budget"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        if vector.nbytes > self.max_memory_bytes:
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def get(self, text: str, dim: Optional[int] = None) -> Optional[np.ndarray]:
+        """Return the cached embedding for text, or None on a miss"""
+        key = cache_key(self.model_name, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                LOOKUPS.inc(result='memory_hit')
+                return vector
+            dims = [dim] if dim is not None else list(self._disk_stores)
+        if self.use_disk:
+            for d in dims:
+                vector = self._disk_store(d).get(key)
+                if vector is not None:
+                    with self._lock:
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+                    LOOKUPS.inc(result='disk_hit')
+                    return vector
+        with self._lock:
+            self.misses += 1
+        LOOKUPS.inc(result='miss')
+        return None
+
+    def put(self, text: str, vector: np.ndarray):
+        """Store an embedding in both tiers"""
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        key = cache_key(self.model_name, text)
+        with self._lock:
+            self._remember(key, vector)
+        if self.use_disk:
+            self._disk_store(vector.shape[0]).put(key, vector)
+
+    def get_many(self, texts: List[str], dim: Optional[int] = None) -> List[Optional[np.ndarray]]:
+        return [self.get(text, dim=dim) for text in texts]
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """Store many embeddings of one dimension, writing them to disk in a single append"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(texts):
+            return
+        keys = [cache_key(self.model_name, text) for text in texts]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                # A copy, so the LRU does not keep the whole batch alive
+                self._remember(key, vector.copy())
+        if self.use_disk:
+            self._disk_store(vectors.shape[1]).put_many(keys, vectors)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss/eviction counters and current memory usage"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+            }
@@ -0,0 +1,418 @@
+import email.utils
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import requests
+
+from metrics import registry, stage
+
+# Statuses worth retrying: rate limiting, model loading and transient gateway errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+UPSTREAM_REQUESTS = registry.counter('eduquery_upstream_requests_total',
+                                     'Inference API requests by endpoint and HTTP status (error: no response)',
+                                     ('endpoint', 'status'))
+UPSTREAM_RETRIES = registry.counter('eduquery_upstream_retries_total', 'Inference API retries by endpoint',
+                                    ('endpoint',))
+UPSTREAM_SECONDS = registry.histogram('eduquery_upstream_request_seconds',
+                                      'Latency of single inference API attempts', ('endpoint',))
+RATE_LIMIT_WAITING = registry.gauge('eduquery_rate_limiter_waiting', 'Threads waiting for an inference rate-limit token')
+
+
+class InferenceError(Exception):
+    """An inference call failed after retries (or could not be retried)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AuthenticationError(InferenceError):
+    """The API rejected our credentials (401/403); retrying will not help"""
+
+
+class CircuitOpenError(InferenceError):
+    """The endpoint failed repeatedly and calls are short-circuited for a while"""
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (0.0 for an empty list)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def iter_stream_tokens(response):
+    """
+    Yield the token texts of a streamed text-generation response.
+
+    The API sends server-sent events, one per generated token:
+    data: {"token": {"text": "...", "special": false}, ...}
+    """
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            event = json.loads(line[len('data:'):])
+            if 'error' in event:
+                raise InferenceError(f"Stream from {response.url} failed: {event['error']}")
+            token = event.get('token') or {}
+            if token.get('text') and not token.get('special'):
+                yield token['text']
+    except (requests.exceptions.RequestException, ValueError) as e:
+        raise InferenceError(f"Stream from {response.url} failed: {str(e)}")
+    finally:
+        response.close()
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+
+    pause() empties the bucket and blocks every caller until the given time,
+    so when one request is told to back off, all threads back off with it.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a token is available"""
+        waiting = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now < self._paused_until:
+                        wait = self._paused_until - now
+                    elif self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    else:
+                        wait = (1 - self._tokens) / self.rate
+                if not waiting:
+                    waiting = True
+                    RATE_LIMIT_WAITING.inc()
+                time.sleep(wait)
+        finally:
+            if waiting:
+                RATE_LIMIT_WAITING.dec()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0
+            self._updated = now
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint circuit breaker.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast for reset_timeout seconds; then a single trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = 'half-open'
+                return True
+            if self.state == 'half-open':
+                # A trial call is already in flight
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half-open' or self._failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+
+class EndpointMetrics:
+    """Call counts, status codes, retries and recent latencies for one endpoint"""
+
+    def __init__(self, max_samples: int = 1024):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.status_codes: Dict[int, int] = {}
+        self.latencies = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, status_code: Optional[int], latency: float, error: bool):
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            if status_code is not None:
+                self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+            if error:
+                self.errors += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            latencies = list(self.latencies)
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'retries': self.retries,
+                'status_codes': dict(self.status_codes),
+                'latency_p50': percentile(latencies, 50),
+                'latency_p95': percentile(latencies, 95),
+                'latency_p99': percentile(latencies, 99),
+            }
+
+
+class InferenceClient:
+    """
+    Shared client for all Hugging Face inference calls.
+
+    Every call goes through one keep-alive session, a process-wide token bucket,
+    and a per-endpoint circuit breaker. Retryable failures back off
+    exponentially with full jitter, honouring Retry-After when the API sends it.
+    """
+
+    def __init__(self,
+                 rate: float = float(os.getenv("INFERENCE_RATE_LIMIT", "5")),
+                 burst: float = float(os.getenv("INFERENCE_BURST", "10")),
+                 max_retries: int = 3,
+                 base_delay: float = 1.0,
+                 max_delay: float = 30.0,
+                 pool_size: int = 4,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        self.limiter = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.pool_size = 0
+        self.session = None
+        self.ensure_pool_size(pool_size)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._metrics: Dict[str, EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    def ensure_pool_size(self, pool_size: int):
+        """Grow the keep-alive connection pool so pool_size calls can run at once"""
+        if pool_size <= self.pool_size:
+            return
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self.session = session
+        self.pool_size = pool_size
+
+    def _endpoint(self, url):
+        with self._lock:
+            if url not in self._breakers:
+                self._breakers[url] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._metrics[url] = EndpointMetrics()
+            return self._breakers[url], self._metrics[url]
+
+    def backoff_delay(self, attempt: int, base_delay: Optional[float] = None) -> float:
+        """Exponential backoff with full jitter for the given (0-based) attempt"""
+        base = self.base_delay if base_delay is None else base_delay
+        return random.uniform(0, min(self.max_delay, base * (2 ** attempt)))
+
+    def post(self, url, payload, headers=None, timeout=30, max_retries=None, base_delay=None, deadline=None,
+             stream=False):
+        """
+        POST a JSON payload to an inference endpoint and return the decoded JSON.
+
+        Args:
+            url (str): Endpoint URL
+            payload (dict): JSON body
+            headers (dict): Request headers (e.g. Authorization)
+            timeout (float or tuple): Per-attempt timeout in seconds, or (connect, read)
+            max_retries (int): Attempts before giving up (defaults to the client's)
+            base_delay (float): Backoff base in seconds (defaults to the client's)
+            deadline (float): Budget in seconds for the whole call, retries and backoff
+                included; attempts are cut short so the call never runs past it
+            stream (bool): Return an iterator over the generated tokens (see
+                iter_stream_tokens) instead of the decoded JSON; retries only
+                cover getting the stream started
+
+        Raises:
+            AuthenticationError: On 401/403
+            CircuitOpenError: If the endpoint's circuit is open
+            InferenceError: If every attempt failed
+        """
+        breaker, metrics = self._endpoint(url)
+        attempts = max(1, self.max_retries if max_retries is None else max_retries)
+        last_error = None
+        last_status = None
+        ends_at = time.monotonic() + deadline if deadline else None
+
+        for attempt in range(attempts):
+            attempt_timeout = timeout
+            if ends_at is not None:
+                remaining = ends_at - time.monotonic()
+                if remaining <= 0:
+                    raise InferenceError(f"Inference request to {url} exceeded its {deadline}s deadline: "
+                                         f"{str(last_error)}", status_code=last_status)
+                if isinstance(timeout, tuple):
+                    attempt_timeout = (min(timeout[0], remaining), min(timeout[1], remaining))
+                else:
+                    attempt_timeout = min(timeout, remaining)
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {url} after repeated failures; try again later",
+                                       status_code=last_status)
+            with stage('rate_limit_wait'):
+                self.limiter.acquire()
+
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                response = self.session.post(url, headers=headers, json=payload, timeout=attempt_timeout,
+                                             stream=stream)
+            except requests.exceptions.RequestException as e:
+                metrics.record(None, time.perf_counter() - start, error=True)
+                UPSTREAM_REQUESTS.inc(endpoint=url, status='error')
+                UPSTREAM_SECONDS.observe(time.perf_counter() - start, endpoint=url)
+                breaker.record_failure()
+                last_error = e
+                last_status = None
+                print(f"Request to {url} failed (attempt {attempt + 1}/{attempts}): {str(e)}")
+            else:
+                status = response.status_code
+                last_status = status
+                metrics.record(status, time.perf_counter() - start, error=status >= 400)
+                UPSTREAM_REQUESTS.inc(endpoint=url, status=status)
+                UPSTREAM_SECONDS.observe(time.perf_counter() - start, endpoint=url)
+                # A streamed response holds its pooled connection until it is read or closed;
+                # only a stream handed to the caller stays open
+                streaming = False
+                try:
+                    if status in (401, 403):
+                        # Credentials problems are not the endpoint's fault
+                        breaker.record_success()
+                        raise AuthenticationError(f"Authentication failed for {url} ({status})", status_code=status)
+                    if status not in RETRYABLE_STATUS_CODES:
+                        breaker.record_success()
+                        try:
+                            response.raise_for_status()
+                            if stream:
+                                streaming = True
+                                return iter_stream_tokens(response)
+                            return response.json()
+                        except (requests.exceptions.RequestException, ValueError) as e:
+                            raise InferenceError(f"Inference request to {url} failed: {str(e)}", status_code=status)
+                    breaker.record_failure()
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    last_error = InferenceError(f"{url} returned {status}", status_code=status)
+                    print(f"{url} returned {status} (attempt {attempt + 1}/{attempts})")
+                finally:
+                    if not streaming:
+                        response.close()
+
+            if attempt < attempts - 1:
+                metrics.record_retry()
+                UPSTREAM_RETRIES.inc(endpoint=url)
+                delay = self.backoff_delay(attempt, base_delay)
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, self.max_delay))
+                if ends_at is not None:
+                    delay = min(delay, max(0.0, ends_at - time.monotonic()))
+                if last_status == 429:
+                    # Rate limited: make every thread sharing this client wait too
+                    self.limiter.pause(delay)
+                else:
+                    with stage('retry_backoff'):
+                        time.sleep(delay)
+
+        raise InferenceError(f"Inference request to {url} failed after {attempts} attempts: {str(last_error)}",
+                             status_code=last_status)
+
+    def metrics(self) -> Dict[str, Dict]:
+        """Per-endpoint latency/error metrics and circuit state"""
+        with self._lock:
+            endpoints = list(self._metrics.items())
+        return {url: dict(m.snapshot(), circuit=self._breakers[url].state) for url, m in endpoints}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client(pool_size: int = 4) -> InferenceClient:
+    """Return the process-wide inference client, growing its connection pool if needed"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = InferenceClient(pool_size=pool_size)
+        else:
+            _client.ensure_pool_size(pool_size)
+        return _client
+
+
+def _collect_circuits():
+    """Scrape-time circuit state per endpoint (0 closed, 1 half-open, 2 open)"""
+    if _client is None:
+        return []
+    states = {'closed': 0, 'half-open': 1, 'open': 2}
+    with _client._lock:
+        breakers = list(_client._breakers.items())
+    return [('eduquery_upstream_circuit_state', 'gauge', 'Circuit breaker state per endpoint (0 closed, 1 half-open, 2 open)',
+             [({'endpoint': url}, states[breaker.state]) for url, breaker in breakers])]
+
+
+registry.add_collector(_collect_circuits)
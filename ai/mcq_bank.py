@@ -0,0 +1,265 @@
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# Bumped whenever the saved columns change
+BANK_FORMAT_VERSION = 1
+
+
+class MCQ:
+    """
+    One multiple choice question.
+
+    The correct answer is kept as an index into options, and confidence
+    scores (when present) as a float32 array aligned with options, so
+    duplicate option texts cannot collide. Item access by the dict keys used
+    throughout the app ('question', 'options', 'correct_answer',
+    'confidence_scores') lets an MCQ go wherever those dicts go.
+
+    batch.py workers carry their MCQs as records from the pipeline's output
+    to the JSONL line. The web app's pipeline (generation, parsing, dedup,
+    the result cache) still passes the API's dicts, which it edits in place;
+    from_dict() and to_dict() convert at the edges.
+    """
+
+    __slots__ = ('question', 'options', 'correct_index', 'scores', 'source')
+
+    def __init__(self, question: str, options: Sequence[str], correct_index: int,
+                 scores: Optional[np.ndarray] = None, source: Optional[str] = None):
+        self.question = question
+        self.options = tuple(options)
+        self.correct_index = correct_index
+        self.scores = scores
+        self.source = source
+
+    @property
+    def correct_answer(self) -> Optional[str]:
+        return self.options[self.correct_index] if 0 <= self.correct_index < len(self.options) else None
+
+    @classmethod
+    def from_dict(cls, data: Dict, source: Optional[str] = None) -> 'MCQ':
+        """Build from an MCQ dict, taking per-option scores from its 'confidence_scores' if present"""
+        options = list(data['options'])
+        try:
+            correct_index = options.index(data.get('correct_answer'))
+        except ValueError:
+            correct_index = -1
+        scores = None
+        if data.get('confidence_scores'):
+            by_option = data['confidence_scores']
+            scores = np.array([by_option.get(option, np.nan) for option in options], dtype=np.float32)
+        return cls(data['question'], options, correct_index, scores, source)
+
+    def to_dict(self) -> Dict:
+        """The MCQ dict returned by the API"""
+        data = {'question': self.question, 'options': list(self.options), 'correct_answer': self.correct_answer}
+        if self.scores is not None:
+            data['confidence_scores'] = {option: float(score) for option, score in zip(self.options, self.scores)}
+        return data
+
+    def __getitem__(self, key):
+        if key == 'confidence_scores' and self.scores is not None:
+            return self.to_dict()['confidence_scores']
+        if key not in ('question', 'options', 'correct_answer'):
+            raise KeyError(key)
+        value = getattr(self, key)
+        return list(value) if key == 'options' else value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"MCQ({self.question!r}, {list(self.options)!r}, correct_index={self.correct_index})"
+
+
+def _encode_strings(strings: Iterable[str]):
+    """Pack strings into (int64 offsets, uint8 UTF-8 data)"""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8).copy()
+
+
+def _take_ranges(offsets: np.ndarray, indices: np.ndarray):
+    """
+    Gather the ranges [offsets[i], offsets[i + 1]) for each index into one array of positions.
+
+    Returns:
+        tuple: (new offsets, positions into the original data)
+    """
+    starts = offsets[indices]
+    lengths = offsets[indices + 1] - starts
+    new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1], dtype=np.int64)
+    return new_offsets, positions
+
+
+class MCQBank:
+    """
+    Column-oriented store for large question banks.
+
+    Questions and option texts are packed as UTF-8 byte columns with offset
+    arrays and decoded only when accessed. Per question there is a slice of
+    the option columns, the correct option's index and a source file id; per
+    option there is one float32 confidence score (NaN when unscored), so all
+    scores of a bank are one contiguous array.
+
+    Banks are saved as a single uncompressed .npz file: loading reads each
+    column in one go, with no per-question objects until they are asked for.
+    """
+
+    COLUMNS = ('question_offsets', 'question_data', 'option_offsets', 'option_data',
+               'option_starts', 'correct', 'scores', 'source_ids')
+
+    def __init__(self, question_offsets, question_data, option_offsets, option_data,
+                 option_starts, correct, scores, source_ids, sources: List[str]):
+        self.question_offsets = question_offsets
+        self.question_data = question_data
+        self.option_offsets = option_offsets
+        self.option_data = option_data
+        self.option_starts = option_starts
+        self.correct = correct
+        self.scores = scores
+        self.source_ids = source_ids
+        self.sources = list(sources)
+
+    @classmethod
+    def from_mcqs(cls, mcqs: Iterable, source: Optional[str] = None) -> 'MCQBank':
+        """
+        Build a bank from MCQ records or MCQ dicts.
+
+        Args:
+            mcqs (iterable): MCQ objects, or dicts as returned by the API
+            source (str): Source file for MCQs that don't name their own
+        """
+        records = [mcq if isinstance(mcq, MCQ) else MCQ.from_dict(mcq, source) for mcq in mcqs]
+        sources = list(dict.fromkeys(record.source or source or '' for record in records))
+        source_index = {name: i for i, name in enumerate(sources)}
+
+        question_offsets, question_data = _encode_strings(record.question for record in records)
+        option_offsets, option_data = _encode_strings(option for record in records for option in record.options)
+        option_starts = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum([len(record.options) for record in records], out=option_starts[1:])
+        scores = np.full(option_starts[-1], np.nan, dtype=np.float32)
+        for record, start in zip(records, option_starts):
+            if record.scores is not None:
+                scores[start:start + len(record.options)] = record.scores
+        return cls(question_offsets, question_data, option_offsets, option_data, option_starts,
+                   np.array([record.correct_index for record in records], dtype=np.int16), scores,
+                   np.array([source_index[record.source or source or ''] for record in records], dtype=np.int32),
+                   sources)
+
+    @classmethod
+    def from_jsonl(cls, path) -> 'MCQBank':
+        """Build a bank from the successful records of a batch.py output file (the latest per file)"""
+        latest = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('status') == 'ok':
+                    latest[record['file']] = record['mcqs']
+        return cls.from_mcqs(MCQ.from_dict(mcq, file) for file, mcqs in latest.items() for mcq in mcqs)
+
+    def __len__(self):
+        return len(self.correct)
+
+    def question(self, i: int) -> str:
+        return self.question_data[self.question_offsets[i]:self.question_offsets[i + 1]].tobytes().decode('utf-8')
+
+    def options(self, i: int) -> List[str]:
+        offsets = self.option_offsets
+        return [self.option_data[offsets[j]:offsets[j + 1]].tobytes().decode('utf-8')
+                for j in range(self.option_starts[i], self.option_starts[i + 1])]
+
+    def option_counts(self) -> np.ndarray:
+        return np.diff(self.option_starts)
+
+    def option_scores(self, i: int) -> np.ndarray:
+        return self.scores[self.option_starts[i]:self.option_starts[i + 1]]
+
+    def correct_scores(self) -> np.ndarray:
+        """Confidence score of each question's correct option (NaN when unknown or unscored)"""
+        result = np.full(len(self), np.nan, dtype=np.float32)
+        known = self.correct >= 0
+        result[known] = self.scores[self.option_starts[:-1][known] + self.correct[known]]
+        return result
+
+    def min_option_scores(self) -> np.ndarray:
+        """Lowest option score per question (NaN if any option is unscored)"""
+        result = np.full(len(self), np.nan, dtype=np.float32)
+        nonempty = self.option_counts() > 0
+        if nonempty.any():
+            result[nonempty] = np.minimum.reduceat(self.scores, self.option_starts[:-1][nonempty])
+        return result
+
+    def __getitem__(self, i: int) -> MCQ:
+        scores = self.option_scores(i)
+        return MCQ(self.question(i), self.options(i), int(self.correct[i]),
+                   None if np.isnan(scores).all() else scores.copy(), self.sources[self.source_ids[i]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def select(self, which) -> 'MCQBank':
+        """
+        A new bank with a subset of the questions.
+
+        Args:
+            which: Boolean mask over the questions, or an array of question indices
+        """
+        indices = np.asarray(which)
+        indices = np.flatnonzero(indices) if indices.dtype == bool else indices.astype(np.int64)
+
+        question_offsets, positions = _take_ranges(self.question_offsets, indices)
+        option_starts, option_indices = _take_ranges(self.option_starts, indices)
+        option_offsets, option_positions = _take_ranges(self.option_offsets, option_indices)
+        return MCQBank(question_offsets, self.question_data[positions],
+                       option_offsets, self.option_data[option_positions],
+                       option_starts, self.correct[indices], self.scores[option_indices],
+                       self.source_ids[indices], self.sources)
+
+    def from_source(self, source: str) -> 'MCQBank':
+        """The questions generated from one source file"""
+        if source not in self.sources:
+            return self.select(np.zeros(0, dtype=np.int64))
+        return self.select(self.source_ids == self.sources.index(source))
+
+    def score(self, calculator, questions_per_pass: int = 1024):
+        """Fill in the confidence scores of every question in place with a ConfidenceCalculator"""
+        for start in range(0, len(self), questions_per_pass):
+            indices = range(start, min(len(self), start + questions_per_pass))
+            records = [MCQ(self.question(i), self.options(i), int(self.correct[i])) for i in indices]
+            # Questions whose answer is unknown have no meaningful scores
+            scored = [record for record in records if record.correct_index >= 0]
+            arrays = iter(calculator.calculate_confidence_arrays(scored))
+            for i, record in zip(indices, records):
+                if record.correct_index >= 0:
+                    self.scores[self.option_starts[i]:self.option_starts[i + 1]] = next(arrays)
+        return self
+
+    def save(self, path):
+        """Write the bank to a single uncompressed .npz file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(f, version=np.array([BANK_FORMAT_VERSION]),
+                     sources=np.array(self.sources, dtype=str),
+                     **{column: getattr(self, column) for column in self.COLUMNS})
+
+    @classmethod
+    def load(cls, path) -> 'MCQBank':
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['version'][0])
+            if version != BANK_FORMAT_VERSION:
+                raise ValueError(f"{path} is MCQ bank format {version}; expected {BANK_FORMAT_VERSION}")
+            return cls(*(data[column] for column in cls.COLUMNS), sources=data['sources'].tolist())
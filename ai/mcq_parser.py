@@ -0,0 +1,190 @@
+import json
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from metrics import registry
+
+PARSED = registry.counter('eduquery_mcq_parse_total',
+                          'Question objects found in model output, by outcome (ok or rejected)', ('outcome',))
+
+# Characters that change the scanner's state; everything between them is skipped in one step
+_SPECIAL = re.compile(r'[{}"\\\n]')
+# A trailing comma before a closing bracket, the most common way gpt2 breaks its JSON
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+# "B", "b)", "(C)", "D. Paris", "A:" - a single option letter, optionally followed by the option
+_ANSWER_LETTER = re.compile(r'^\(?([A-Za-z])(?:[.):]|\s|$)')
+_ANSWER_PREFIX = re.compile(r'^(?:option|answer|correct answer)\s*(?:is\s*)?[:\-]?\s*', re.IGNORECASE)
+# "A. ", "b) ", "(C) " label in front of an option's text
+_OPTION_LABEL = re.compile(r'^\(?[A-Za-z][.):]\s*')
+# Template filler like "..." (the prompt's own example, when the API echoes it back)
+_PLACEHOLDER = re.compile(r'^[\s.…]*$')
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.lower().split()).rstrip('.')
+
+
+def resolve_answer(answer, options: List[str]) -> Optional[str]:
+    """
+    The option an MCQ's answer field refers to.
+
+    The answer may be a letter ("B", "b)", "Option C"), a letter followed by
+    the option's text, or the option's text alone.
+
+    Returns:
+        str: The matching entry of options, or None if it matches none of them
+    """
+    if not isinstance(answer, str):
+        return None
+    text = _ANSWER_PREFIX.sub('', answer.strip())
+    match = _ANSWER_LETTER.match(text)
+    if match:
+        index = ord(match.group(1).upper()) - ord('A')
+        if 0 <= index < len(options):
+            return options[index]
+    wanted = _normalize(_OPTION_LABEL.sub('', text))
+    for option in options:
+        if _normalize(_OPTION_LABEL.sub('', option)) == wanted:
+            return option
+    return None
+
+
+def to_mcq(data: Dict) -> Optional[Dict]:
+    """
+    Convert one decoded question object into the frontend's MCQ format.
+
+    Returns None for an object that is not a usable MCQ: a placeholder or
+    empty question, fewer than two real options, or an answer that names
+    none of the options.
+    """
+    question = data.get('question')
+    options = data.get('options', data.get('choices'))
+    if isinstance(options, dict):
+        options = list(options.values())
+    if not isinstance(question, str) or _PLACEHOLDER.match(question) or not isinstance(options, list):
+        return None
+    if len(options) < 2 or not all(isinstance(option, str) and not _PLACEHOLDER.match(_OPTION_LABEL.sub('', option))
+                                   for option in options):
+        return None
+    options = [option.strip() for option in options]
+    correct_answer = resolve_answer(data.get('answer', data.get('correct_answer')), options)
+    if correct_answer is None:
+        return None
+    return {'question': question.strip(), 'options': options, 'correct_answer': correct_answer}
+
+
+def _decode(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r'\1', text))
+    except ValueError:
+        return None
+
+
+class MCQStreamParser:
+    """
+    Incremental, tolerant extractor of MCQs from generated text.
+
+    Text is fed in pieces (a whole response, or tokens as they stream in) and
+    scanned once. Every {...} object is decoded on its own as soon as its
+    closing brace arrives, so one malformed question costs only that
+    question, and prose or an echoed prompt around the JSON is skipped over.
+    An object holding a question is taken whole (so its options may be a
+    nested object); an object around questions already taken, like a
+    {"questions": [...]} wrapper, is not decoded again.
+    A newline inside a string means the quote that opened it was stray (JSON
+    strings cannot span lines), so the scanner recovers at the next line.
+    """
+
+    def __init__(self):
+        self.ok = 0
+        self.rejected = 0
+        self._buffer = ''
+        self._pos = 0
+        self._in_string = False
+        # [start offset, contains a question object] per currently open brace
+        self._open = []
+
+    def feed(self, text: str) -> List[Dict]:
+        """Scan more text; returns the MCQs completed by it"""
+        mcqs = []
+        buffer = self._buffer + text
+        pos = self._pos
+        while True:
+            match = _SPECIAL.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+            char = match.group()
+            index = match.start()
+            pos = index + 1
+            if self._in_string:
+                if char == '\\':
+                    if index + 1 == len(buffer):
+                        # Wait for the escaped character
+                        pos = index
+                        break
+                    pos = index + 2
+                elif char in '"\n':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = bool(self._open)
+            elif char == '{':
+                self._open.append([index, False])
+            elif char == '}' and self._open:
+                start, holds_question = self._open.pop()
+                if not holds_question:
+                    holds_question, mcq = self._parse(buffer[start:index + 1])
+                    if mcq is not None:
+                        mcqs.append(mcq)
+                if holds_question and self._open:
+                    self._open[-1][1] = True
+
+        if not self._open:
+            # Nothing before pos can be part of an object any more
+            buffer = buffer[pos:]
+            pos = 0
+        self._buffer = buffer
+        self._pos = pos
+        return mcqs
+
+    def _parse(self, text: str):
+        """
+        Decode one object.
+
+        Returns:
+            tuple: (whether it was a question, the MCQ or None)
+        """
+        data = _decode(text)
+        if data is None:
+            # Only count broken objects that were meant to be questions
+            if '"question"' in text:
+                self.rejected += 1
+                PARSED.inc(outcome='rejected')
+                return True, None
+            return False, None
+        if not isinstance(data, dict) or 'question' not in data:
+            return False, None
+        mcq = to_mcq(data)
+        if mcq is None:
+            self.rejected += 1
+            PARSED.inc(outcome='rejected')
+        else:
+            self.ok += 1
+            PARSED.inc(outcome='ok')
+        return True, mcq
+
+
+def iter_mcqs(pieces: Iterable[str]) -> Iterator[Dict]:
+    """Yield MCQs from a stream of text pieces as soon as each one is complete"""
+    parser = MCQStreamParser()
+    for piece in pieces:
+        yield from parser.feed(piece)
+
+
+def parse_mcqs(text: str) -> List[Dict]:
+    """All MCQs that can be salvaged from a complete model output"""
+    return MCQStreamParser().feed(text)
@@ -0,0 +1,148 @@
+import gc
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Sentence-embedding model used for confidence scoring
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Name of the transformers Auto class used when a caller gives none
+DEFAULT_MODEL_CLASS = "AutoModel"
+
+
+def _class_name(model_class) -> str:
+    return model_class.__name__ if model_class is not None else DEFAULT_MODEL_CLASS
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process (falls back to peak RSS off Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        if resource is None:
+            return 0
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def variant_name(name: str, quantize: bool) -> str:
+    """Name that distinguishes the int8 variant when keying derived data such as embeddings"""
+    return f"{name}:int8" if quantize else name
+
+
+class LoadedModel:
+    """A tokenizer/model pair plus the cost of loading it"""
+
+    def __init__(self, name: str, tokenizer, model, quantized: bool, load_seconds: float, rss_delta_bytes: int):
+        self.name = name
+        self.tokenizer = tokenizer
+        self.model = model
+        self.quantized = quantized
+        self.load_seconds = load_seconds
+        self.rss_delta_bytes = rss_delta_bytes
+        self.parameter_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+
+    @property
+    def cache_name(self) -> str:
+        return variant_name(self.name, self.quantized)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'load_seconds': self.load_seconds,
+            'rss_delta_bytes': self.rss_delta_bytes,
+            'parameter_bytes': self.parameter_bytes,
+            'quantized': self.quantized,
+        }
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of Hugging Face models.
+
+    Models are loaded on first use and shared by every caller in the process.
+    Calling preload() in a parent process before forking (e.g. gunicorn with
+    preload_app) lets all workers share the weights copy-on-write. torch and
+    transformers are only imported by the first load, so importing this
+    module (or reading its stats) stays cheap.
+    """
+
+    def __init__(self):
+        self._models: Dict[tuple, LoadedModel] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str = DEFAULT_EMBEDDING_MODEL, quantize: bool = False, model_class=None) -> LoadedModel:
+        """
+        Return the loaded model, loading it on first use.
+
+        Args:
+            name (str): Hugging Face model name or local path
+            quantize (bool): Load the dynamically int8-quantized CPU variant
+            model_class: transformers Auto class to load with (defaults to AutoModel)
+        """
+        key = (name, quantize, _class_name(model_class))
+        loaded = self._models.get(key)
+        if loaded is not None:
+            return loaded
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            loaded = self._models.get(key)
+            if loaded is None:
+                loaded = self._load(name, quantize, model_class)
+                self._models[key] = loaded
+            return loaded
+
+    def _load(self, name: str, quantize: bool, model_class) -> LoadedModel:
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        model_class = model_class or AutoModel
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        tokenizer = AutoTokenizer.from_pretrained(name)
+        model = model_class.from_pretrained(name)
+        model.eval()
+        if quantize:
+            # Dynamic int8 quantization of the Linear layers; CPU-only
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        load_seconds = time.perf_counter() - start
+        rss_delta = max(0, current_rss_bytes() - rss_before)
+        print(f"Loaded {name}{' (int8)' if quantize else ''} in {load_seconds:.2f}s, "
+              f"+{rss_delta / (1024 * 1024):.1f} MiB RSS")
+        return LoadedModel(name, tokenizer, model, quantize, load_seconds, rss_delta)
+
+    def preload(self, names: Optional[Iterable[str]] = None, quantize: bool = False, model_class=None):
+        """
+        Load models ahead of time, typically in a parent process before fork.
+
+        Args:
+            names (iterable): Model names to load (defaults to the embedding model)
+            quantize (bool): Load the dynamically int8-quantized CPU variant
+            model_class: transformers Auto class to load with (defaults to AutoModel)
+        """
+        for name in names or [DEFAULT_EMBEDDING_MODEL]:
+            self.get(name, quantize=quantize, model_class=model_class)
+        # Move everything allocated so far out of the GC's tracked generations so
+        # collections in forked workers don't touch (and copy) the shared pages
+        gc.collect()
+        gc.freeze()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Load time and resident memory per loaded model"""
+        return {loaded.cache_name: loaded.stats() for loaded in self._models.values()}
+
+
+# Shared registry for the whole process
+registry = ModelRegistry()
+
+
+def preload_models(names: Optional[Iterable[str]] = None, quantize: bool = False, model_class=None):
+    registry.preload(names, quantize=quantize, model_class=model_class)
@@ -1,11 +1,91 @@
-import fitz  # PyMuPDF
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# PyMuPDF (fitz) is imported by the functions that open a PDF, so importing
+# this module costs nothing until a PDF is actually read
+
+# Documents with at least this many pages are sharded across processes in auto mode
+PARALLEL_PAGE_THRESHOLD = 50
+
+
+def _page_bounds(page_count, first_page, last_page):
+    """Convert a 1-based inclusive page range into 0-based [start, stop) bounds"""
+    start = max(1, first_page) - 1
+    stop = page_count if last_page is None else min(page_count, last_page)
+    return start, stop
+
+
+def _extract_page_range(pdf_path, start, stop):
+    """Extract pages [start, stop) in a worker process. Returns [(page_number, text)]."""
+    import fitz
 
-def extract_text_from_pdf(pdf_path):
-    text = ""
     with fitz.open(pdf_path) as doc:
-        for page in doc:
-            text += page.get_text("text") + "\n"
-    return text.strip()
+        return [(i + 1, doc[i].get_text("text")) for i in range(start, stop)]
+
+
+def get_page_count(pdf_path):
+    """Number of pages in a PDF"""
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def iter_pdf_pages(pdf_path, first_page=1, last_page=None, processes=1):
+    """
+    Yield the text of each page of a PDF as soon as it is extracted.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        first_page (int): First page to extract (1-based, inclusive)
+        last_page (int): Last page to extract (1-based, inclusive); None for the end
+        processes (int): Worker processes to shard page ranges across. 1 extracts
+            in this process; None picks one per core for documents of at least
+            PARALLEL_PAGE_THRESHOLD pages and extracts smaller ones serially
+
+    Yields:
+        tuple: (page_number, text), in page order
+    """
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        start, stop = _page_bounds(doc.page_count, first_page, last_page)
+        n_pages = max(0, stop - start)
+        if processes is None:
+            processes = (os.cpu_count() or 1) if n_pages >= PARALLEL_PAGE_THRESHOLD else 1
+        if processes <= 1 or n_pages < 2:
+            for i in range(start, stop):
+                yield i + 1, doc[i].get_text("text")
+            return
+
+    # Several shards per worker keeps the pool balanced and lets the first
+    # pages stream out before the whole document is done
+    shard_size = max(1, -(-n_pages // (processes * 4)))
+    shards = [(s, min(s + shard_size, stop)) for s in range(start, stop, shard_size)]
+    with ProcessPoolExecutor(max_workers=min(processes, len(shards))) as executor:
+        # map() returns shards in order even though they complete out of order
+        for pages in executor.map(_extract_page_range,
+                                  [pdf_path] * len(shards),
+                                  [s for s, _ in shards],
+                                  [e for _, e in shards]):
+            yield from pages
+
+
+def extract_text_from_pdf(pdf_path, first_page=1, last_page=None, processes=1):
+    """
+    Extract the text of a PDF (or a page range of it) as one string.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        first_page (int): First page to extract (1-based, inclusive)
+        last_page (int): Last page to extract (1-based, inclusive); None for the end
+        processes (int): See iter_pdf_pages
+
+    Returns:
+        str: Page texts separated by newlines
+    """
+    pages = iter_pdf_pages(pdf_path, first_page=first_page, last_page=last_page, processes=processes)
+    return "".join(text + "\n" for _, text in pages).strip()
 
 # Example Usage
 if __name__ == "__main__":
@@ -0,0 +1,300 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from pathlib import Path
+
+from inference_client import AuthenticationError, InferenceError, get_client
+from metrics import propagate, stage
+
+# Get the absolute path to the backend directory
+BACKEND_DIR = Path(__file__).parent.parent / 'backend'
+
+# Load API Key from the correct .env file location
+load_dotenv(BACKEND_DIR / '.env')
+TOKEN = os.getenv("HUGGINGFACE_API_KEY")
+
+# Using specialized models for question and answer generation
+QUESTION_MODEL_NAME = "valhalla/t5-base-qg-hl"
+ANSWER_MODEL_NAME = "valhalla/t5-base-qa-qg-hl"
+QUESTION_API_URL = f"https://api-inference.huggingface.co/models/{QUESTION_MODEL_NAME}"
+ANSWER_API_URL = f"https://api-inference.huggingface.co/models/{ANSWER_MODEL_NAME}"
+
+# Number of segments processed concurrently (each runs its own question -> answer chain)
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+
+NO_ANSWER = "No answer generated - Please try again later"
+
+# Decoding settings for regenerating a rejected question, so the retry gives different output
+SAMPLING_PARAMETERS = {"do_sample": True, "top_p": 0.95, "temperature": 0.9}
+
+
+def build_question_prompt(context):
+    return f"generate question: <hl> {context} <hl>\nGenerate a clear and specific question about the main concept in this text."
+
+
+def build_answer_prompt(question, context):
+    return f"answer: question: {question} context: {context}"
+
+
+def _extract_question(result):
+    """Pick the first generated text that looks like a question"""
+    if isinstance(result, list) and result:
+        for item in result:
+            if isinstance(item, str) and '?' in item:
+                return item.strip()
+            elif isinstance(item, dict) and 'generated_text' in item:
+                generated = item['generated_text'].strip()
+                if '?' in generated:
+                    return generated
+    elif isinstance(result, dict) and 'generated_text' in result:
+        generated = result['generated_text'].strip()
+        if '?' in generated:
+            return generated
+    return None
+
+
+class RemoteBackend:
+    """
+    Question/answer generation through the hosted Hugging Face inference API.
+
+    Each segment chains its question and answer requests; segments run
+    concurrently through the shared inference client.
+    """
+
+    name = 'remote'
+
+    def __init__(self,
+                 token=None,
+                 question_url=None,
+                 answer_url=None,
+                 max_retries=3,
+                 retry_delay=2,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.token = token or TOKEN
+        self.question_url = question_url or QUESTION_API_URL
+        self.answer_url = answer_url or ANSWER_API_URL
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_concurrency = max(1, max_concurrency)
+
+    def validate(self):
+        # Verify API key is set
+        if not self.token:
+            raise Exception(f"Hugging Face API key not found. Please check your .env file at {BACKEND_DIR / '.env'}")
+
+    def _generate_question(self, client, headers, context, sample=False):
+        """Generate a question for one segment. Returns the question or None."""
+        question_payload = {
+            "inputs": build_question_prompt(context),
+            "wait_for_model": True
+        }
+        if sample:
+            question_payload["parameters"] = SAMPLING_PARAMETERS
+
+        try:
+            with stage('question_generation'):
+                result = client.post(self.question_url, question_payload, headers=headers, timeout=30,
+                                     max_retries=self.max_retries, base_delay=self.retry_delay)
+        except AuthenticationError as e:
+            if e.status_code == 403:
+                raise Exception("Access denied. You may not have access to this model. Please check your Hugging Face account permissions.")
+            raise Exception("Invalid Hugging Face API key. Please check your API key in the .env file.")
+        return _extract_question(result)
+
+    def _generate_answer(self, client, headers, question, context):
+        """
+        Generate an answer for a question about one segment.
+
+        The answer is not judged here: decoding is deterministic, so asking again
+        gives the same answer. Poor pairs are left to the quality gate.
+        """
+        answer_payload = {
+            "inputs": build_answer_prompt(question, context),
+            "wait_for_model": True,
+            "options": {"wait_for_model": True}
+        }
+
+        try:
+            # Rate limiting and 429/503 backoff are handled by the inference client
+            with stage('answer_generation'):
+                answer_result = client.post(self.answer_url, answer_payload, headers=headers, timeout=30,
+                                            max_retries=self.max_retries, base_delay=self.retry_delay)
+        except InferenceError as e:
+            print(f"Answer generation failed: {str(e)}")
+            return NO_ANSWER
+
+        answer = None
+        if isinstance(answer_result, list) and answer_result:
+            answer = answer_result[0].get('generated_text', '').strip()
+        elif isinstance(answer_result, dict):
+            answer = answer_result.get('generated_text', '').strip()
+        return answer or NO_ANSWER
+
+    def _process_segment(self, client, headers, context, sample=False):
+        """
+        Run the question -> answer chain for one segment.
+
+        Returns:
+            tuple: (question, answer, error); question is None if none was generated
+        """
+        try:
+            question = self._generate_question(client, headers, context, sample)
+        except Exception as e:
+            return None, None, e
+        if not question:
+            return None, None, None
+        answer = self._generate_answer(client, headers, question, context)
+        return question, answer, None
+
+    def iter_question_answers(self, contexts, sample=False):
+        """
+        Generate a question and answer per context.
+
+        Args:
+            contexts (list): Text segments
+            sample (bool): Sample the question instead of decoding greedily (for regeneration)
+
+        Yields:
+            tuple: (index, question, answer, error) in completion order
+        """
+        headers = {"Authorization": f"Bearer {self.token}"}
+        client = get_client(self.max_concurrency)
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        process_segment = propagate(self._process_segment)
+        try:
+            futures = {
+                executor.submit(process_segment, client, headers, context, sample): index
+                for index, context in enumerate(contexts)
+            }
+            for future in as_completed(futures):
+                question, answer, error = future.result()
+                yield (futures[future], question, answer, error)
+        finally:
+            # Don't start segments nobody will consume if the caller stops early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LocalBackend:
+    """
+    Question/answer generation with the T5 models running in this process.
+
+    Both models are loaded once through the shared model registry. Prompts are
+    sorted by token length and run through generate() in padded batches, so
+    similar-length prompts share a batch and little compute goes to padding.
+    """
+
+    name = 'local'
+
+    def __init__(self,
+                 question_model=QUESTION_MODEL_NAME,
+                 answer_model=ANSWER_MODEL_NAME,
+                 batch_size=int(os.getenv("LOCAL_QG_BATCH_SIZE", "16")),
+                 max_input_tokens=512,
+                 max_new_tokens=64,
+                 quantize=False):
+        self.question_model = question_model
+        self.answer_model = answer_model
+        self.batch_size = max(1, batch_size)
+        self.max_input_tokens = max_input_tokens
+        self.max_new_tokens = max_new_tokens
+        self.quantize = quantize
+
+    def validate(self):
+        pass
+
+    def _loaded(self, model_name):
+        # Deferred so the remote backend works without torch installed
+        from transformers import AutoModelForSeq2SeqLM
+        from model_registry import registry
+
+        return registry.get(model_name, quantize=self.quantize, model_class=AutoModelForSeq2SeqLM)
+
+    def load(self):
+        """Load both models now (e.g. while the service warms up) instead of on the first request"""
+        for model_name in (self.question_model, self.answer_model):
+            self._loaded(model_name)
+
+    def _generate(self, model_name, prompts, sample=False):
+        """Run prompts through a seq2seq model in length-bucketed batches, preserving order"""
+        import torch
+
+        loaded = self._loaded(model_name)
+        tokenizer = loaded.tokenizer
+        lengths = [len(ids) for ids in tokenizer(prompts, truncation=True, max_length=self.max_input_tokens)['input_ids']]
+        order = sorted(range(len(prompts)), key=lengths.__getitem__)
+
+        outputs = [None] * len(prompts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = tokenizer([prompts[i] for i in batch], padding=True, truncation=True,
+                                max_length=self.max_input_tokens, return_tensors='pt')
+            with torch.inference_mode():
+                generated = loaded.model.generate(input_ids=encoded['input_ids'],
+                                                  attention_mask=encoded['attention_mask'],
+                                                  max_new_tokens=self.max_new_tokens, num_beams=1,
+                                                  **(SAMPLING_PARAMETERS if sample else {}))
+            for i, text in zip(batch, tokenizer.batch_decode(generated, skip_special_tokens=True)):
+                outputs[i] = text.strip()
+        return outputs
+
+    def generate_questions(self, contexts, sample=False):
+        """Generate one question per context (None where the output is not a question)"""
+        generated = self._generate(self.question_model, [build_question_prompt(c) for c in contexts], sample)
+        return [text if '?' in text else None for text in generated]
+
+    def generate_answers(self, questions, contexts):
+        generated = self._generate(self.answer_model,
+                                   [build_answer_prompt(q, c) for q, c in zip(questions, contexts)])
+        # Decoding is greedy, so retrying an empty answer would give the same output
+        return [text or NO_ANSWER for text in generated]
+
+    def iter_question_answers(self, contexts, sample=False):
+        """
+        Generate a question and answer per context.
+
+        Contexts are processed in windows of a few batches so results stream out
+        while later windows are still being generated. With sample, questions
+        are sampled instead of decoded greedily (for regeneration).
+
+        Yields:
+            tuple: (index, question, answer, error) in index order
+        """
+        window = self.batch_size * 4
+        for start in range(0, len(contexts), window):
+            window_contexts = contexts[start:start + window]
+            try:
+                with stage('question_generation'):
+                    questions = self.generate_questions(window_contexts, sample)
+                asked = [i for i, q in enumerate(questions) if q]
+                with stage('answer_generation'):
+                    answers = self.generate_answers([questions[i] for i in asked], [window_contexts[i] for i in asked])
+            except Exception as e:
+                for i in range(len(window_contexts)):
+                    yield (start + i, None, None, e)
+                continue
+            answer_by_index = dict(zip(asked, answers))
+            for i, question in enumerate(questions):
+                yield (start + i, question, answer_by_index.get(i), None)
+
+
+_local_backend = None
+
+
+def get_backend(name=None, max_retries=3, retry_delay=2, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Return the question-generation backend to use.
+
+    Args:
+        name (str): 'remote' (hosted API) or 'local' (in-process T5); defaults to
+            the QG_BACKEND environment variable, then 'remote'
+    """
+    global _local_backend
+    name = (name or os.getenv("QG_BACKEND", "remote")).lower()
+    if name == 'remote':
+        return RemoteBackend(max_retries=max_retries, retry_delay=retry_delay, max_concurrency=max_concurrency)
+    if name == 'local':
+        # One instance per process; the models themselves live in the registry
+        if _local_backend is None:
+            _local_backend = LocalBackend()
+        return _local_backend
+    raise Exception(f"Unknown question generation backend '{name}'. Use remote or local.")
@@ -0,0 +1,242 @@
+import math
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from dedup import cluster_by_similarity, select_representatives
+from metrics import registry, stage
+from qg_backends import NO_ANSWER
+
+REJECTED = registry.counter('eduquery_quality_rejected_total', 'Generated questions rejected by the quality gate',
+                            ('reason',))
+REGENERATED = registry.counter('eduquery_quality_regenerated_total',
+                               'Segments regenerated after their question was rejected')
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Too common to say anything about whether an answer comes from the context
+STOPWORDS = frozenset('''
+a an the of to in on at by for with from and or but is are was were be been being it its this that these those
+as into than then so such not no do does did has have had he she they them his her their we you i what which who
+whom whose when where why how
+'''.split())
+
+
+def _content_words(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+# Question/answer embedding similarity below which the answer has nothing to do with the question
+DEFAULT_MIN_RELEVANCE = 0.15
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    """A float from the environment; unset means default, 'off' means None"""
+    value = os.getenv(name, '').strip()
+    if value.lower() in ('off', 'none'):
+        return None
+    return float(value) if value else default
+
+
+class QualityGate:
+    """
+    Filters generated question/answer pairs for one document, cheapest checks first.
+
+    check() runs string-level tests that cost nothing next to an inference
+    call: question shape and length, an answer that is present and short,
+    answerability (the answer's words must come from the context), and exact
+    duplicates of questions already accepted. Pairs that fail are candidates
+    for regeneration, which the caller may do for at most budget segments of
+    the document. filter_scored() then runs the embedding-based checks on the
+    survivors only: question/answer relevance (on by default) and, with a
+    dedupe threshold, paraphrased duplicates.
+    Every rejection is counted by reason.
+    """
+
+    def __init__(self,
+                 min_question_words: int = 3,
+                 max_question_words: int = 40,
+                 max_answer_words: int = 30,
+                 min_answer_overlap: float = 0.5,
+                 min_relevance: Optional[float] = DEFAULT_MIN_RELEVANCE,
+                 dedupe_threshold: Optional[float] = None,
+                 regeneration_budget: float = 0.25):
+        """
+        Args:
+            min_question_words / max_question_words (int): Accepted question length
+            max_answer_words (int): Longer answers are rambling, not extracted
+            min_answer_overlap (float): Fraction of the answer's content words that must occur in the context
+            min_relevance (float): Minimum question/answer embedding similarity (None skips the check)
+            dedupe_threshold (float): Similarity at which questions are paraphrases (None skips the check)
+            regeneration_budget (float): Fraction of the document's segments that may be regenerated
+        """
+        self.min_question_words = min_question_words
+        self.max_question_words = max_question_words
+        self.max_answer_words = max_answer_words
+        self.min_answer_overlap = min_answer_overlap
+        self.min_relevance = min_relevance
+        self.dedupe_threshold = dedupe_threshold
+        self.regeneration_budget = regeneration_budget
+        self.accepted = 0
+        self.regenerated = 0
+        self.rejected: Dict[str, int] = {}
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, dedupe_threshold: Optional[float] = None) -> 'QualityGate':
+        """A gate configured from the QG_* environment variables"""
+        return cls(min_answer_overlap=_env_float('QG_MIN_ANSWER_OVERLAP', 0.5),
+                   min_relevance=_env_float('QG_MIN_RELEVANCE', DEFAULT_MIN_RELEVANCE),
+                   dedupe_threshold=dedupe_threshold,
+                   regeneration_budget=_env_float('QG_REGENERATION_BUDGET', 0.25))
+
+    def _reject(self, reason: str) -> str:
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        REJECTED.inc(reason=reason)
+        return reason
+
+    def check(self, question: Optional[str], answer: Optional[str], context: str) -> Optional[str]:
+        """
+        Run the cheap checks on one pair.
+
+        Returns:
+            str: The reason the pair was rejected, or None if it passed (and
+            is now remembered for the duplicate check)
+        """
+        if not question or '?' not in question:
+            return self._reject('not_a_question')
+        question_words = len(question.split())
+        if not self.min_question_words <= question_words <= self.max_question_words:
+            return self._reject('question_length')
+        if not answer or answer == NO_ANSWER:
+            return self._reject('no_answer')
+        if len(answer.split()) > self.max_answer_words:
+            return self._reject('answer_length')
+
+        answer_words = _content_words(answer)
+        if answer_words:
+            context_words = set(_content_words(context))
+            found = sum(word in context_words for word in answer_words)
+            if found / len(answer_words) < self.min_answer_overlap:
+                return self._reject('unanswerable')
+            if set(answer_words) <= set(_content_words(question)):
+                # The question gives its own answer away
+                return self._reject('answer_in_question')
+
+        key = ' '.join(_WORD.findall(question.lower()))
+        with self._lock:
+            if key in self._seen:
+                duplicate = True
+            else:
+                duplicate = False
+                self._seen.add(key)
+                self.accepted += 1
+        if duplicate:
+            return self._reject('duplicate')
+        return None
+
+    def budget_for(self, n_segments: int) -> int:
+        """Segments of an n_segments document that may be regenerated"""
+        # Rounded up, so short documents (the common upload) still get a retry
+        return math.ceil(n_segments * self.regeneration_budget)
+
+    def record_regenerated(self, count: int):
+        with self._lock:
+            self.regenerated += count
+        REGENERATED.inc(count)
+
+    def filter_scored(self, questions: List[str], answers: List[str], calculator) -> List[int]:
+        """
+        Run the embedding-based checks on pairs that passed check().
+
+        Questions and answers are embedded in one batched call; pairs whose
+        question and answer are unrelated are dropped, then of each cluster
+        of paraphrased questions the pair with the most related answer is kept.
+
+        Returns:
+            list: Indices of the pairs to keep, in order
+        """
+        keep = list(range(len(questions)))
+        if not questions or not self.scores:
+            return keep
+        with stage('quality_scoring'):
+            embeddings = calculator._embed_texts(list(questions) + list(answers)).numpy()
+            question_embeddings = embeddings[:len(questions)]
+            relevance = np.einsum('ij,ij->i', question_embeddings, embeddings[len(questions):])
+
+            if self.min_relevance is not None:
+                relevant = [i for i in keep if relevance[i] >= self.min_relevance]
+                for _ in range(len(keep) - len(relevant)):
+                    self._reject('low_relevance')
+                keep = relevant
+            if self.dedupe_threshold is not None and len(keep) > 1:
+                labels = cluster_by_similarity(question_embeddings[keep], self.dedupe_threshold)
+                representatives = select_representatives(labels, relevance[keep])
+                for _ in range(len(keep) - len(representatives)):
+                    self._reject('near_duplicate')
+                keep = [keep[i] for i in representatives]
+        with self._lock:
+            self.accepted -= len(questions) - len(keep)
+        return keep
+
+    @property
+    def scores(self) -> bool:
+        """Whether filter_scored() has any check to run"""
+        return self.min_relevance is not None or self.dedupe_threshold is not None
+
+    def filter_pairs(self, questions: List[str], answers: List[str]) -> List[int]:
+        """
+        filter_scored() with the shared scoring model.
+
+        If the model cannot be loaded, every pair is kept: the cheap checks
+        have already run, and generation should not fail over the gate.
+        """
+        if not questions or not self.scores:
+            return list(range(len(questions)))
+        try:
+            from confidence_calculator import ConfidenceCalculator
+            return self.filter_scored(questions, answers, ConfidenceCalculator())
+        except Exception as e:
+            print(f"Quality gate embedding checks skipped: {str(e)}")
+            return list(range(len(questions)))
+
+    def report(self) -> Dict:
+        """Accepted pairs, rejects per reason and regenerated segments so far"""
+        with self._lock:
+            return {'accepted': self.accepted, 'rejected': dict(self.rejected), 'regenerated': self.regenerated}
+
+
+def iter_gated(backend, contexts: List[str], gate: QualityGate):
+    """
+    Generate a question and answer per context through the cheap quality checks.
+
+    Contexts whose pair is rejected are generated again (with sampling, so the
+    output differs) once each, for as many as the gate's budget allows.
+
+    Yields:
+        tuple: (index, question, answer, error) for accepted pairs, plus
+        (index, None, None, error) for failed contexts, in completion order
+    """
+    rejected = []
+    for index, question, answer, error in backend.iter_question_answers(contexts):
+        if error is not None:
+            yield index, None, None, error
+        elif gate.check(question, answer, contexts[index]) is None:
+            yield index, question, answer, None
+        else:
+            rejected.append(index)
+
+    retry = sorted(rejected)[:gate.budget_for(len(contexts))]
+    if not retry:
+        return
+    gate.record_regenerated(len(retry))
+    for position, question, answer, error in backend.iter_question_answers([contexts[i] for i in retry], sample=True):
+        index = retry[position]
+        if error is not None:
+            yield index, None, None, error
+        elif gate.check(question, answer, contexts[index]) is None:
+            yield index, question, answer, None
@@ -0,0 +1,224 @@
+import re
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+# Words that end in a period without ending the sentence (compared lowercased)
+ABBREVIATIONS = frozenset([
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'mt', 'vs', 'etc', 'al',
+    'e.g', 'i.e', 'cf', 'viz', 'approx', 'eds', 'dept', 'univ', 'inc',
+    'ltd', 'corp', 'u.s', 'u.k', 'ph.d', 'm.sc', 'b.sc', 'b.tech', 'm.tech',
+])
+# Abbreviations that are also ordinary words ("no", "sec", "mar") or single
+# letters; these only count when a number follows, as in "No. 5" or "p. 12"
+NUMBER_ABBREVIATIONS = frozenset([
+    'no', 'nos', 'p', 'pp', 'fig', 'figs', 'eq', 'eqs', 'vol', 'vols', 'ch', 'sec',
+    'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+])
+# Capitalized words that start sentences far more often than they follow an
+# initial, so "Plan B. The next" splits while "J. Smith" does not
+SENTENCE_STARTERS = frozenset([
+    'a', 'an', 'the', 'this', 'that', 'these', 'those', 'it', 'its', 'he', 'she', 'they', 'we', 'you', 'i',
+    'in', 'on', 'at', 'by', 'for', 'from', 'to', 'of', 'with', 'as', 'after', 'before', 'when', 'while',
+    'if', 'but', 'and', 'or', 'so', 'then', 'there', 'here', 'however', 'thus', 'also', 'each', 'all',
+    'some', 'many', 'most', 'no', 'not', 'one', 'what', 'which', 'who', 'why', 'how', 'his', 'her', 'their',
+    'our', 'my', 'your', 'is', 'are', 'was', 'were',
+])
+
+# Candidate boundaries: terminal punctuation followed by whitespace or the end of
+# the chunk (so decimals like 3.14 and names like www.example.com never split)
+_BOUNDARY = re.compile(r'[.!?;]+["\')\]]*(?=\s|$)')
+_LAST_WORD = re.compile(r'(\S+)$')
+_NEXT_WORD = re.compile(r'\s+(\S+)')
+_INITIAL = re.compile(r'^[A-Z]\.$')
+
+MIN_SEGMENT_CHARS = 20
+MIN_SEGMENT_WORDS = 4
+MIN_ALPHA_RATIO = 0.5
+# An unterminated run longer than this is emitted rather than carried to the next chunk
+MAX_CARRY_CHARS = 4000
+
+
+def _is_abbreviation(text: str, boundary_start: int) -> bool:
+    """True if the period at boundary_start ends an abbreviation or an initial"""
+    if text[boundary_start] != '.':
+        return False
+    # Only look back a bounded distance, keeping the whole scan linear
+    match = _LAST_WORD.search(text, max(0, boundary_start - 16), boundary_start)
+    if not match:
+        return False
+    word = match.group(1).lstrip('("[\'')
+    lowered = word.lower()
+    if lowered in ABBREVIATIONS:
+        return True
+    single_capital = len(word) == 1 and word.isalpha() and word.isupper()
+    if not single_capital and lowered not in NUMBER_ABBREVIATIONS:
+        return False
+    following = _NEXT_WORD.match(text, boundary_start + 1, boundary_start + 40)
+    if not following:
+        return False
+    next_word = following.group(1)
+    if lowered in NUMBER_ABBREVIATIONS and next_word[0].isdigit():
+        return True
+    if single_capital:
+        # An initial such as the "J." in "J. K. Rowling": followed by another
+        # initial or by a capitalized name rather than a new sentence
+        return bool(_INITIAL.match(next_word)) or (
+            next_word[0].isupper() and next_word.strip('.,;:!?"\')').lower() not in SENTENCE_STARTERS)
+    return False
+
+
+def _keep(segment: str, words: List[str]) -> bool:
+    """Length, word-count and alphabetic-ratio filter for question generation"""
+    if len(segment) < MIN_SEGMENT_CHARS or len(words) < MIN_SEGMENT_WORDS:
+        return False
+    alpha_count = sum(map(str.isalpha, segment))
+    return alpha_count / len(segment) >= MIN_ALPHA_RATIO
+
+
+def _split(text: str) -> Tuple[List[str], str]:
+    """
+    Split text at sentence boundaries.
+
+    Returns the complete sentences and the unterminated tail, which the
+    streaming iterator carries over into the next chunk.
+    """
+    sentences = []
+    start = 0
+    for match in _BOUNDARY.finditer(text):
+        if _is_abbreviation(text, match.start()):
+            continue
+        sentences.append(text[start:match.start()])
+        start = match.end()
+    return sentences, text[start:]
+
+
+def _clean(sentence: str):
+    """Normalize whitespace; returns (segment, words) or None if it is filtered out"""
+    words = sentence.split()
+    segment = ' '.join(words)
+    return (segment, words) if _keep(segment, words) else None
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into whitespace-normalized sentences, keeping their punctuation and without filtering"""
+    sentences = []
+    start = 0
+    for match in _BOUNDARY.finditer(text):
+        if _is_abbreviation(text, match.start()):
+            continue
+        sentence = ' '.join(text[start:match.end()].split())
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    tail = ' '.join(text[start:].split())
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+def iter_page_segments(pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+    """
+    Stream question-generation segments out of page text.
+
+    A sentence that runs across a page break is joined with the rest of it on
+    the next page and attributed to the page it starts on.
+
+    Args:
+        pages (iterable): (page_number, text) pairs, e.g. from iter_pdf_pages
+
+    Yields:
+        tuple: (page_number, segment)
+    """
+    carry = ''
+    carry_page = None
+    for page_number, text in pages:
+        sentences, tail = _split(carry + ' ' + text if carry else text)
+        for i, sentence in enumerate(sentences):
+            cleaned = _clean(sentence)
+            if cleaned:
+                yield (carry_page if i == 0 and carry_page is not None else page_number), cleaned[0]
+        if tail.strip() and len(tail) <= MAX_CARRY_CHARS:
+            if not carry or sentences:
+                carry_page = page_number
+            carry = tail
+        else:
+            cleaned = _clean(tail)
+            if cleaned:
+                yield (carry_page if carry_page is not None else page_number), cleaned[0]
+            carry = ''
+            carry_page = None
+    if carry:
+        cleaned = _clean(carry)
+        if cleaned:
+            yield carry_page, cleaned[0]
+
+
+def iter_segments(chunks: Iterable[str]) -> Iterator[str]:
+    """Stream segments out of consecutive chunks of text (e.g. pages)"""
+    for _, segment in iter_page_segments(enumerate(chunks, 1)):
+        yield segment
+
+
+def split_segments(text: str) -> List[str]:
+    """
+    Normalize text and split it into segments suitable for question generation.
+
+    Sentences are split on . ! ? and ; (but not inside abbreviations, initials
+    or decimals) and kept if they are at least MIN_SEGMENT_CHARS long, have at
+    least MIN_SEGMENT_WORDS words and are mostly alphabetic.
+    """
+    return list(iter_segments([text]))
+
+
+_LEGACY_BOUNDARY = re.compile(r'\.|;|!|\?')
+
+
+def _legacy_split(text):
+    """The split/filter loop previously used by generate_questions (for benchmarking)"""
+    text = text.strip().replace('\n', ' ').replace('\r', ' ')
+    while '  ' in text:
+        text = text.replace('  ', ' ')
+    parts = [p.strip() for p in _LEGACY_BOUNDARY.split(text)]
+    kept = []
+    for part in parts:
+        if len(part) < 20 or len(part.split()) < 4:
+            continue
+        if sum(c.isalpha() for c in part) / len(part) < 0.5:
+            continue
+        kept.append(part)
+    return kept
+
+
+def benchmark(pdf_dir=None, repeat=5):
+    """
+    Time the legacy splitter against this module on the bundled PDFs.
+
+    Returns:
+        list: One dict per PDF with character count, segment counts and best-of-repeat timings
+    """
+    from process_pdf import extract_text_from_pdf
+
+    pdf_dir = Path(pdf_dir or Path(__file__).parent.parent / 'uploads')
+    results = []
+    for pdf_path in sorted(pdf_dir.glob('*.pdf')):
+        text = extract_text_from_pdf(str(pdf_path))
+        row = {'file': pdf_path.name, 'chars': len(text)}
+        for name, fn in (('legacy', _legacy_split), ('segmenter', split_segments)):
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                segments = fn(text)
+                best = min(best, time.perf_counter() - start)
+            row[f'{name}_segments'] = len(segments)
+            row[f'{name}_ms'] = round(best * 1000, 3)
+        results.append(row)
+    return results
+
+
+# Microbenchmark on the PDFs in uploads/
+if __name__ == "__main__":
+    for row in benchmark():
+        print(f"{row['file']}: {row['chars']} chars | "
+              f"legacy {row['legacy_ms']} ms ({row['legacy_segments']} segments) | "
+              f"segmenter {row['segmenter_ms']} ms ({row['segmenter_segments']} segments)")
@@ -0,0 +1,116 @@
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify, make_response
+
+from metrics import registry
+
+IN_FLIGHT = registry.gauge('eduquery_generations_in_flight', 'Generation requests being served by this process')
+WAITING = registry.gauge('eduquery_generations_waiting', 'Generation requests waiting for admission in this process')
+REJECTED = registry.counter('eduquery_generations_rejected_total',
+                            'Generation requests turned away by the admission limiter', ('status',))
+
+
+class Rejected(Exception):
+    """Admission was refused; status is the HTTP status to answer with"""
+
+    def __init__(self, status, retry_after):
+        super().__init__(f"Server busy (HTTP {status}); retry after {retry_after}s")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """
+    Bounds the generations a worker process serves at once.
+
+    Up to max_in_flight requests run; up to max_waiting more wait (for at most
+    wait_timeout seconds) for one of them to finish. A request arriving to a
+    full queue is rejected at once with 429; one that waited too long gets 503.
+    Both carry a Retry-After estimated from recent generation times, so a burst
+    is shed quickly instead of piling up blocked worker threads.
+    """
+
+    def __init__(self, max_in_flight=4, max_waiting=8, wait_timeout=10.0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_waiting = max(0, max_waiting)
+        self.wait_timeout = wait_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        # Exponentially weighted average of admitted request durations
+        self.average_seconds = 5.0
+        self._condition = threading.Condition()
+
+    def retry_after(self):
+        """Seconds until a slot is likely free, from the queue length and recent durations"""
+        rounds = (self.waiting + self.in_flight) / self.max_in_flight
+        return max(1, min(120, math.ceil(self.average_seconds * rounds)))
+
+    def acquire(self):
+        """Wait for a slot; raises Rejected if the queue is full or the wait times out"""
+        with self._condition:
+            if self.in_flight >= self.max_in_flight:
+                if self.waiting >= self.max_waiting:
+                    REJECTED.inc(status=429)
+                    raise Rejected(429, self.retry_after())
+                self.waiting += 1
+                WAITING.inc()
+                deadline = time.monotonic() + self.wait_timeout
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            REJECTED.inc(status=503)
+                            raise Rejected(503, self.retry_after())
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    WAITING.dec()
+            self.in_flight += 1
+            IN_FLIGHT.inc()
+        return time.monotonic()
+
+    def release(self, started):
+        with self._condition:
+            self.in_flight -= 1
+            IN_FLIGHT.dec()
+            self.average_seconds = 0.8 * self.average_seconds + 0.2 * (time.monotonic() - started)
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {'in_flight': self.in_flight, 'waiting': self.waiting, 'retry_after': self.retry_after()}
+
+
+def rejection_response(rejected):
+    response = jsonify({'error': 'The server is busy generating questions for other users. Please try again shortly.'})
+    response.status_code = rejected.status
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response
+
+
+def admit(limiter):
+    """
+    Route decorator: run the view only once the limiter admits the request.
+
+    The slot is held until the response is closed, so a streamed response
+    keeps it for as long as it is streaming.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                started = limiter.acquire()
+            except Rejected as e:
+                return rejection_response(e)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                limiter.release(started)
+                raise
+            response.call_on_close(lambda: limiter.release(started))
+            return response
+        return wrapper
+    return decorator
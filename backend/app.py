@@ -1,13 +1,38 @@
-from flask import Flask, request, jsonify, render_template
-from flask_cors import CORS
+import logging
 import os
-import requests
+import sys
+
+# Time every import below, for the startup report (GET /startup)
+from startup import ImportProfile, Warmup
+import_profile = ImportProfile.start()
+
+from flask import Flask, request, jsonify, render_template, url_for, Response, stream_with_context, g
+from flask_cors import CORS
+from werkzeug.utils import secure_filename
+import time
 import json
 from dotenv import load_dotenv
 
+# Make the shared modules in ai/ importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai'))
+from qg_backends import get_backend
+from chunker import TokenCounter, WORDS_PER_QUESTION, estimate_tokens
+from process_pdf import get_page_count
+import pipeline
+from pipeline import (QG_BACKEND, count_tokens, document_index, generate_for_pdf, generate_questions_cached,
+                      generate_questions_on_topic, iter_questions_from_text)
+from jobs import JobRunner, JobStore
+from admission import AdmissionLimiter, admit
+from scheduler import FairScheduler, QuotaExceeded, parse_weights, quota_response, scheduled
+from metrics import end_request, registry as metrics_registry, start_request
+
+import_profile.stop()
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Create Flask app with correct template and static folders
 app = Flask(__name__, 
             template_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'),
@@ -19,148 +44,153 @@ ALLOWED_EXTENSIONS = {'pdf'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Hugging Face API configuration
-HUGGINGFACE_API_KEY = os.getenv('HUGGINGFACE_API_KEY')
-if not HUGGINGFACE_API_KEY:
-    print("Warning: HUGGINGFACE_API_KEY not found in environment variables. Using demo mode with mock data.")
-    DEMO_MODE = True
-else:
-    DEMO_MODE = False
+# Fair-share queue of generation work per tenant (requests and PDF jobs), shared by every worker process
+TENANT_TOKENS_PER_HOUR = os.getenv('TENANT_TOKENS_PER_HOUR')
+scheduler = FairScheduler(os.getenv('SCHEDULER_PATH') or
+                          os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'scheduler.sqlite3'),
+                          capacity=int(os.getenv('SCHEDULER_CAPACITY', '8')),
+                          interactive_reserve=int(os.getenv('SCHEDULER_INTERACTIVE_RESERVE', '2')),
+                          tenant_concurrency=int(os.getenv('TENANT_MAX_CONCURRENCY', '4')),
+                          tenant_tokens_per_hour=int(TENANT_TOKENS_PER_HOUR) if TENANT_TOKENS_PER_HOUR else None,
+                          weights=parse_weights(os.getenv('TENANT_WEIGHTS')))
 
-# Update model URL to use gpt2
-QUESTION_MODEL_URL = "https://api-inference.huggingface.co/models/gpt2"
+# Background jobs for PDF uploads; job state is shared between worker processes on disk
+JOBS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'jobs')
+job_store = JobStore(JOBS_FOLDER, ttl=float(os.getenv('JOB_TTL', '86400')))
+job_runner = JobRunner(job_store, scheduler, max_workers=int(os.getenv('JOB_WORKERS', '2')))
 
-headers = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}" if HUGGINGFACE_API_KEY else ""}
+# Rough token cost of a PDF page, for scheduling and quotas before its text is extracted
+TOKENS_PER_PAGE = 650
+
+# Generations served at once per worker process; more wait briefly, then are turned away
+generation_limiter = AdmissionLimiter(max_in_flight=int(os.getenv('MAX_IN_FLIGHT_GENERATIONS', '4')),
+                                      max_waiting=int(os.getenv('MAX_WAITING_GENERATIONS', '8')),
+                                      wait_timeout=float(os.getenv('ADMISSION_WAIT_TIMEOUT', '10')))
+# PDF jobs accepted per process while earlier ones are still waiting for a job worker
+MAX_QUEUED_JOBS = int(os.getenv('MAX_QUEUED_JOBS', '16'))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def build_prompt(passage):
-    """Build a prompt for the Hugging Face model to generate MCQs"""
-    return f"""Generate multiple choice questions based on the following passage:
-
-{passage}
-
-For every 150-200 words, generate 1 question. Each question must:
-- Be based strictly on the passage
-- Contain 1 question and 4 answer choices labeled A, B, C, and D
-- Have only 1 correct answer
-- Have distractor options that are relevant and logically close to the correct answer
-
-Format the output as a JSON object with the following structure:
-{{
-    "questions": [
-        {{
-            "question": "...",
-            "options": ["A. ...", "B. ...", "C. ...", "D. ..."],
-            "answer": "B"
-        }},
-        ...
-    ]
-}}"""
+# Models load in the background once a process starts serving; /ready reports
+# when they are in memory, while requests that need one meanwhile load it themselves
+warmup = Warmup(enabled=os.getenv('WARM_MODELS', '1').lower() not in ('0', 'false', 'no'))
+if isinstance(count_tokens, TokenCounter):
+    warmup.add('tokenizer', count_tokens.load)
+warmup.add('embedding_model', lambda: document_index.calculator.model)
+if QG_BACKEND == 'local':
+    warmup.add('qg_models', get_backend('local').load)
 
-def generate_questions_from_text(text):
-    """Generate MCQs from text using the Hugging Face API"""
+def process_pdf_job(pdf_path, filename, progress):
+    """Background job for an uploaded PDF; the upload is deleted once the job has finished"""
     try:
-        # Calculate number of questions based on word count
-        word_count = len(text.split())
-        num_questions = max(1, word_count // 175)
-        
-        if DEMO_MODE:
-            # Return mock data for demo mode
-            return [
-                {
-                    'question': 'Who created the Python programming language?',
-                    'options': [
-                        'Guido van Rossum',
-                        'James Gosling',
-                        'Brendan Eich',
-                        'Larry Wall'
-                    ],
-                    'correct_answer': 'Guido van Rossum'
-                },
-                {
-                    'question': 'When was Python first released?',
-                    'options': [
-                        '1991',
-                        '1995',
-                        '1989',
-                        '1993'
-                    ],
-                    'correct_answer': '1991'
-                },
-                {
-                    'question': 'What is Python known for?',
-                    'options': [
-                        'Simplicity and readability',
-                        'Complex syntax',
-                        'Limited library support',
-                        'Mobile development only'
-                    ],
-                    'correct_answer': 'Simplicity and readability'
-                }
-            ]
-        
-        # Build the prompt
-        prompt = build_prompt(text)
-        
-        # Prepare the payload for the API
-        payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_length": 1024,
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "num_return_sequences": 1
-            }
-        }
-        
-        # Make the API request
-        response = requests.post(QUESTION_MODEL_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        # Parse the response
-        result = response.json()
-        
-        # Extract the generated text
-        generated_text = result[0]['generated_text']
-        
-        # Try to extract the JSON part from the generated text
+        return generate_for_pdf(pdf_path, filename, progress)
+    finally:
+        # Kept until here (not just until extraction) so a job requeued after
+        # its process died can still read it
         try:
-            # Find the JSON part in the generated text
-            json_start = generated_text.find('{')
-            json_end = generated_text.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = generated_text[json_start:json_end]
-                json_data = json.loads(json_str)
-                
-                # Convert the format to match what the frontend expects
-                mcqs = []
-                for q in json_data.get('questions', []):
-                    mcqs.append({
-                        'question': q['question'],
-                        'options': q['options'],
-                        'correct_answer': q['options'][ord(q['answer']) - ord('A')] if 'answer' in q else q['options'][0]
-                    })
-                
-                return mcqs
-            else:
-                # If no JSON found, return an error
-                return []
-        except Exception as e:
-            print(f"Error parsing JSON: {str(e)}")
-            return []
-            
-    except Exception as e:
-        print(f"Error generating questions: {str(e)}")
-        return []
+            os.remove(pdf_path)
+        except OSError:
+            pass
+
+job_runner.register('pdf', process_pdf_job)
+
+# Always add a Server-Timing breakdown to responses (otherwise only when the request sends X-Timing: 1)
+TIMING_HEADERS = os.getenv('TIMING_HEADERS', '').lower() in ('1', 'true', 'yes')
+
+HTTP_REQUEST_SECONDS = metrics_registry.histogram('eduquery_http_request_seconds',
+                                                  'Flask request latency by route, method and status',
+                                                  ('route', 'method', 'status'))
+
+def collect_service_metrics():
+    """Scrape-time cache and queue statistics for /metrics"""
+    # Read through the module: the cache can be replaced (benchmarks do)
+    cache = pipeline.result_cache.stats()
+    jobs = job_runner.stats()
+    admission = generation_limiter.stats()
+    return [
+        ('eduquery_result_cache_lookups_total', 'counter', 'Result cache lookups by outcome',
+         [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses']),
+          ({'result': 'coalesced'}, cache['coalesced'])]),
+        ('eduquery_result_cache_evictions_total', 'counter', 'Result cache entries evicted', [({}, cache['evictions'])]),
+        ('eduquery_result_cache_hit_ratio', 'gauge', 'Share of result cache lookups served without generating',
+         [({}, cache['hit_ratio'])]),
+        ('eduquery_job_queue_depth', 'gauge', 'PDF jobs waiting for a worker', [({}, jobs['queued'])]),
+        ('eduquery_jobs_running', 'gauge', 'PDF jobs running', [({}, jobs['running'])]),
+        ('eduquery_admission_retry_after_seconds', 'gauge', 'Retry-After currently sent to rejected generation requests',
+         [({}, admission['retry_after'])]),
+        ('eduquery_startup_import_seconds', 'gauge', 'Time this process spent importing its modules at startup',
+         [({}, import_profile.total_seconds)]),
+        ('eduquery_ready', 'gauge', 'Whether the models have finished warming up (1) or not (0)',
+         [({}, int(warmup.ready))]),
+    ]
+
+metrics_registry.add_collector(collect_service_metrics)
+
+def tenant_of():
+    """Who the current request is for: the X-Tenant-ID header, else the client address"""
+    return request.headers.get('X-Tenant-ID') or request.remote_addr or 'anonymous'
+
+def request_cost():
+    """Estimated tokens of generation the current request asks for"""
+    data = request.get_json(silent=True) or {}
+    if 'topic' in data:
+        # About one retrieved chunk of passage per question
+        return int(WORDS_PER_QUESTION * 1.3) * int(data.get('num_questions') or 10)
+    return estimate_tokens(data.get('passage') or request.form.get('text', ''))
+
+@app.before_request
+def start_request_timing():
+    g.timing, g.timing_token = start_request()
+    # Job workers and warm-up run in every serving process, started on its first request (after any fork)
+    job_runner.start()
+    warmup.start()
+
+@app.after_request
+def record_request_timing(response):
+    timings = g.get('timing')
+    if timings is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - timings.started,
+                                 route=route, method=request.method, status=response.status_code)
+    if TIMING_HEADERS or request.headers.get('X-Timing') == '1':
+        response.headers['Server-Timing'] = timings.server_timing()
+    end_request(g.timing_token)
+    return response
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus-style metrics of this worker process"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 once the models have warmed up, 503 while they are still loading"""
+    stats = warmup.stats()
+    return jsonify(stats), 200 if stats['ready'] else 503
+
+@app.route('/startup', methods=['GET'])
+def startup_report():
+    """Import time per module at startup, and the progress of the model warm-up"""
+    return jsonify({'imports': import_profile.report(), 'warmup': warmup.stats()})
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/upload', methods=['POST'])
+@admit(generation_limiter)
+@scheduled(scheduler, tenant_of, request_cost, generation_limiter.wait_timeout)
 def handle_upload():
     """Handle file upload or text input"""
     try:
@@ -171,9 +201,34 @@ def handle_upload():
                 return jsonify({'error': 'No file selected'}), 400
             
             if file and allowed_file(file.filename):
-                # TODO: Process PDF file and extract text
-                # For now, return an error
-                return jsonify({'error': 'PDF processing not implemented yet'}), 400
+                if job_runner.stats()['queued'] >= MAX_QUEUED_JOBS:
+                    response = jsonify({'error': 'Too many PDFs are waiting to be processed. Please try again shortly.'})
+                    response.headers['Retry-After'] = str(generation_limiter.retry_after())
+                    return response, 503
+
+                # Store the upload and process it in the background; the client
+                # polls the status URL for progress and the generated MCQs
+                job = job_store.create('pdf', stages=['extract', 'index', 'generate'])
+                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+                filename = secure_filename(file.filename)
+                pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{job['id']}_{filename}")
+                file.save(pdf_path)
+                try:
+                    job_runner.submit(job['id'], 'pdf', [pdf_path, filename], tenant_of(),
+                                      get_page_count(pdf_path) * TOKENS_PER_PAGE)
+                except QuotaExceeded as e:
+                    os.remove(pdf_path)
+                    job_store.update(job['id'], status='failed', error=str(e))
+                    return quota_response(e)
+                except Exception as e:
+                    # e.g. not a readable PDF; the job never runs, so nothing else deletes the upload
+                    os.remove(pdf_path)
+                    job_store.update(job['id'], status='failed', error=str(e))
+                    raise
+                return jsonify({
+                    'job_id': job['id'],
+                    'status_url': url_for('job_status', job_id=job['id'])
+                }), 202
             else:
                 return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
         
@@ -184,7 +239,7 @@ def handle_upload():
                 return jsonify({'error': 'No text provided'}), 400
             
             # Generate MCQs from the text
-            mcqs = generate_questions_from_text(text)
+            mcqs = generate_questions_cached(text)
             
             if not mcqs:
                 return jsonify({'error': 'Failed to generate questions. Please try again with different text.'}), 400
@@ -198,6 +253,8 @@ def handle_upload():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/generate', methods=['POST'])
+@admit(generation_limiter)
+@scheduled(scheduler, tenant_of, request_cost, generation_limiter.wait_timeout)
 def generate():
     """Generate MCQs from text"""
     try:
@@ -206,7 +263,7 @@ def generate():
             return jsonify({'error': 'No passage provided'}), 400
         
         passage = data['passage']
-        mcqs = generate_questions_from_text(passage)
+        mcqs = generate_questions_cached(passage)
         
         if not mcqs:
             return jsonify({'error': 'Failed to generate questions. Please try again with different text.'}), 400
@@ -216,7 +273,101 @@ def generate():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/generate/stream', methods=['POST'])
+@admit(generation_limiter)
+@scheduled(scheduler, tenant_of, request_cost, generation_limiter.wait_timeout)
+def generate_stream():
+    """Stream MCQs as Server-Sent Events as soon as each passage is generated"""
+    data = request.get_json(silent=True) or {}
+    passage = data.get('passage') or request.form.get('text', '')
+    if not passage.strip():
+        return jsonify({'error': 'No passage provided'}), 400
+
+    def events():
+        count = 0
+        try:
+            for passage_index, mcqs in iter_questions_from_text(passage):
+                for mcq in mcqs:
+                    yield sse_event('mcq', dict(mcq, index=count, passage=passage_index))
+                    count += 1
+        except Exception as e:
+            print(f"Error streaming questions: {str(e)}")
+            yield sse_event('error', {'error': str(e)})
+            return
+        if count:
+            yield sse_event('done', {'count': count})
+        else:
+            yield sse_event('error', {'error': 'Failed to generate questions. Please try again with different text.'})
+
+    return Response(stream_with_context(events()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report the status, per-stage progress and (when done) the MCQs of a background job"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    response = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'stages': job['stages'],
+    }
+    if job['status'] == 'queued':
+        task = scheduler.get(job_id)
+        if task is not None:
+            response['queue_wait_s'] = task['queue_wait_s']
+    elif 'queue_wait_s' in job:
+        response['queue_wait_s'] = job['queue_wait_s']
+    if job['status'] == 'done':
+        response['mcqs'] = job['result']['mcqs']
+        for key in ('document_id', 'changes'):
+            if key in job['result']:
+                response[key] = job['result'][key]
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
+
+@app.route('/documents', methods=['GET'])
+def list_documents():
+    """List indexed documents"""
+    documents = sorted(document_index.list(), key=lambda d: d['created_at'], reverse=True)
+    return jsonify({'documents': [
+        {key: d[key] for key in ('document_id', 'filename', 'n_pages', 'n_chunks', 'created_at')}
+        for d in documents
+    ]})
+
+@app.route('/documents/<document>/questions', methods=['POST'])
+@admit(generation_limiter)
+@scheduled(scheduler, tenant_of, request_cost, generation_limiter.wait_timeout)
+def document_questions(document):
+    """Generate MCQs on a topic from an uploaded document (by file name or document id)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        topic = (data.get('topic') or '').strip()
+        if not topic:
+            return jsonify({'error': 'No topic provided'}), 400
+        num_questions = max(1, int(data.get('num_questions', 10)))
+        k = int(data['k']) if data.get('k') else None
+
+        try:
+            mcqs, sources = generate_questions_on_topic(document, topic, num_questions, k)
+        except KeyError:
+            return jsonify({'error': 'Document not found. Upload it first.'}), 404
+
+        if not mcqs:
+            return jsonify({'error': 'Failed to generate questions on this topic.'}), 400
+        return jsonify({'mcqs': mcqs, 'sources': sources})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    logger.info(import_profile.summary())
+
     # Create upload folder if it doesn't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
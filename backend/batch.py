@@ -0,0 +1,210 @@
+"""
+Pregenerate question banks for a folder of PDFs.
+
+    python backend/batch.py uploads/ -o question_bank.jsonl --workers 4
+
+Files are processed in a pool of worker processes, each running the same
+extract -> index -> generate pipeline as a PDF upload, followed by confidence
+scoring. Every finished file is appended to the output as one JSON line with
+its MCQs and per-stage timings. Re-running with the same output file skips
+files already completed (unless they changed since), so an interrupted run
+resumes where it stopped. With --bank, the finished output is also exported
+as a columnar MCQ bank (see ai/mcq_bank.py) for fast loading and filtering.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+_pipeline = None
+_calculator = None
+
+
+def _init_worker(torch_threads):
+    """Load the pipeline once per worker process"""
+    global _pipeline
+    # Keep each worker's torch from claiming every core
+    os.environ.setdefault('OMP_NUM_THREADS', str(torch_threads))
+    os.environ.setdefault('MKL_NUM_THREADS', str(torch_threads))
+    backend = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.join(os.path.dirname(backend), 'ai'))
+    sys.path.insert(0, backend)
+    import pipeline
+    _pipeline = pipeline
+
+
+def _score(mcqs):
+    """Attach per-option confidence scores (float32 arrays in option order) to each MCQ record"""
+    global _calculator
+    if _calculator is None:
+        from confidence_calculator import ConfidenceCalculator
+        _calculator = ConfidenceCalculator()
+    for mcq, scores in zip(mcqs, _calculator.calculate_confidence_arrays(mcqs)):
+        mcq.scores = scores
+    return mcqs
+
+
+class StageTimer:
+    """
+    Progress callback that times pipeline stages.
+
+    A stage is taken to end at its last progress report and to start where the
+    previous stage ended.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last_report = {}
+
+    def __call__(self, stage, done, total=None):
+        self.last_report[stage] = time.perf_counter()
+
+    def timings(self):
+        timings = {}
+        previous = self.start
+        for stage, ended in sorted(self.last_report.items(), key=lambda item: item[1]):
+            timings[f'{stage}_s'] = round(ended - previous, 3)
+            previous = ended
+        return timings
+
+
+def process_file(path, relative_name, score=True):
+    """Run the upload pipeline (and scoring) on one PDF in a worker. Returns one output record."""
+    from mcq_bank import MCQ
+    timer = StageTimer()
+    record = {'file': relative_name, 'worker_pid': os.getpid()}
+    try:
+        result = _pipeline.generate_for_pdf(path, os.path.basename(path), timer)
+        record.update(status='ok', document_id=result['document_id'], changes=result['changes'])
+        mcqs = [MCQ.from_dict(mcq, relative_name) for mcq in result['mcqs']]
+        timings = timer.timings()
+        if score:
+            started = time.perf_counter()
+            mcqs = _score(mcqs)
+            timings['score_s'] = round(time.perf_counter() - started, 3)
+        record.update(mcqs=[mcq.to_dict() for mcq in mcqs], num_mcqs=len(mcqs))
+    except Exception as e:
+        timings = timer.timings()
+        record.update(status='error', error=str(e))
+    timings['total_s'] = round(time.perf_counter() - timer.start, 3)
+    record['timings'] = timings
+    return record
+
+
+def file_fingerprint(path):
+    """Size and modification time; a file whose fingerprint changed is processed again"""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_checkpoint(output_path):
+    """
+    Read the completed files from an existing output file.
+
+    A line cut off by an interrupted run is truncated away so appending
+    continues on a clean line.
+
+    Returns:
+        dict: {file: fingerprint} of files that finished successfully
+    """
+    completed = {}
+    if not output_path.exists():
+        return completed
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end != len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get('status') == 'ok':
+            completed[record['file']] = {'size': record['size'], 'mtime_ns': record['mtime_ns']}
+    return completed
+
+
+def run(input_dir, output_path, workers=None, score=True, pattern='*.pdf'):
+    """
+    Process every PDF under input_dir not already completed in output_path.
+
+    Returns:
+        dict: Counts of processed, skipped and failed files and the wall time
+    """
+    input_dir = Path(input_dir)
+    output_path = Path(output_path)
+    workers = workers or os.cpu_count() or 1
+    completed = load_checkpoint(output_path)
+
+    pending = []
+    skipped = 0
+    for path in sorted(input_dir.rglob(pattern)):
+        relative_name = path.relative_to(input_dir).as_posix()
+        fingerprint = file_fingerprint(path)
+        if completed.get(relative_name) == fingerprint:
+            skipped += 1
+            continue
+        pending.append((str(path), relative_name, fingerprint))
+
+    summary = {'processed': 0, 'failed': 0, 'skipped': skipped, 'pending': len(pending)}
+    print(f"{len(pending)} file(s) to process, {skipped} already done; {workers} worker(s)")
+    if not pending:
+        return summary
+
+    started = time.perf_counter()
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                   initializer=_init_worker, initargs=(torch_threads,))
+    try:
+        with open(output_path, 'a', encoding='utf-8') as out:
+            futures = {executor.submit(process_file, path, relative_name, score): fingerprint
+                       for path, relative_name, fingerprint in pending}
+            for future in as_completed(futures):
+                record = dict(future.result(), **futures[future])
+                # One complete line per file, flushed to disk: this file is the checkpoint
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                os.fsync(out.fileno())
+                if record['status'] == 'ok':
+                    summary['processed'] += 1
+                    print(f"{record['file']}: {record['num_mcqs']} MCQs in {record['timings']['total_s']}s")
+                else:
+                    summary['failed'] += 1
+                    print(f"{record['file']}: failed ({record['error']})")
+    finally:
+        # On Ctrl-C, drop queued files; completed ones are already in the output
+        executor.shutdown(wait=True, cancel_futures=True)
+    summary['wall_s'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate MCQ banks for every PDF in a directory.')
+    parser.add_argument('input_dir', help='Directory searched (recursively) for PDFs')
+    parser.add_argument('-o', '--output', default='question_bank.jsonl',
+                        help='JSONL output, also used to resume an interrupted run (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Worker processes (default: one per core)')
+    parser.add_argument('--pattern', default='*.pdf', help='File name pattern (default: %(default)s)')
+    parser.add_argument('--no-score', action='store_true', help='Skip confidence scoring')
+    parser.add_argument('--bank', default=None,
+                        help='Also export every completed file to this columnar MCQ bank (.npz)')
+    args = parser.parse_args(argv)
+
+    summary = run(args.input_dir, args.output, workers=args.workers, score=not args.no_score, pattern=args.pattern)
+    if args.bank and Path(args.output).exists():
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'ai'))
+        from mcq_bank import MCQBank
+        bank = MCQBank.from_jsonl(args.output)
+        bank.save(args.bank)
+        summary['bank_questions'] = len(bank)
+    print(json.dumps(summary))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
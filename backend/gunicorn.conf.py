@@ -0,0 +1,68 @@
+"""
+Production serving config.
+
+    cd backend && gunicorn -c gunicorn.conf.py app:app
+
+Each worker process serves requests on a pool of threads, which suits the
+app: most of a request is spent waiting on the Hugging Face API. Only
+MAX_IN_FLIGHT_GENERATIONS of those threads generate at once (see
+admission.py); the rest stay free for job polling, static files and
+/metrics, and excess generation requests are turned away with 429/503.
+"""
+import multiprocessing
+import os
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Keep workers x threads modest: each worker holds its own copy of any
+# in-process models, and upstream calls are rate-limited per process anyway
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(4, multiprocessing.cpu_count() * 2))))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# Load the app (and any preloaded models) once in the master so workers share it copy-on-write
+preload_app = True
+
+# A gthread worker heartbeats independently of its requests, so this only
+# catches a hung worker; keep it above the worst case of waiting for
+# admission and then spending the whole upstream deadline
+timeout = int(float(os.getenv('ADMISSION_WAIT_TIMEOUT', '10')) + float(os.getenv('UPSTREAM_DEADLINE', '90')) + 30)
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+# Recycle workers now and then so a slow leak can't grow unbounded; jitter
+# keeps them from all restarting at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+
+
+def on_starting(server):
+    """
+    Log the app's import time, then load the in-process models in the master,
+    before workers fork, when PRELOAD_MODELS is set
+    """
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        server.log.info(app_module.import_profile.summary())
+    if os.getenv('PRELOAD_MODELS', '').lower() not in ('1', 'true', 'yes'):
+        return
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai'))
+    from transformers import AutoModelForSeq2SeqLM
+    from model_registry import preload_models
+    from qg_backends import ANSWER_MODEL_NAME, QUESTION_MODEL_NAME
+
+    quantize = os.getenv('CONFIDENCE_MODEL_QUANTIZE', '').lower() in ('1', 'true', 'yes')
+    preload_models(quantize=quantize)
+    if os.getenv('QG_BACKEND', 'remote').lower() == 'local':
+        preload_models([QUESTION_MODEL_NAME, ANSWER_MODEL_NAME], model_class=AutoModelForSeq2SeqLM)
+    server.log.info("Preloaded models")
+
+
+def post_fork(server, worker):
+    """Start warming the models in each new worker, so /ready turns 200 without waiting for traffic"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.warmup.start()
@@ -0,0 +1,245 @@
+import difflib
+import hashlib
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+
+from metrics import propagate
+from segmenter import iter_page_segments
+
+# Segments hold at least this many words (one passage's worth) and end at the
+# first content-defined boundary after that, or at SEGMENT_MAX_WORDS
+SEGMENT_MIN_WORDS = 350
+SEGMENT_MAX_WORDS = 700
+# About one sentence in this many is a boundary candidate
+BOUNDARY_DIVISOR = 4
+
+
+def content_hash(text):
+    """Hash of whitespace-normalized text, stable across re-extractions of the same content"""
+    return hashlib.sha256(' '.join(text.split()).encode('utf-8')).hexdigest()
+
+
+def _is_boundary(sentence, divisor):
+    digest = hashlib.blake2b(sentence.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % divisor == 0
+
+
+def content_defined_segments(pages, min_words=SEGMENT_MIN_WORDS, max_words=SEGMENT_MAX_WORDS,
+                             divisor=BOUNDARY_DIVISOR):
+    """
+    Split a document's sentences into segments whose boundaries depend on content.
+
+    A segment ends after the first sentence, once it has min_words words, whose
+    hash hits the boundary condition (or at max_words). Because boundaries are
+    picked by the sentences themselves rather than by running word counts, an
+    edit only changes the segments around it; every other segment keeps its
+    exact text and hash in the revised document.
+
+    Args:
+        pages (iterable): (page_number, text) pairs
+
+    Returns:
+        list: Dicts with 'text', 'hash', 'first_page' and 'last_page'
+    """
+    segments = []
+    current = []
+    current_words = 0
+    first_page = last_page = None
+
+    def flush():
+        text = ' '.join(current)
+        segments.append({'text': text, 'hash': content_hash(text), 'first_page': first_page, 'last_page': last_page})
+
+    for page_number, sentence in iter_page_segments(pages):
+        if not current:
+            first_page = page_number
+        current.append(sentence)
+        current_words += len(sentence.split())
+        last_page = page_number
+        if current_words >= max_words or (current_words >= min_words and _is_boundary(sentence, divisor)):
+            flush()
+            current = []
+            current_words = 0
+    if current:
+        flush()
+    return segments
+
+
+def diff_report(previous, page_hashes, segments, regenerated):
+    """
+    Describe how a document version differs from the previous one.
+
+    Args:
+        previous (dict): Stored manifest of the previous version, or None
+        page_hashes (list): Content hash per page of this version
+        segments (list): This version's segments (from content_defined_segments)
+        regenerated (set): Hashes of segments whose MCQs had to be generated
+
+    Returns:
+        dict: Page-level changes (1-based page numbers of this version) and
+        segment counts, plus the page range of every regenerated segment
+    """
+    report = {
+        'previous_document_id': previous['document_id'] if previous else None,
+        'pages': {'unchanged': 0, 'modified': [], 'added': [], 'removed': 0},
+        'segments': {
+            'total': len(segments),
+            'reused': sum(1 for s in segments if s['hash'] not in regenerated),
+            'regenerated': sum(1 for s in segments if s['hash'] in regenerated),
+            'removed': 0,
+        },
+        'regenerated': [{'first_page': s['first_page'], 'last_page': s['last_page']}
+                        for s in segments if s['hash'] in regenerated],
+    }
+    if previous is None:
+        report['pages']['added'] = list(range(1, len(page_hashes) + 1))
+        return report
+
+    matcher = difflib.SequenceMatcher(a=previous['pages'], b=page_hashes, autojunk=False)
+    for tag, a_start, a_end, b_start, b_end in matcher.get_opcodes():
+        new_pages = list(range(b_start + 1, b_end + 1))
+        if tag == 'equal':
+            report['pages']['unchanged'] += len(new_pages)
+        elif tag == 'replace':
+            report['pages']['modified'].extend(new_pages[:a_end - a_start])
+            report['pages']['added'].extend(new_pages[a_end - a_start:])
+            report['pages']['removed'] += max(0, (a_end - a_start) - len(new_pages))
+        elif tag == 'insert':
+            report['pages']['added'].extend(new_pages)
+        elif tag == 'delete':
+            report['pages']['removed'] += a_end - a_start
+
+    current = {s['hash'] for s in segments}
+    report['segments']['removed'] = sum(1 for h in set(previous['segments']) if h not in current)
+    return report
+
+
+class SegmentStore:
+    """
+    Durable per-segment MCQs and per-document manifests in a SQLite file.
+
+    Segment results are keyed by segment text + model + generation parameters
+    and never expire, so any document containing an already processed segment
+    reuses its MCQs. Manifests record the page and segment hashes of each
+    uploaded version, to diff a revised upload against the previous one.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS segments (
+                                key TEXT PRIMARY KEY,
+                                mcqs TEXT NOT NULL,
+                                created_at REAL NOT NULL)''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS documents (
+                                document_id TEXT PRIMARY KEY,
+                                filename TEXT NOT NULL,
+                                manifest TEXT NOT NULL,
+                                created_at REAL NOT NULL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS documents_filename ON documents (filename, created_at)')
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per operation keeps this safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys):
+        """Stored MCQs for the given segment keys, as {key: mcqs} (missing keys left out)"""
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._connect() as conn:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = conn.execute(f'SELECT key, mcqs FROM segments WHERE key IN ({",".join("?" * len(batch))})',
+                                    batch).fetchall()
+                found.update((key, json.loads(mcqs)) for key, mcqs in rows)
+        return found
+
+    def put(self, key, mcqs):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO segments (key, mcqs, created_at) VALUES (?, ?, ?)',
+                         (key, json.dumps(mcqs), time.time()))
+
+    def latest_document(self, filename):
+        """Manifest of the most recently uploaded version of a file name, or None"""
+        with self._connect() as conn:
+            row = conn.execute('''SELECT document_id, manifest FROM documents WHERE filename = ?
+                                  ORDER BY created_at DESC LIMIT 1''', (filename,)).fetchone()
+        if row is None:
+            return None
+        return dict(json.loads(row[1]), document_id=row[0])
+
+    def save_document(self, document_id, filename, page_hashes, segment_hashes):
+        manifest = {'pages': page_hashes, 'segments': segment_hashes}
+        with self._connect() as conn:
+            conn.execute('''INSERT OR REPLACE INTO documents (document_id, filename, manifest, created_at)
+                            VALUES (?, ?, ?, ?)''', (document_id, filename, json.dumps(manifest), time.time()))
+
+
+def process_document(store, document_id, filename, pages, segment_key, generate, progress=None, max_concurrency=1):
+    """
+    Generate MCQs for a document, regenerating only segments not processed before.
+
+    Stored segments are taken as they are; the rest are generated up to
+    max_concurrency at a time.
+
+    Args:
+        store (SegmentStore): Per-segment results and document manifests
+        document_id (str): Content hash of the uploaded file
+        filename (str): Upload name; versions with the same name are diffed
+        pages (list): (page_number, text) pairs
+        segment_key (callable): Maps segment text to its store key (text + model + parameters)
+        generate (callable): Maps segment text to its list of MCQs
+        progress (callable): progress(done, total) after each segment
+        max_concurrency (int): Segments generated at once
+
+    Returns:
+        tuple: (mcqs in document order, diff report)
+    """
+    previous = store.latest_document(filename)
+    page_hashes = [content_hash(text) for _, text in pages]
+    segments = content_defined_segments(pages)
+    keys = [segment_key(segment['text']) for segment in segments]
+    stored = store.get_many(keys)
+
+    # The same text can occur twice in a document; generate it once
+    missing = list(dict.fromkeys(key for key in keys if key not in stored))
+    regenerate = set(missing)
+    text_of = {key: segment['text'] for segment, key in zip(segments, keys)}
+    done = sum(key not in regenerate for key in keys)
+    if progress:
+        progress(done, len(segments))
+
+    def generate_segment(key):
+        segment_mcqs = generate(text_of[key])
+        if segment_mcqs:
+            # Failed generations are not stored, so the next upload retries them
+            store.put(key, segment_mcqs)
+        return key, segment_mcqs or []
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(missing)))) as executor:
+            futures = [executor.submit(propagate(generate_segment), key) for key in missing]
+            for future in as_completed(futures):
+                key, segment_mcqs = future.result()
+                stored[key] = segment_mcqs
+                done += keys.count(key)
+                if progress:
+                    progress(done, len(segments))
+
+    regenerated = {segment['hash'] for segment, key in zip(segments, keys) if key in regenerate}
+    mcqs = [mcq for key in keys for mcq in stored[key]]
+    store.save_document(document_id, filename, page_hashes, [segment['hash'] for segment in segments])
+    return mcqs, diff_report(previous, page_hashes, segments, regenerated)
@@ -0,0 +1,167 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from scheduler import BULK
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+# Finished jobs are kept this long for status requests, then purged
+DEFAULT_JOB_TTL = 24 * 3600
+
+
+class JobStore:
+    """
+    Job state kept as one JSON file per job.
+
+    Files are replaced atomically, so a status request served by any worker
+    process sees a consistent snapshot of a job started by another. Jobs that
+    finished (or were last updated) more than ttl seconds ago are purged now
+    and then when new jobs are created.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_JOB_TTL):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def _path(self, job_id):
+        return self.directory / f'{job_id}.json'
+
+    def _write(self, job):
+        path = self._path(job['id'])
+        tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def create(self, kind, stages):
+        """Create a queued job with zeroed progress for each named stage"""
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'status': 'queued',
+            'stages': {stage: {'done': 0, 'total': None} for stage in stages},
+            'error': None,
+            'result': None,
+            'created_at': now,
+            'updated_at': now,
+        }
+        with self._lock:
+            self._write(job)
+        if now - self._last_purge > min(self.ttl, 3600):
+            self._last_purge = now
+            self.purge()
+        return job
+
+    def purge(self):
+        """Delete finished jobs older than the TTL, and jobs of any status not updated for twice that"""
+        now = time.time()
+        for path in self.directory.glob('*'):
+            try:
+                if path.suffix == '.tmp':
+                    # Left behind by a process that died mid-write
+                    if path.stat().st_mtime < now - 3600:
+                        path.unlink()
+                    continue
+                with open(path) as f:
+                    job = json.load(f)
+                age = now - job['updated_at']
+                if age > self.ttl * 2 or (age > self.ttl and job['status'] in ('done', 'failed')):
+                    path.unlink()
+            except (OSError, ValueError, KeyError):
+                continue
+
+    def get(self, job_id):
+        """Return the job dict, or None for an unknown (or malformed) id"""
+        if not JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _get_existing(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(f"Unknown job {job_id!r}")
+        return job
+
+    def update(self, job_id, **changes):
+        """Apply changes to a job; raises KeyError for an unknown (or purged) job"""
+        with self._lock:
+            job = self._get_existing(job_id)
+            job.update(changes)
+            job['updated_at'] = time.time()
+            self._write(job)
+            return job
+
+    def set_progress(self, job_id, stage, done, total=None):
+        with self._lock:
+            job = self._get_existing(job_id)
+            job['stages'][stage] = {'done': done, 'total': total}
+            job['updated_at'] = time.time()
+            self._write(job)
+
+
+class JobRunner:
+    """
+    Runs jobs as bulk tasks of a FairScheduler and records their outcome in a JobStore.
+
+    Job functions are registered by kind and called with the job's JSON
+    arguments, so a job queued by one process can be run by any other (or
+    after a restart).
+    """
+
+    def __init__(self, store, scheduler, max_workers=2):
+        self.store = store
+        self.scheduler = scheduler
+        self.max_workers = max_workers
+        self._functions = {}
+        scheduler.register('job', self._run)
+
+    def register(self, kind, fn):
+        """fn(*args, progress) runs jobs of this kind; its return value becomes the job result"""
+        self._functions[kind] = fn
+
+    def start(self):
+        """Start this process's job workers (a no-op once they are running)"""
+        self.scheduler.start_workers(self.max_workers)
+
+    def submit(self, job_id, kind, args, tenant, cost):
+        """
+        Queue a job for tenant; cost (estimated tokens) sets its fair share.
+
+        progress(stage, done, total) updates the job's per-stage progress.
+
+        Raises:
+            QuotaExceeded: If the tenant's token quota would be exceeded
+        """
+        self.start()
+        self.scheduler.submit(tenant, BULK, cost, handler='job', payload={'kind': kind, 'args': args},
+                              task_id=job_id)
+
+    def _run(self, job_id, payload):
+        def progress(stage, done, total=None):
+            self.store.set_progress(job_id, stage, done, total)
+
+        task = self.scheduler.get(job_id)
+        self.store.update(job_id, status='running', started_at=time.time(), queue_wait_s=task['queue_wait_s'])
+        try:
+            result = self._functions[payload['kind']](*payload['args'], progress)
+        except Exception as e:
+            print(f"Job {job_id} failed: {str(e)}")
+            self.store.update(job_id, status='failed', error=str(e), finished_at=time.time())
+            raise
+        self.store.update(job_id, status='done', result=result, finished_at=time.time())
+
+    def stats(self):
+        """Jobs waiting for a worker and jobs running, across every process"""
+        return self.scheduler.stats()[BULK]
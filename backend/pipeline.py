@@ -0,0 +1,428 @@
+"""
+The question generation pipeline shared by the web app and batch.py.
+
+Passages are chunked, generated (by the hosted model, the local T5 models or
+demo data) and deduplicated; PDFs are extracted, indexed and generated segment
+by segment. Configuration comes from the environment, like the app's. The
+modules in ai/ must be importable (app.py and batch.py put them on sys.path).
+"""
+import math
+import os
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from inference_client import get_client
+from mcq_parser import iter_mcqs, parse_mcqs
+from qg_backends import get_backend
+from quality_gate import STOPWORDS, QualityGate, iter_gated
+from segmenter import split_segments
+from chunker import TokenCounter, WORDS_PER_QUESTION, chunk_passage, estimate_tokens
+from dedup import deduplicate_mcqs, threshold_from_env
+from document_index import CHUNK_WORDS, DocumentIndexStore, file_sha256
+from process_pdf import get_page_count, iter_pdf_pages
+from result_cache import create_result_cache, make_key
+from incremental import SegmentStore, process_document
+from metrics import propagate, stage
+
+# Load environment variables
+load_dotenv()
+
+# Chunk embedding index of every uploaded PDF, keyed by file hash, for topic queries
+document_index = DocumentIndexStore()
+
+# Per-segment MCQs of uploaded PDFs, so a revised upload only regenerates changed segments
+segment_store = SegmentStore(os.getenv('SEGMENT_STORE_PATH') or
+                             os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'segments.sqlite3'))
+
+# Passage chunks generated concurrently
+CHUNK_CONCURRENCY = int(os.getenv('GENERATION_CONCURRENCY', '4'))
+
+# Long passages are split into chunks of this many tokens (measured with the
+# model's tokenizer) so prompt + output fit the model's 1024-token window
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '512'))
+CHUNK_OVERLAP_WORDS = int(os.getenv('CHUNK_OVERLAP_WORDS', '40'))
+
+# Question generation backend: 'remote' (hosted API) or 'local' (T5 models in this process)
+QG_BACKEND = os.getenv('QG_BACKEND', 'remote').lower()
+
+# Hugging Face API configuration
+HUGGINGFACE_API_KEY = os.getenv('HUGGINGFACE_API_KEY')
+if QG_BACKEND == 'local':
+    DEMO_MODE = False
+elif not HUGGINGFACE_API_KEY:
+    print("Warning: HUGGINGFACE_API_KEY not found in environment variables. Using demo mode with mock data.")
+    DEMO_MODE = True
+else:
+    DEMO_MODE = False
+
+# Update model URL to use gpt2
+QUESTION_MODEL_URL = "https://api-inference.huggingface.co/models/gpt2"
+
+headers = {"Authorization": f"Bearer {HUGGINGFACE_API_KEY}" if HUGGINGFACE_API_KEY else ""}
+
+# Upstream (connect, read) timeout per attempt, and the budget for a whole call including retries
+UPSTREAM_TIMEOUT = (float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '5')), float(os.getenv('UPSTREAM_READ_TIMEOUT', '60')))
+UPSTREAM_DEADLINE = float(os.getenv('UPSTREAM_DEADLINE', '90'))
+
+# Generation parameters sent with every request (also part of the result cache key)
+GENERATION_PARAMETERS = {
+    "max_length": 1024,
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "num_return_sequences": 1
+}
+
+# Stream tokens from the text generation API and parse MCQs while they arrive
+STREAM_UPSTREAM = os.getenv('STREAM_UPSTREAM', '').lower() in ('1', 'true', 'yes')
+
+# Cache of generated MCQs, keyed by passage + model + parameters
+result_cache = create_result_cache()
+
+def build_prompt(passage, num_questions=None):
+    """Build a prompt for the Hugging Face model to generate MCQs"""
+    count_line = f"Generate {num_questions} question(s), 1 for every 150-200 words." if num_questions else \
+        "For every 150-200 words, generate 1 question."
+    return f"""Generate multiple choice questions based on the following passage:
+
+{passage}
+
+{count_line} Each question must:
+- Be based strictly on the passage
+- Contain 1 question and 4 answer choices labeled A, B, C, and D
+- Have only 1 correct answer
+- Have distractor options that are relevant and logically close to the correct answer
+
+Format the output as a JSON object with the following structure:
+{{
+    "questions": [
+        {{
+            "question": "...",
+            "options": ["A. ...", "B. ...", "C. ...", "D. ..."],
+            "answer": "B"
+        }},
+        ...
+    ]
+}}"""
+
+def model_id():
+    """Identifies what produces MCQs, for result cache keys"""
+    if QG_BACKEND == 'local':
+        return 'local'
+    return 'demo' if DEMO_MODE else QUESTION_MODEL_URL
+
+_PHRASE_WORD = re.compile(r"[A-Za-z][A-Za-z'-]*|\d+(?:\.\d+)?")
+_CLAUSE_BREAK = re.compile(r'[.,;:!?()\[\]"]+(?:\s|$)')
+
+def passage_distractors(text, answer, count=3):
+    """
+    Phrases of the passage shaped like answer: other numbers for a numeric
+    answer, else runs of as many content words, most frequent first.
+
+    Used when a passage has too few other answers to draw distractors from.
+    """
+    answer_words = _PHRASE_WORD.findall(answer)
+    if not answer_words:
+        return []
+    excluded = {word.lower() for word in answer_words}
+    numeric = len(answer_words) == 1 and answer_words[0][0].isdigit()
+    length = 1 if numeric else min(len(answer_words), 4)
+    counts = {}
+    # Phrases never run across punctuation
+    for clause in _CLAUSE_BREAK.split(text):
+        words = _PHRASE_WORD.findall(clause)
+        for i in range(len(words) - length + 1):
+            phrase = words[i:i + length]
+            if any(word.lower() in excluded or word.lower() in STOPWORDS or word[0].isdigit() != numeric
+                   for word in phrase):
+                continue
+            key = ' '.join(phrase)
+            counts[key] = counts.get(key, 0) + 1
+    # Stable sort: equally frequent phrases stay in passage order
+    return sorted(counts, key=counts.get, reverse=True)[:count]
+
+def build_mcqs_from_answers(pairs, text=''):
+    """
+    Turn (question, answer) pairs from one passage into MCQs.
+
+    Distractors are the answers to the passage's other questions, so they are
+    on-topic but wrong, topped up with phrases from the passage itself when
+    there are fewer than three (e.g. a passage that yields one question).
+    Questions left without any distractor are dropped.
+    """
+    answers = list(dict.fromkeys(answer for _, answer in pairs))
+    mcqs = []
+    for question, answer in pairs:
+        distractors = [other for other in answers if other != answer][:3]
+        if len(distractors) < 3:
+            taken = {option.lower() for option in distractors + [answer]}
+            distractors += [phrase for phrase in passage_distractors(text, answer, count=6)
+                            if phrase.lower() not in taken][:3 - len(distractors)]
+        if not distractors:
+            continue
+        options = [answer] + distractors
+        # Deterministic shuffle so the same passage always yields the same MCQs
+        random.Random(question).shuffle(options)
+        mcqs.append({'question': question, 'options': options, 'correct_answer': answer})
+    return mcqs
+
+def generate_questions_locally(text):
+    """Generate MCQs from text with the local T5 question/answer models, through the quality gate"""
+    backend = get_backend('local')
+    gate = QualityGate.from_env()
+    pairs = sorted(
+        (index, question, answer)
+        for index, question, answer, error in iter_gated(backend, split_segments(text), gate)
+        if question and answer
+    )
+    keep = gate.filter_pairs([question for _, question, _ in pairs], [answer for _, _, answer in pairs])
+    return build_mcqs_from_answers([pairs[i][1:] for i in keep], text)
+
+# Tokenizer of the hosted model, loaded on first use, for sizing chunks (demo
+# mode never calls the model, so an estimate is enough there)
+count_tokens = estimate_tokens if DEMO_MODE else TokenCounter('gpt2')
+
+def chunk_text(text):
+    """Split a passage into token-budgeted chunks aligned to the 150-200 words per question rule"""
+    return chunk_passage(text,
+                         count_tokens=count_tokens,
+                         words_per_question=WORDS_PER_QUESTION,
+                         max_chunk_tokens=CHUNK_MAX_TOKENS,
+                         overlap_words=CHUNK_OVERLAP_WORDS)
+
+_NON_WORD = re.compile(r'\W+')
+
+def question_key(mcq):
+    """Normalized question text, used to drop duplicates produced by overlapping chunks"""
+    return _NON_WORD.sub(' ', mcq['question'].lower()).strip()
+
+# Questions with embeddings at least this similar are collapsed (unset: exact matches only)
+QUESTION_DEDUP_THRESHOLD = threshold_from_env()
+
+def dedupe_mcqs(mcqs):
+    """Drop repeated questions; with QUESTION_DEDUP_THRESHOLD set, paraphrases too"""
+    with stage('dedupe'):
+        seen = set()
+        unique = []
+        for mcq in mcqs:
+            key = question_key(mcq)
+            if key not in seen:
+                seen.add(key)
+                unique.append(mcq)
+        if QUESTION_DEDUP_THRESHOLD is not None and len(unique) > 1:
+            from confidence_calculator import ConfidenceCalculator
+            unique = deduplicate_mcqs(unique, ConfidenceCalculator(), QUESTION_DEDUP_THRESHOLD)
+    return unique
+
+def generate_questions_from_text(text):
+    """
+    Generate MCQs from text using the Hugging Face API (or the local models).
+
+    Long passages are split into overlapping token-budgeted chunks that are
+    generated concurrently; their MCQs are merged in passage order and
+    deduplicated.
+    """
+    try:
+        if QG_BACKEND == 'local':
+            return generate_questions_locally(text)
+
+        with stage('chunk'):
+            chunks = chunk_text(text)
+        if len(chunks) <= 1:
+            return generate_questions_for_chunk(text)
+
+        with ThreadPoolExecutor(max_workers=max(1, CHUNK_CONCURRENCY)) as executor:
+            results = list(executor.map(
+                propagate(lambda chunk: generate_questions_for_chunk(chunk['text'], chunk['num_questions'])),
+                chunks
+            ))
+        return dedupe_mcqs([mcq for mcqs in results for mcq in mcqs])
+
+    except Exception as e:
+        print(f"Error generating questions: {str(e)}")
+        return []
+
+def generate_questions_for_chunk(text, num_questions=None):
+    """Generate MCQs for one chunk of text with a single upstream call"""
+    try:
+        # Calculate number of questions based on word count
+        if num_questions is None:
+            word_count = len(text.split())
+            num_questions = max(1, word_count // WORDS_PER_QUESTION)
+        
+        if DEMO_MODE:
+            # Return mock data for demo mode
+            return [
+                {
+                    'question': 'Who created the Python programming language?',
+                    'options': [
+                        'Guido van Rossum',
+                        'James Gosling',
+                        'Brendan Eich',
+                        'Larry Wall'
+                    ],
+                    'correct_answer': 'Guido van Rossum'
+                },
+                {
+                    'question': 'When was Python first released?',
+                    'options': [
+                        '1991',
+                        '1995',
+                        '1989',
+                        '1993'
+                    ],
+                    'correct_answer': '1991'
+                },
+                {
+                    'question': 'What is Python known for?',
+                    'options': [
+                        'Simplicity and readability',
+                        'Complex syntax',
+                        'Limited library support',
+                        'Mobile development only'
+                    ],
+                    'correct_answer': 'Simplicity and readability'
+                }
+            ]
+        
+        # Build the prompt
+        with stage('prompt'):
+            prompt = build_prompt(text, num_questions)
+        
+        # Prepare the payload for the API
+        payload = {
+            "inputs": prompt,
+            "parameters": GENERATION_PARAMETERS
+        }
+        if STREAM_UPSTREAM:
+            payload["stream"] = True
+        
+        # Make the API request (rate limited, with backoff on 429/503)
+        with stage('upstream'):
+            result = get_client().post(QUESTION_MODEL_URL, payload, headers=headers,
+                                       timeout=UPSTREAM_TIMEOUT, deadline=UPSTREAM_DEADLINE, stream=STREAM_UPSTREAM)
+            if STREAM_UPSTREAM:
+                # Questions are parsed as their tokens arrive, so parsing is part of the upstream wait
+                return list(iter_mcqs(result))
+        
+        # Salvage every well-formed question object from the generated text
+        with stage('parse'):
+            if isinstance(result, list) and result:
+                result = result[0]
+            generated_text = result.get('generated_text', '') if isinstance(result, dict) else str(result)
+            return parse_mcqs(generated_text)
+            
+    except Exception as e:
+        print(f"Error generating questions: {str(e)}")
+        return []
+
+def result_settings():
+    """Everything besides the passage and model that changes the MCQs generated, for result cache keys"""
+    return dict(GENERATION_PARAMETERS,
+                chunk_max_tokens=CHUNK_MAX_TOKENS,
+                chunk_overlap_words=CHUNK_OVERLAP_WORDS,
+                words_per_question=WORDS_PER_QUESTION,
+                question_dedup_threshold=QUESTION_DEDUP_THRESHOLD)
+
+def generate_questions_cached(text):
+    """Generate MCQs for text, reusing a recent result for the same passage and settings"""
+    key = make_key(text, model_id(), result_settings())
+    return result_cache.get_or_compute(key, lambda: generate_questions_from_text(text))
+
+def extract_and_index(pdf_path, filename, document_id, progress):
+    """
+    Page texts of a PDF, from its document index if this file was indexed before.
+
+    A new file is extracted and then indexed; indexing failures (e.g. the
+    embedding model is unavailable) are logged and do not fail the upload.
+    """
+    index = document_index.get(document_id)
+    if index is not None:
+        pages = index.pages()
+        progress('extract', len(pages), len(pages))
+        progress('index', index.meta['n_chunks'], index.meta['n_chunks'])
+        return pages
+
+    with stage('extract'):
+        total_pages = get_page_count(pdf_path)
+        pages = []
+        for page in iter_pdf_pages(pdf_path):
+            pages.append(page)
+            progress('extract', len(pages), total_pages)
+
+    try:
+        with stage('index'):
+            index = document_index.get_or_build(pdf_path, filename, pages=pages, document_id=document_id)
+        progress('index', index.meta['n_chunks'], index.meta['n_chunks'])
+    except Exception as e:
+        print(f"Error indexing {filename}: {str(e)}")
+        progress('index', 0, 0)
+    return pages
+
+def generate_for_pdf(pdf_path, filename, progress):
+    """Extract (or reuse), index and generate MCQs for a PDF, reporting per-stage progress"""
+    document_id = file_sha256(pdf_path)
+    pages = extract_and_index(pdf_path, filename, document_id, progress)
+
+    # Segments already generated (in any upload, e.g. the previous revision of
+    # this file) are reused; only new or edited segments are generated
+    progress('generate', 0, None)
+    mcqs, changes = process_document(
+        segment_store, document_id, filename, pages,
+        segment_key=lambda text: make_key(text, model_id(), result_settings()),
+        generate=generate_questions_cached,
+        progress=lambda done, total: progress('generate', done, total),
+        max_concurrency=CHUNK_CONCURRENCY,
+    )
+
+    if not mcqs:
+        raise Exception('Failed to generate questions from this PDF. Please try a different file.')
+    return {'document_id': document_id, 'mcqs': mcqs, 'changes': changes}
+
+def generate_questions_on_topic(document, topic, num_questions=10, k=None):
+    """
+    Generate MCQs about a topic from the relevant part of an indexed document.
+
+    The top-k chunks for the topic (by default enough for num_questions at the
+    150-200 words per question rule) are retrieved and generated from in
+    document order.
+
+    Returns:
+        tuple: (mcqs, sources), where sources describe the chunks used
+    """
+    if k is None:
+        k = max(1, math.ceil(num_questions * WORDS_PER_QUESTION / CHUNK_WORDS))
+    hits = document_index.search(document, topic, k)
+    hits.sort(key=lambda hit: hit['chunk'])
+    passage = '\n'.join(hit['text'] for hit in hits)
+    mcqs = generate_questions_cached(passage)[:num_questions] if passage else []
+    sources = [{key: hit[key] for key in ('chunk', 'first_page', 'last_page', 'score')} for hit in hits]
+    return mcqs, sources
+
+def iter_questions_from_text(text):
+    """
+    Generate MCQs for text chunk by chunk, yielding each chunk's MCQs as soon as it is done.
+
+    Yields:
+        tuple: (chunk_index, list of MCQs) in completion order; MCQs already
+        yielded for an earlier chunk are left out
+    """
+    passages = [chunk['text'] for chunk in chunk_text(text)]
+    executor = ThreadPoolExecutor(max_workers=max(1, CHUNK_CONCURRENCY))
+    seen = set()
+    try:
+        generate = propagate(generate_questions_cached)
+        futures = {executor.submit(generate, passage): i for i, passage in enumerate(passages)}
+        for future in as_completed(futures):
+            mcqs = []
+            for mcq in future.result():
+                key = question_key(mcq)
+                if key not in seen:
+                    seen.add(key)
+                    mcqs.append(mcq)
+            yield futures[future], mcqs
+    finally:
+        # Stop queued chunks if the client went away
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,249 @@
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def normalize_passage(text):
+    """Collapse whitespace so resubmissions of the same passage share a key"""
+    return ' '.join(text.split())
+
+
+def make_key(content, model_url, parameters=None):
+    """
+    Build a cache key from the input content, the model and its generation parameters.
+
+    Args:
+        content (str or bytes): Passage text (normalized before hashing) or raw file bytes
+        model_url (str): Inference endpoint that produces the result
+        parameters (dict): Generation parameters and other settings that affect the result
+    """
+    if isinstance(content, str):
+        content = normalize_passage(content).encode('utf-8')
+    digest = hashlib.sha256()
+    digest.update(content)
+    digest.update(b'\0')
+    digest.update(model_url.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(parameters or {}, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class MemoryBackend:
+    """
+    In-process LRU with per-entry expiry.
+
+    Values are kept JSON-encoded, like in the other backends, so every get
+    returns a fresh copy that callers may modify freely.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return json.loads(value)
+
+    def set(self, key, value, ttl):
+        value = json.dumps(value)
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+class SQLiteBackend:
+    """
+    SQLite-file cache shared by every process on the host.
+
+    Entries expire after their TTL; when the table grows past max_entries the
+    least recently read entries are evicted.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.evictions = 0
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS results (
+                                key TEXT PRIMARY KEY,
+                                value TEXT NOT NULL,
+                                expires_at REAL NOT NULL,
+                                last_access REAL NOT NULL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)')
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per operation keeps this safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM results WHERE key = ? AND expires_at > ?', (key, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE results SET last_access = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO results (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)',
+                         (key, json.dumps(value), now + ttl, now))
+            conn.execute('DELETE FROM results WHERE expires_at <= ?', (now,))
+            excess = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute('''DELETE FROM results WHERE key IN (
+                                    SELECT key FROM results ORDER BY last_access LIMIT ?)''', (excess,))
+                self.evictions += excess
+
+
+class RedisBackend:
+    """
+    Cache in any Redis-protocol server (Redis, Valkey, KeyDB, ...).
+
+    Expiry uses native key TTLs; size-bounded eviction is left to the server's
+    maxmemory policy (e.g. allkeys-lru).
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='eduquery:result:'):
+        try:
+            import redis
+        except ImportError:
+            raise Exception("The redis result cache backend requires the 'redis' package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+
+class ResultCache:
+    """
+    TTL result cache with request coalescing.
+
+    get_or_compute() runs the computation at most once per key at a time in this
+    process: concurrent callers with the same key wait for the first caller's
+    result instead of making their own upstream call.
+    """
+
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key, or compute, cache and return it.
+
+        Falsy results (e.g. an empty MCQ list after a failed generation) are
+        returned but not cached.
+        """
+        value = self.backend.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = {'done': threading.Event(), 'value': None, 'error': None}
+                self._in_flight[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight['done'].wait()
+            if flight['error'] is not None:
+                raise flight['error']
+            # The leader's caller owns its value
+            return copy.deepcopy(flight['value'])
+
+        try:
+            value = compute()
+            if value:
+                self.backend.set(key, value, self.ttl)
+            flight['value'] = value
+            return value
+        except Exception as e:
+            flight['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight['done'].set()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.backend.evictions,
+                'hit_ratio': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+
+
+def create_result_cache():
+    """
+    Build the result cache from environment settings.
+
+    RESULT_CACHE_BACKEND: 'memory' (default), 'sqlite' or 'redis'
+    RESULT_CACHE_TTL: Seconds an entry stays valid (default 3600)
+    RESULT_CACHE_MAX_ENTRIES: Size bound for the memory and sqlite backends
+    RESULT_CACHE_PATH: SQLite file path
+    RESULT_CACHE_URL: Redis URL
+    """
+    backend_name = os.getenv('RESULT_CACHE_BACKEND', 'memory').lower()
+    ttl = float(os.getenv('RESULT_CACHE_TTL', '3600'))
+    max_entries = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '1024'))
+    if backend_name == 'sqlite':
+        default_path = Path(__file__).parent.parent / 'cache' / 'results.sqlite3'
+        backend = SQLiteBackend(os.getenv('RESULT_CACHE_PATH', default_path), max_entries=max_entries)
+    elif backend_name == 'redis':
+        backend = RedisBackend(os.getenv('RESULT_CACHE_URL', 'redis://localhost:6379/0'))
+    elif backend_name == 'memory':
+        backend = MemoryBackend(max_entries=max_entries)
+    else:
+        raise Exception(f"Unknown RESULT_CACHE_BACKEND '{backend_name}'. Use memory, sqlite or redis.")
+    return ResultCache(backend, ttl=ttl)
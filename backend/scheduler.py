@@ -0,0 +1,410 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+from flask import jsonify, make_response
+
+from admission import Rejected, rejection_response
+from metrics import registry, stage
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+# Window over which a tenant's token quota is counted
+QUOTA_WINDOW_SECONDS = 3600
+# Finished tasks are kept this long (at least the quota window), then purged
+RETAIN_SECONDS = 24 * 3600
+
+QUEUE_WAIT_SECONDS = registry.histogram('eduquery_queue_wait_seconds',
+                                        'Time tasks spent queued in the fair-share scheduler', ('kind',))
+QUOTA_REJECTED = registry.counter('eduquery_quota_rejected_total',
+                                  'Tasks refused because their tenant used up its token quota', ('kind',))
+
+
+class QuotaExceeded(Exception):
+    """A tenant has used its token quota for the current window"""
+
+    def __init__(self, tenant, retry_after):
+        super().__init__(f"Tenant {tenant} is over its token quota; retry after {retry_after}s")
+        self.tenant = tenant
+        self.retry_after = retry_after
+
+
+def parse_weights(value):
+    """'tenant-a=2,tenant-b=0.5' -> {'tenant-a': 2.0, 'tenant-b': 0.5}"""
+    weights = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            tenant, weight = item.split('=', 1)
+            weights[tenant.strip()] = float(weight)
+    return weights
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class FairScheduler:
+    """
+    Weighted fair-share scheduler over a persistent SQLite task queue.
+
+    Every task belongs to a tenant and is either interactive (a request
+    waiting for its answer) or bulk (a background job). Tasks are ordered by
+    start-time fair queuing: each tenant's tasks get virtual start times
+    spaced by cost / weight, so a tenant that queued a whole book waits its
+    turn behind other tenants' smaller work instead of ahead of it.
+    Interactive tasks always go before bulk ones, and bulk tasks never take
+    the last interactive_reserve slots. Each kind keeps its own virtual
+    clocks, so queuing a book does not push back its tenant's requests.
+
+    Limits hold across all processes sharing the database: capacity running
+    tasks in total, tenant_concurrency per tenant for each kind (so a tenant's
+    jobs never queue its requests), and optionally
+    tenant_tokens_per_hour of submitted cost per tenant. Bulk tasks name a
+    registered handler and carry a JSON payload, so tasks still queued when
+    a process stops are picked up by the next one. Failed and cancelled
+    tasks do not count against the quota.
+
+    Waiting requests poll the queue (starting every poll_interval seconds and
+    backing off to max_poll_interval) with plain reads, and only lock the
+    database to claim a slot once the schedule says they can have one.
+    """
+
+    def __init__(self, path, capacity=8, interactive_reserve=2, tenant_concurrency=4,
+                 tenant_tokens_per_hour=None, weights=None, poll_interval=0.05, max_poll_interval=0.5):
+        self.path = str(path)
+        self.capacity = max(1, capacity)
+        self.interactive_reserve = min(max(0, interactive_reserve), self.capacity - 1)
+        self.tenant_concurrency = max(1, tenant_concurrency)
+        self.tenant_tokens_per_hour = tenant_tokens_per_hour
+        self.weights = weights or {}
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(poll_interval, max_poll_interval)
+        self._handlers = {}
+        self._workers_pid = None
+        self._workers_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+        finally:
+            conn.close()
+        with self._transaction() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS tasks (
+                                id TEXT PRIMARY KEY,
+                                tenant TEXT NOT NULL,
+                                kind TEXT NOT NULL,
+                                handler TEXT,
+                                payload TEXT,
+                                cost INTEGER NOT NULL,
+                                virtual_start REAL NOT NULL,
+                                status TEXT NOT NULL,
+                                owner INTEGER,
+                                error TEXT,
+                                enqueued_at REAL NOT NULL,
+                                started_at REAL,
+                                finished_at REAL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, kind, virtual_start)')
+            conn.execute('CREATE INDEX IF NOT EXISTS tasks_tenant ON tasks (tenant, enqueued_at)')
+            # Virtual clock per tenant and kind ('tenant:kind')
+            conn.execute('CREATE TABLE IF NOT EXISTS tenants (tenant TEXT PRIMARY KEY, virtual_time REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)')
+        self.recover()
+
+    @contextmanager
+    def _transaction(self):
+        # A short-lived connection per operation keeps this safe across threads and processes;
+        # BEGIN IMMEDIATE serializes claims so two processes never take the same slot
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _read(self):
+        # Readers see a consistent snapshot without taking the write lock
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN')
+            try:
+                yield conn
+            finally:
+                conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def _notify(self):
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _wait(self, seconds):
+        with self._wakeup:
+            self._wakeup.wait(seconds)
+
+    def submit(self, tenant, kind, cost, handler=None, payload=None, task_id=None):
+        """
+        Queue a task.
+
+        Args:
+            tenant (str): Who the work is for
+            kind (str): INTERACTIVE or BULK
+            cost (int): Estimated tokens, used for fair sharing and the quota
+            handler (str): For bulk tasks, the registered handler that runs it
+            payload: JSON-serializable arguments for the handler
+
+        Raises:
+            QuotaExceeded: If the tenant's token quota would be exceeded
+        """
+        task_id = task_id or uuid.uuid4().hex
+        cost = max(1, int(cost))
+        now = time.time()
+        with self._transaction() as conn:
+            if self.tenant_tokens_per_hour is not None:
+                used, oldest = conn.execute('''SELECT COALESCE(SUM(cost), 0), MIN(enqueued_at) FROM tasks
+                                               WHERE tenant = ? AND enqueued_at > ?
+                                                 AND status NOT IN ('cancelled', 'failed')''',
+                                            (tenant, now - QUOTA_WINDOW_SECONDS)).fetchone()
+                if used + cost > self.tenant_tokens_per_hour:
+                    QUOTA_REJECTED.inc(kind=kind)
+                    retry_after = int((oldest or now) + QUOTA_WINDOW_SECONDS - now) + 1
+                    raise QuotaExceeded(tenant, retry_after)
+
+            row = conn.execute('SELECT value FROM meta WHERE key = ?', (f'virtual_time:{kind}',)).fetchone()
+            global_time = row[0] if row else 0.0
+            clock = f'{tenant}:{kind}'
+            row = conn.execute('SELECT virtual_time FROM tenants WHERE tenant = ?', (clock,)).fetchone()
+            virtual_start = max(row[0] if row else 0.0, global_time)
+            conn.execute('INSERT OR REPLACE INTO tenants (tenant, virtual_time) VALUES (?, ?)',
+                         (clock, virtual_start + cost / self.weights.get(tenant, 1.0)))
+            conn.execute('''INSERT INTO tasks (id, tenant, kind, handler, payload, cost, virtual_start, status, owner,
+                                               enqueued_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?)''',
+                         (task_id, tenant, kind, handler, json.dumps(payload), cost, virtual_start,
+                          os.getpid() if kind == INTERACTIVE else None, now))
+        self._notify()
+        return task_id
+
+    def _next(self, conn, wanted):
+        """
+        The first task accepted by wanted(row) if the schedule lets it run now, else None.
+
+        Queued tasks are walked in schedule order, simulating what free slots
+        would go to; a task is claimable only if it falls within those slots.
+        """
+        running = conn.execute("SELECT tenant, kind FROM tasks WHERE status = 'running'").fetchall()
+        free = self.capacity - len(running)
+        if free <= 0:
+            return None
+        # Counted per class, so a tenant's running jobs do not hold back its requests
+        per_tenant = {}
+        for row in running:
+            key = (row['tenant'], row['kind'])
+            per_tenant[key] = per_tenant.get(key, 0) + 1
+        bulk_running = sum(row['kind'] == BULK for row in running)
+
+        rows = conn.execute('''SELECT id, tenant, kind, handler, payload, cost, virtual_start, enqueued_at
+                               FROM tasks WHERE status = 'queued'
+                               ORDER BY kind = 'bulk', virtual_start, enqueued_at''')
+        for row in rows:
+            key = (row['tenant'], row['kind'])
+            if per_tenant.get(key, 0) >= self.tenant_concurrency:
+                continue
+            if row['kind'] == BULK and bulk_running >= self.capacity - self.interactive_reserve:
+                continue
+            if wanted(row):
+                return dict(row)
+            # Someone else's task gets this slot
+            per_tenant[key] = per_tenant.get(key, 0) + 1
+            bulk_running += row['kind'] == BULK
+            free -= 1
+            if free <= 0:
+                return None
+        return None
+
+    def _claim(self, wanted):
+        """Start the first task accepted by wanted(row) if the schedule lets it run now"""
+        # Check with a plain read first; most polls find nothing to claim
+        with self._read() as conn:
+            if self._next(conn, wanted) is None:
+                return None
+        with self._transaction() as conn:
+            task = self._next(conn, wanted)
+            if task is None:
+                return None
+            now = time.time()
+            conn.execute("UPDATE tasks SET status = 'running', owner = ?, started_at = ? WHERE id = ?",
+                         (os.getpid(), now, task['id']))
+            key = f"virtual_time:{task['kind']}"
+            conn.execute('''INSERT OR REPLACE INTO meta (key, value)
+                            VALUES (?, MAX(COALESCE((SELECT value FROM meta WHERE key = ?), 0), ?))''',
+                         (key, key, task['virtual_start']))
+        QUEUE_WAIT_SECONDS.observe(now - task['enqueued_at'], kind=task['kind'])
+        return task
+
+    def acquire(self, tenant, cost, timeout):
+        """
+        Queue an interactive task and wait until it is scheduled to run.
+
+        Returns:
+            str: Task id, to pass to release() when done
+
+        Raises:
+            QuotaExceeded: If the tenant's token quota would be exceeded
+            Rejected: With 503 if the task was not scheduled within timeout seconds
+        """
+        task_id = self.submit(tenant, INTERACTIVE, cost)
+        deadline = time.monotonic() + timeout
+        interval = self.poll_interval
+        with stage('queue_wait'):
+            while True:
+                if self._claim(lambda row: row['id'] == task_id):
+                    return task_id
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Releases in this process wake waiters at once; the backoff only
+                # bounds how often other processes' releases are looked for
+                self._wait(min(interval, remaining))
+                interval = min(interval * 2, self.max_poll_interval)
+            with self._transaction() as conn:
+                conn.execute("UPDATE tasks SET status = 'cancelled', finished_at = ? WHERE id = ?",
+                             (time.time(), task_id))
+                queued = conn.execute("SELECT COUNT(*) FROM tasks WHERE status = 'queued'").fetchone()[0]
+        raise Rejected(503, max(1, min(120, int(timeout * (1 + queued / self.capacity)))))
+
+    def release(self, task_id, error=None):
+        """Mark a running task finished (failed if error is given) and free its slot"""
+        with self._transaction() as conn:
+            conn.execute('UPDATE tasks SET status = ?, error = ?, finished_at = ? WHERE id = ?',
+                         ('failed' if error else 'done', error, time.time(), task_id))
+        self._notify()
+
+    def register(self, handler, fn):
+        """Run bulk tasks naming handler with fn(task_id, payload)"""
+        self._handlers[handler] = fn
+
+    def start_workers(self, count):
+        """Start count threads running bulk tasks in this process (again after a fork)"""
+        with self._workers_lock:
+            if self._workers_pid == os.getpid():
+                return
+            self._workers_pid = os.getpid()
+            for i in range(count):
+                threading.Thread(target=self._work, name=f'scheduler-{i}', daemon=True).start()
+
+    def _work(self):
+        last_recovery = time.monotonic()
+        while True:
+            if time.monotonic() - last_recovery > 30:
+                last_recovery = time.monotonic()
+                self.recover()
+            task = self._claim(lambda row: row['kind'] == BULK and row['handler'] in self._handlers)
+            if task is None:
+                self._wait(self.poll_interval * 10)
+                continue
+            try:
+                self._handlers[task['handler']](task['id'], json.loads(task['payload']))
+            except Exception as e:
+                print(f"Task {task['id']} failed: {str(e)}")
+                self.release(task['id'], error=str(e))
+            else:
+                self.release(task['id'])
+
+    def recover(self):
+        """
+        Clean up after processes that died mid-task.
+
+        Their bulk tasks are queued again; their interactive tasks (whose
+        requests are gone) are cancelled. Old finished tasks are purged.
+        """
+        with self._transaction() as conn:
+            rows = conn.execute('''SELECT id, kind, owner FROM tasks
+                                   WHERE owner IS NOT NULL AND status IN ('queued', 'running')''').fetchall()
+            for row in rows:
+                if _pid_alive(row['owner']):
+                    continue
+                if row['kind'] == BULK:
+                    conn.execute("UPDATE tasks SET status = 'queued', owner = NULL, started_at = NULL WHERE id = ?",
+                                 (row['id'],))
+                else:
+                    conn.execute("UPDATE tasks SET status = 'cancelled', finished_at = ? WHERE id = ?",
+                                 (time.time(), row['id']))
+            conn.execute("DELETE FROM tasks WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+                         (time.time() - max(RETAIN_SECONDS, QUOTA_WINDOW_SECONDS),))
+
+    def get(self, task_id):
+        """Task state with its queue wait so far (or in total, once started), or None"""
+        with self._read() as conn:
+            row = conn.execute('SELECT * FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        if row is None:
+            return None
+        task = dict(row)
+        task['queue_wait_s'] = round((task['started_at'] or time.time()) - task['enqueued_at'], 3)
+        return task
+
+    def stats(self):
+        """Queued and running tasks per kind, across every process using the queue"""
+        counts = {kind: {'queued': 0, 'running': 0} for kind in (INTERACTIVE, BULK)}
+        with self._read() as conn:
+            for kind, status, count in conn.execute('''SELECT kind, status, COUNT(*) FROM tasks
+                                                       WHERE status IN ('queued', 'running')
+                                                       GROUP BY kind, status'''):
+                counts[kind][status] = count
+        return counts
+
+
+def quota_response(exceeded):
+    response = jsonify({'error': 'You have used your question generation quota for now. Please try again later.'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(exceeded.retry_after)
+    return response
+
+
+def scheduled(scheduler, tenant_of, cost_of, timeout):
+    """
+    Route decorator: run the view as an interactive task of the caller's tenant.
+
+    tenant_of() and cost_of() read the current request. The task holds its
+    slot until the response is closed, so streamed responses keep it while
+    streaming.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                task_id = scheduler.acquire(tenant_of(), cost_of(), timeout)
+            except QuotaExceeded as e:
+                return quota_response(e)
+            except Rejected as e:
+                return rejection_response(e)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException as e:
+                scheduler.release(task_id, error=str(e) or type(e).__name__)
+                raise
+            response.call_on_close(lambda: scheduler.release(task_id))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,172 @@
+import os
+import sys
+import threading
+import time
+
+
+class _TimedLoader:
+    """Wraps a module's loader to time executing the module (including the imports it makes)"""
+
+    def __init__(self, loader, profile):
+        self._loader = loader
+        self._profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # The module only ever sees its real loader
+        module.__spec__.loader = module.__loader__ = self._loader
+        self._profile._enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profile._exit(module.__spec__.name)
+
+
+class ImportProfile:
+    """
+    Import time per module of this process's startup.
+
+    While running, it sits first on sys.meta_path and times how long each newly
+    imported module takes to execute: cumulative (with the modules it imports
+    in turn) and self (without them), like python -X importtime but readable
+    from inside the running service. Only imports between start() and stop()
+    are timed; modules imported before start() are not seen at all.
+    """
+
+    def __init__(self):
+        self.started = None
+        self.finished = None
+        self._modules = {}
+        # [start time, seconds spent in nested imports] per module being executed
+        self._stack = []
+        self._finding = threading.local()
+
+    @classmethod
+    def start(cls) -> 'ImportProfile':
+        profile = cls()
+        profile.started = time.perf_counter()
+        sys.meta_path.insert(0, profile)
+        return profile
+
+    def stop(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+        self.finished = time.perf_counter()
+
+    def find_spec(self, fullname, path=None, target=None):
+        # Ask the finders behind this one, then wrap the loader they found
+        if getattr(self._finding, 'active', False) or threading.current_thread() is not threading.main_thread():
+            return None
+        self._finding.active = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._finding.active = False
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def _enter(self):
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def _exit(self, name):
+        started, nested = self._stack.pop()
+        seconds = time.perf_counter() - started
+        if self._stack:
+            self._stack[-1][1] += seconds
+        self._modules[name] = (seconds, seconds - nested)
+
+    @property
+    def total_seconds(self) -> float:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    def report(self, top: int = 25):
+        """
+        Total startup time and the slowest modules.
+
+        Returns:
+            dict: total_seconds, modules_imported, and the top modules by
+            cumulative import time with their self time
+        """
+        slowest = sorted(self._modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        return {
+            'total_seconds': round(self.total_seconds, 4),
+            'modules_imported': len(self._modules),
+            'modules': [{'module': name, 'seconds': round(seconds, 4), 'self_seconds': round(self_seconds, 4)}
+                        for name, (seconds, self_seconds) in slowest],
+        }
+
+    def summary(self, top: int = 5) -> str:
+        """One line for the startup log"""
+        slowest = ', '.join(f"{module['module']} {module['seconds'] * 1000:.0f}ms"
+                            for module in self.report(top)['modules'])
+        return f"Imported in {self.total_seconds:.2f}s; slowest: {slowest}"
+
+
+class Warmup:
+    """
+    Loads models in a background thread, so a process can serve while they load.
+
+    Tasks run one after another in the order they were added, once per
+    process (call start() again after a fork). The process counts as ready
+    once every task has finished; a task that fails only leaves its model to
+    be loaded on first use (or a fallback to be used), so it does not keep
+    the process unready. With enabled=False nothing is loaded up front and
+    the process is ready at once.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._tasks = []
+        self._state = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, load):
+        """Register load() (which loads one model) to run in the background under name"""
+        self._tasks.append((name, load))
+        self._state[name] = {'status': 'pending' if self.enabled else 'skipped'}
+
+    def start(self):
+        """Start loading in this process (a no-op once started here, or when disabled)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for name in self._state:
+                self._state[name] = {'status': 'pending'}
+        threading.Thread(target=self._run, name='warmup', daemon=True).start()
+
+    def _run(self):
+        for name, load in self._tasks:
+            self._state[name] = {'status': 'loading'}
+            started = time.perf_counter()
+            try:
+                load()
+            except Exception as e:
+                print(f"Warm-up of {name} failed: {str(e)}")
+                self._state[name] = {'status': 'failed', 'error': str(e)}
+            else:
+                self._state[name] = {'status': 'ready', 'seconds': round(time.perf_counter() - started, 3)}
+
+    @property
+    def ready(self) -> bool:
+        return all(state['status'] in ('ready', 'failed', 'skipped') for state in self._state.values())
+
+    def stats(self):
+        return {'ready': self.ready, 'models': {name: dict(state) for name, state in self._state.items()}}
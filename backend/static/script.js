@@ -2,6 +2,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // DOM Elements
     const uploadForm = document.getElementById('uploadForm');
     const loadingElement = document.getElementById('loading');
+    const loadingMessage = document.getElementById('loading-message');
     const errorElement = document.getElementById('error');
     const questionsElement = document.getElementById('questions');
     const topicTagsElement = document.getElementById('topic-tags');
@@ -168,30 +169,18 @@ document.addEventListener('DOMContentLoaded', function() {
         fileInput.disabled = true;
         textInput.disabled = true;
         
-        // Send request to server with timeout
-        const controller = new AbortController();
-        const timeoutId = setTimeout(() => controller.abort(), 30000); // 30 second timeout
+        let generation;
+        if (formData.has('file')) {
+            generation = uploadFile(formData);
+        } else {
+            // Text is streamed so questions appear as soon as they are generated
+            generation = streamQuestions(formData.get('text'));
+        }
         
-        fetch('/upload', {
-            method: 'POST',
-            body: formData,
-            signal: controller.signal
-        })
-        .then(response => {
-            clearTimeout(timeoutId);
-            if (!response.ok) {
-                return response.json().then(data => {
-                    throw new Error(data.error || 'Server error occurred');
-                });
-            }
-            return response.json();
-        })
+        generation
         .then(data => {
             loadingElement.style.display = 'none';
-            
-            if (data.error) {
-                throw new Error(data.error);
-            }
+            loadingMessage.textContent = 'Generating questions...';
             
             if (!data.mcqs || data.mcqs.length === 0) {
                 throw new Error('No questions could be generated. Please try with different text.');
@@ -203,11 +192,13 @@ document.addEventListener('DOMContentLoaded', function() {
             // Extract topics from questions
             extractTopicsFromQuestions(mcqs);
             
-            // Display questions
-            displayQuestions(mcqs);
-            
-            // Scroll to questions
-            document.getElementById('questions-container').scrollIntoView({ behavior: 'smooth' });
+            // Display questions (streamed questions are already on the page)
+            if (!data.streamed) {
+                displayQuestions(mcqs);
+                
+                // Scroll to questions
+                document.getElementById('questions-container').scrollIntoView({ behavior: 'smooth' });
+            }
             
             // Reset form
             if (pdfButton.classList.contains('active')) {
@@ -218,6 +209,7 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .catch(error => {
             loadingElement.style.display = 'none';
+            loadingMessage.textContent = 'Generating questions...';
             if (error.name === 'AbortError') {
                 showError('Request timed out. Please try again.');
             } else {
@@ -233,6 +225,143 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Upload a PDF; it is processed as a background job that we poll
+    function uploadFile(formData) {
+        // Send request to server with timeout
+        const controller = new AbortController();
+        const timeoutId = setTimeout(() => controller.abort(), 30000); // 30 second timeout
+        
+        return fetch('/upload', {
+            method: 'POST',
+            body: formData,
+            signal: controller.signal
+        })
+        .then(response => {
+            clearTimeout(timeoutId);
+            if (!response.ok) {
+                return response.json().then(data => {
+                    throw new Error(data.error || 'Server error occurred');
+                });
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            
+            // PDF uploads run as a background job; poll until it finishes
+            if (data.job_id) {
+                return pollJob(data.status_url);
+            }
+            return data;
+        });
+    }
+
+    // Stream MCQs from the server (Server-Sent Events) and render each as it arrives
+    function streamQuestions(text) {
+        mcqs = [];
+        let failure = null;
+        
+        function handleEvent(rawEvent) {
+            let eventName = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (!data) {
+                return;
+            }
+            const payload = JSON.parse(data);
+            if (eventName === 'mcq') {
+                mcqs.push(payload);
+                appendQuestion(payload, mcqs.length - 1);
+                if (mcqs.length === 1) {
+                    document.getElementById('questions-container').scrollIntoView({ behavior: 'smooth' });
+                }
+                loadingMessage.textContent = `Generating questions... (${mcqs.length} ready)`;
+            } else if (eventName === 'error') {
+                failure = payload.error;
+            }
+        }
+        
+        return fetch('/generate/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ passage: text })
+        })
+        .then(response => {
+            if (!response.ok) {
+                return response.json().then(data => {
+                    throw new Error(data.error || 'Server error occurred');
+                });
+            }
+            
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            
+            function read() {
+                return reader.read().then(({ done, value }) => {
+                    if (value) {
+                        buffer += decoder.decode(value, { stream: true });
+                    }
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                        handleEvent(buffer.slice(0, boundary));
+                        buffer = buffer.slice(boundary + 2);
+                    }
+                    if (done) {
+                        if (failure && mcqs.length === 0) {
+                            throw new Error(failure);
+                        }
+                        return { mcqs: mcqs, streamed: true };
+                    }
+                    return read();
+                });
+            }
+            return read();
+        });
+    }
+
+    // Poll a background job until it is done, showing per-stage progress
+    function pollJob(statusUrl) {
+        return fetch(statusUrl)
+            .then(response => response.json().then(data => {
+                if (!response.ok || data.status === 'failed') {
+                    throw new Error(data.error || 'Processing the PDF failed');
+                }
+                return data;
+            }))
+            .then(data => {
+                if (data.status === 'done') {
+                    return data;
+                }
+                loadingMessage.textContent = describeProgress(data.stages);
+                return new Promise(resolve => setTimeout(resolve, 1000))
+                    .then(() => pollJob(statusUrl));
+            });
+    }
+
+    function describeProgress(stages) {
+        const generate = stages.generate || {};
+        const extract = stages.extract || {};
+        if (generate.total) {
+            return `Generating questions... (passage ${generate.done} of ${generate.total})`;
+        }
+        if (extract.total && extract.done === extract.total) {
+            return 'Indexing document...';
+        }
+        if (extract.total) {
+            return `Extracting text... (page ${extract.done} of ${extract.total})`;
+        }
+        return 'Processing PDF...';
+    }
+
     // Extract topics from questions
     function extractTopicsFromQuestions(mcqs) {
         currentTopics = [];
@@ -322,52 +451,53 @@ document.addEventListener('DOMContentLoaded', function() {
 
     function displayQuestions(mcqs) {
         questionsElement.innerHTML = '';
+        mcqs.forEach((mcq, index) => appendQuestion(mcq, index));
+    }
+
+    function appendQuestion(mcq, index) {
+        const questionDiv = document.createElement('div');
+        questionDiv.className = 'mcq-container';
+        questionDiv.id = `question-${index}`;
         
-        mcqs.forEach((mcq, index) => {
-            const questionDiv = document.createElement('div');
-            questionDiv.className = 'mcq-container';
-            questionDiv.id = `question-${index}`;
-            
-            questionDiv.innerHTML = `
-                <div class="question">${mcq.question}</div>
-                <div class="options">
-                    ${mcq.options.map((option, i) => `
-                        <div class="option" data-index="${i}">
-                            <input type="radio" name="q${index}" value="${i}" id="q${index}o${i}">
-                            <label for="q${index}o${i}">${option}</label>
-                        </div>
-                    `).join('')}
-                </div>
-                <button class="btn btn-primary check-answer" data-question="${index}">Check Answer</button>
-                <div class="result-message" style="display: none;"></div>
-            `;
-            
-            questionsElement.appendChild(questionDiv);
-            
-            // Add click handler for the entire option row with visual feedback
-            const optionDivs = questionDiv.querySelectorAll('.option');
-            optionDivs.forEach(optionDiv => {
-                optionDiv.addEventListener('click', function(e) {
-                    // Clear previous selections in this question
-                    optionDivs.forEach(div => div.classList.remove('selected'));
-                    // Select this option
-                    const radio = this.querySelector('input[type="radio"]');
-                    radio.checked = true;
-                    this.classList.add('selected');
-                });
-            });
-            
-            // Add click handler for the check answer button
-            const checkButton = questionDiv.querySelector('.check-answer');
-            checkButton.addEventListener('click', function() {
-                const selectedOption = questionDiv.querySelector('input[type="radio"]:checked');
-                if (!selectedOption) {
-                    showError('Please select an answer');
-                    return;
-                }
-                checkAnswer(index, parseInt(selectedOption.value));
+        questionDiv.innerHTML = `
+            <div class="question">${mcq.question}</div>
+            <div class="options">
+                ${mcq.options.map((option, i) => `
+                    <div class="option" data-index="${i}">
+                        <input type="radio" name="q${index}" value="${i}" id="q${index}o${i}">
+                        <label for="q${index}o${i}">${option}</label>
+                    </div>
+                `).join('')}
+            </div>
+            <button class="btn btn-primary check-answer" data-question="${index}">Check Answer</button>
+            <div class="result-message" style="display: none;"></div>
+        `;
+        
+        questionsElement.appendChild(questionDiv);
+        
+        // Add click handler for the entire option row with visual feedback
+        const optionDivs = questionDiv.querySelectorAll('.option');
+        optionDivs.forEach(optionDiv => {
+            optionDiv.addEventListener('click', function(e) {
+                // Clear previous selections in this question
+                optionDivs.forEach(div => div.classList.remove('selected'));
+                // Select this option
+                const radio = this.querySelector('input[type="radio"]');
+                radio.checked = true;
+                this.classList.add('selected');
             });
         });
+        
+        // Add click handler for the check answer button
+        const checkButton = questionDiv.querySelector('.check-answer');
+        checkButton.addEventListener('click', function() {
+            const selectedOption = questionDiv.querySelector('input[type="radio"]:checked');
+            if (!selectedOption) {
+                showError('Please select an answer');
+                return;
+            }
+            checkAnswer(index, parseInt(selectedOption.value));
+        });
     }
 
     function showError(message) {
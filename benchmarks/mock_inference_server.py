@@ -0,0 +1,207 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Payload shapes the hosted API has been seen to return for text generation
+PAYLOAD_SHAPES = ('list', 'dict', 'string_list')
+
+
+def _mcq_json(prompt):
+    """A JSON MCQ block like the one build_prompt asks gpt2 for"""
+    match = re.search(r'Generate (\d+) question', prompt)
+    count = int(match.group(1)) if match else 1
+    passage_words = prompt.split()[8:40] or ['passage']
+    questions = []
+    for i in range(count):
+        word = passage_words[i % len(passage_words)].strip('.,;:')
+        questions.append({
+            'question': f"Question {i + 1}: what does the passage say about {word}?",
+            'options': [f"A. {word} option {j}" for j in range(1, 5)],
+            'answer': 'ABCD'[i % 4],
+        })
+    return json.dumps({'questions': questions})
+
+
+def generate_text(inputs, echo_prompt=False):
+    """Deterministic stand-in output for each prompt type the app sends"""
+    if inputs.startswith('generate question:'):
+        context = inputs.split('<hl>')[1].strip() if '<hl>' in inputs else inputs
+        return f"What is meant by {' '.join(context.split()[:6])}?"
+    if inputs.startswith('answer:'):
+        context = inputs.split('context:', 1)[-1].split()
+        return ' '.join(context[:8]) or 'the answer from the context'
+    if 'multiple choice questions' in inputs:
+        # The hosted text generation API echoes the prompt before the continuation
+        # unless return_full_text is false
+        return (inputs + '\n' if echo_prompt else '') + _mcq_json(inputs)
+    return inputs[:64]
+
+
+class MockInferenceServer:
+    """
+    Local stand-in for the Hugging Face inference API.
+
+    Every POST sleeps for the configured latency (plus uniform jitter), then
+    either fails with an injected 429 (with Retry-After) or 503 (model
+    loading), or returns generated text in the configured payload shape.
+    With echo_prompt, text generation output starts with the prompt, as the
+    hosted API returns it by default. A payload with "stream": true gets the
+    text back as server-sent token events, spread over the latency.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05, jitter=0.0,
+                 rate_429=0.0, rate_503=0.0, retry_after=0.1, payload_shape='list', echo_prompt=False,
+                 seed=None):
+        if payload_shape not in PAYLOAD_SHAPES:
+            raise ValueError(f"payload_shape must be one of {PAYLOAD_SHAPES}")
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.rate_503 = rate_503
+        self.retry_after = retry_after
+        self.payload_shape = payload_shape
+        self.echo_prompt = echo_prompt
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def model_url(self, model_name):
+        return f"{self.url}/models/{model_name}"
+
+    def _count(self, status):
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def reset_counts(self):
+        with self._lock:
+            self.counts = {}
+
+    def _decide(self):
+        """Pick this request's delay and injected status (None for success)"""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            roll = self._random.random()
+        if roll < self.rate_429:
+            return delay, 429
+        if roll < self.rate_429 + self.rate_503:
+            return delay, 503
+        return delay, None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                server._count(status)
+
+            def _send_stream(self, text, duration):
+                """Stream text as token events, like the text generation API with stream=true"""
+                tokens = re.findall(r'\s*\S+', text) or ['']
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    event = {'token': {'id': i, 'text': token, 'special': False}, 'generated_text': None}
+                    data = f"data: {json.dumps(event)}\n\n".encode('utf-8')
+                    self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                    self.wfile.flush()
+                    time.sleep(duration / len(tokens))
+                self.wfile.write(b"0\r\n\r\n")
+                server._count(200)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self._send(400, {'error': 'Invalid JSON'})
+
+                delay, injected = server._decide()
+                streaming = bool(payload.get('stream')) and injected is None
+                # A stream's first token arrives quickly; the rest of the latency is spread over its tokens
+                time.sleep(delay * 0.1 if streaming else delay)
+                if injected == 429:
+                    return self._send(429, {'error': 'Rate limit reached'},
+                                      {'Retry-After': f"{server.retry_after:g}"})
+                if injected == 503:
+                    return self._send(503, {'error': 'Model is currently loading', 'estimated_time': server.retry_after})
+
+                text = generate_text(str(payload.get('inputs', '')), server.echo_prompt)
+                if streaming:
+                    return self._send_stream(text, delay * 0.9)
+                if server.payload_shape == 'dict':
+                    body = {'generated_text': text}
+                elif server.payload_shape == 'string_list':
+                    body = [text]
+                else:
+                    body = [{'generated_text': text}]
+                self._send(200, body)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-inference', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve mock Hugging Face inference responses.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--rate-503', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--shape', choices=PAYLOAD_SHAPES, default='list')
+    parser.add_argument('--echo-prompt', action='store_true', help='Prefix generated text with the prompt')
+    args = parser.parse_args(argv)
+
+    server = MockInferenceServer(args.host, args.port, args.latency_ms / 1000, args.jitter_ms / 1000,
+                                 args.rate_429, args.rate_503, payload_shape=args.shape,
+                                 echo_prompt=args.echo_prompt)
+    print(f"Mock inference server on {server.url}/models/<model>")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""
+Latency/throughput benchmarks for the question generation pipeline.
+
+    python benchmarks/run_benchmarks.py -o results.json
+    python benchmarks/run_benchmarks.py --rate-429 0.05 --rate-503 0.02 -o faults.json
+    python benchmarks/run_benchmarks.py --compare results.json faults.json
+
+Inference calls go to a local mock server, so runs are repeatable on any
+machine and never touch the hosted API.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'ai'))
+sys.path.insert(0, str(ROOT / 'backend'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_inference_server import MockInferenceServer, PAYLOAD_SHAPES
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter where supported (Linux); returns whether it was reset"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (since the last reset on Linux)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def summarize(latencies, wall, units, errors):
+    from inference_client import percentile
+    return {
+        'iterations': len(latencies),
+        'errors': errors,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p95': round(percentile(latencies, 95) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+            'mean': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+            'max': round(max(latencies) * 1000, 3) if latencies else 0.0,
+        },
+        'throughput_per_s': round(len(latencies) / wall, 3) if wall else 0.0,
+        'units_per_s': round(units * len(latencies) / wall, 3) if wall else 0.0,
+    }
+
+
+def run_case(name, size, unit, fn, iterations, concurrency=1, server=None, verbose=False):
+    """
+    Call fn() iterations times (from concurrency threads) and summarize latencies.
+
+    An exception or an empty result from fn counts as an error. unit describes
+    size (e.g. 'words') so units_per_s gives e.g. words processed per second.
+    """
+    latencies = []
+    errors = 0
+    if server is not None:
+        server.reset_counts()
+
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            if not fn():
+                raise Exception(f"{name} returned no result")
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    reset_peak_rss()
+    # The pipeline logs every retry; keep that out of the report unless asked
+    sink = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with sink:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            for latency, error in executor.map(timed, range(iterations)):
+                latencies.append(latency)
+                errors += error is not None
+        wall = time.perf_counter() - started
+
+    result = {'name': name, 'size': size, 'unit': unit, 'concurrency': concurrency}
+    result.update(summarize(latencies, wall, size, errors))
+    result['peak_rss_mb'] = round(peak_rss_bytes() / (1024 * 1024), 1)
+    if server is not None:
+        result['mock_responses'] = {str(status): count for status, count in sorted(server.counts.items())}
+    return result
+
+
+def load_corpus():
+    """Text of the bundled PDFs, used to build passages of each benchmarked size"""
+    from process_pdf import extract_text_from_pdf
+    texts = [extract_text_from_pdf(str(path)) for path in sorted((ROOT / 'uploads').glob('*.pdf'))]
+    words = ' '.join(texts).split()
+    if not words:
+        raise SystemExit('No PDFs with text found in uploads/')
+    return words
+
+
+def passage(words, n_words):
+    repeats = -(-n_words // len(words))
+    return ' '.join((words * repeats)[:n_words])
+
+
+def benchmark_extract(args, results):
+    from process_pdf import extract_text_from_pdf, get_page_count
+    for pdf in sorted((ROOT / 'uploads').glob('*.pdf')):
+        pages = get_page_count(str(pdf))
+        results.append(run_case(f'extract_text_from_pdf[{pdf.name}]', pages, 'pages',
+                                lambda: extract_text_from_pdf(str(pdf)), args.iterations))
+
+
+def benchmark_generate_questions(args, server, words, results):
+    from generate_questions import generate_questions
+    from qg_backends import RemoteBackend
+    backend = RemoteBackend(token='benchmark',
+                            question_url=server.model_url('valhalla/t5-base-qg-hl'),
+                            answer_url=server.model_url('valhalla/t5-base-qa-qg-hl'),
+                            retry_delay=args.retry_delay)
+    for size in args.sizes:
+        text = passage(words, size)
+        results.append(run_case('generate_questions', size, 'words',
+                                lambda: generate_questions(text, retry_delay=args.retry_delay, backend=backend,
+                                                           dedupe_threshold=None),
+                                args.iterations, server=server, verbose=args.verbose))
+
+
+def benchmark_app(args, server, words, results):
+    import app
+    import pipeline
+    from chunker import TokenCounter
+    from result_cache import MemoryBackend, ResultCache
+
+    pipeline.DEMO_MODE = False
+    pipeline.QG_BACKEND = 'remote'
+    pipeline.QUESTION_MODEL_URL = server.model_url('gpt2')
+    if not args.result_cache:
+        # Every iteration should reach the (mock) model, so nothing is kept
+        pipeline.result_cache = ResultCache(MemoryBackend(max_entries=0))
+    # Load the tokenizer outside the timed region, as the served app's warm-up does
+    if isinstance(pipeline.count_tokens, TokenCounter):
+        pipeline.count_tokens.load()
+
+    for size in args.sizes:
+        text = passage(words, size)
+        results.append(run_case('generate_questions_from_text', size, 'words',
+                                lambda: pipeline.generate_questions_from_text(text),
+                                args.iterations, server=server, verbose=args.verbose))
+
+    client = app.app.test_client()
+
+    def post_generate(text):
+        # Closing the response frees its admission and scheduler slots
+        with client.post('/generate', json={'passage': text}) as response:
+            if response.status_code != 200:
+                raise Exception(f"/generate returned {response.status_code}")
+            return response.get_json()['mcqs']
+
+    for size in args.sizes:
+        text = passage(words, size)
+        results.append(run_case('POST /generate', size, 'words', lambda: post_generate(text),
+                                args.iterations, concurrency=args.concurrency, server=server,
+                                verbose=args.verbose))
+
+
+def benchmark_confidence(args, words, results):
+    from confidence_calculator import ConfidenceCalculator
+    calculator = ConfidenceCalculator(model_name=args.embedding_model)
+    try:
+        # Load the model outside the timed region
+        calculator.calculate_confidence_scores('Warm up?', ['a', 'b'], 'a')
+    except Exception as e:
+        results.append({'name': 'ConfidenceCalculator.calculate_confidence_scores',
+                        'skipped': f"Embedding model unavailable: {str(e)}"})
+        return
+
+    for n_options in (4, 8):
+        options = [' '.join(words[i * 7:i * 7 + 6]) for i in range(n_options)]
+        question = ' '.join(words[100:112]) + '?'
+
+        def score():
+            # Distinct text every call, so the embedding cache does not hide the model cost
+            nonce = str(time.perf_counter_ns())
+            return calculator.calculate_confidence_scores(question + nonce, [o + nonce for o in options], options[0] + nonce)
+
+        results.append(run_case('ConfidenceCalculator.calculate_confidence_scores', n_options, 'options',
+                                score, args.iterations))
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(baseline_path, current_path):
+    """Print p50/p95/throughput changes between two result files"""
+    with open(baseline_path) as f:
+        baseline = {(r['name'], r.get('size')): r for r in json.load(f)['results'] if 'latency_ms' in r}
+    with open(current_path) as f:
+        current = json.load(f)['results']
+
+    def change(old, new):
+        return f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+
+    print(f"{'benchmark':<55} {'p50':>9} {'p95':>9} {'thru':>9}")
+    for result in current:
+        old = baseline.get((result['name'], result.get('size')))
+        if old is None or 'latency_ms' not in result:
+            continue
+        label = f"{result['name']} [{result['size']} {result['unit']}]"
+        print(f"{label:<55} {change(old['latency_ms']['p50'], result['latency_ms']['p50']):>9} "
+              f"{change(old['latency_ms']['p95'], result['latency_ms']['p95']):>9} "
+              f"{change(old['throughput_per_s'], result['throughput_per_s']):>9}")
+
+
+BENCHMARKS = ('extract', 'generate_questions', 'app', 'confidence')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the MCQ pipeline against a mock inference server.')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='JSON results file (default: %(default)s)')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200, 1000, 3000], help='Passage sizes in words')
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent clients for POST /generate')
+    parser.add_argument('--latency-ms', type=float, default=50, help='Mock server latency per request')
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of mock responses that are 429')
+    parser.add_argument('--rate-503', type=float, default=0.0, help='Fraction of mock responses that are 503')
+    parser.add_argument('--shape', choices=PAYLOAD_SHAPES, default='list', help='Mock response payload shape')
+    parser.add_argument('--echo-prompt', action='store_true',
+                        help='Mock text generation output starts with the prompt, as the hosted API does')
+    parser.add_argument('--retry-delay', type=float, default=0.05, help='Backoff base for retried requests')
+    parser.add_argument('--rate-limit', type=float, default=1000, help='Client token-bucket rate (requests/s)')
+    parser.add_argument('--result-cache', action='store_true', help='Keep the result cache enabled for app benchmarks')
+    parser.add_argument('--embedding-model', help='Local path or name of the scoring model')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='Show pipeline logging')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='Compare two result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    # Read by the inference client when it is imported
+    os.environ['INFERENCE_RATE_LIMIT'] = str(args.rate_limit)
+    os.environ['INFERENCE_BURST'] = str(args.rate_limit)
+
+    results = []
+    server = MockInferenceServer(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                                 rate_429=args.rate_429, rate_503=args.rate_503,
+                                 retry_after=args.retry_delay, payload_shape=args.shape,
+                                 echo_prompt=args.echo_prompt, seed=args.seed)
+    with server:
+        words = load_corpus()
+        if 'extract' in args.only:
+            benchmark_extract(args, results)
+        if 'generate_questions' in args.only:
+            benchmark_generate_questions(args, server, words, results)
+        if 'app' in args.only:
+            benchmark_app(args, server, words, results)
+        if 'confidence' in args.only:
+            benchmark_confidence(args, words, results)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'verbose')},
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        if 'skipped' in result:
+            print(f"{result['name']}: skipped ({result['skipped']})")
+            continue
+        latency = result['latency_ms']
+        print(f"{result['name']} [{result['size']} {result['unit']}]: p50 {latency['p50']} ms, "
+              f"p95 {latency['p95']} ms, p99 {latency['p99']} ms, {result['throughput_per_s']}/s, "
+              f"{result['errors']} errors, peak RSS {result['peak_rss_mb']} MiB")
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
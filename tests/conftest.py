@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The app imports ai/ modules by name (see backend/app.py); do the same here
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'ai'))
+sys.path.insert(0, str(ROOT / 'backend'))
@@ -0,0 +1,36 @@
+from flask import Flask
+
+from admission import AdmissionLimiter, admit
+
+
+def make_client(limiter):
+    app = Flask(__name__)
+
+    @app.route('/generate', methods=['POST'])
+    @admit(limiter)
+    def generate():
+        return {'mcqs': []}
+
+    return app.test_client()
+
+
+def test_sequential_requests_release_their_slots():
+    limiter = AdmissionLimiter(max_in_flight=2, max_waiting=0, wait_timeout=0.1)
+    client = make_client(limiter)
+    for _ in range(limiter.max_in_flight * 3):
+        with client.post('/generate', json={}) as response:
+            assert response.status_code == 200
+    assert limiter.stats()['in_flight'] == 0
+
+
+def test_full_limiter_rejects_with_retry_after():
+    limiter = AdmissionLimiter(max_in_flight=1, max_waiting=0, wait_timeout=0.1)
+    client = make_client(limiter)
+    held = client.post('/generate', json={})
+    try:
+        with client.post('/generate', json={}) as response:
+            assert response.status_code == 429
+            assert int(response.headers['Retry-After']) >= 1
+    finally:
+        held.close()
+    assert limiter.stats()['in_flight'] == 0
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import torch
+
+from confidence_calculator import ConfidenceCalculator
+
+
+class Calculator(ConfidenceCalculator):
+    """Embeds texts from a fixed table instead of the model"""
+
+    def __init__(self, vectors):
+        super().__init__(embedding_cache=object())
+        self.vectors = vectors
+
+    def _embed_texts(self, texts, batch_size=64):
+        return torch.tensor(np.array([self.vectors[text] for text in texts], dtype=np.float32))
+
+
+VECTORS = {'Which is a noble gas?': [0.6, 0.8], 'Helium': [1.0, 0.0], 'Iron': [0.0, 1.0]}
+
+
+def test_single_option_scores_are_finite():
+    with np.errstate(all='raise'):
+        scores = Calculator(VECTORS).calculate_confidence_arrays(
+            [{'question': 'Which is a noble gas?', 'options': ['Helium'], 'correct_answer': 'Helium'}])
+    assert scores[0].shape == (1,)
+    assert np.isfinite(scores[0]).all()
+    # Semantic 1.0, relevance 1 - |0.5 - 0.6|, distinctiveness 1.0
+    assert scores[0][0] == pytest.approx(0.4 + 0.4 * 0.9 + 0.2)
+
+
+def test_scores_follow_option_order():
+    scores = Calculator(VECTORS).calculate_confidence_scores('Which is a noble gas?', ['Iron', 'Helium'], 'Helium')
+    assert list(scores) == ['Iron', 'Helium']
+    assert scores['Helium'] > scores['Iron']
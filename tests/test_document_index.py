@@ -0,0 +1,38 @@
+import types
+
+import numpy as np
+import torch
+
+from document_index import DocumentIndexStore
+
+PAGES = [(1, 'Photosynthesis turns light into chemical energy. Plants store it as sugar.'),
+         (2, 'Volcanoes erupt when magma rises. Lava cools into new rock.')]
+
+
+class FakeCalculator:
+    """Embeds texts by whether they mention plants, with a fixed model name"""
+
+    def __init__(self, model_name, dim=2):
+        self.embedding_cache = types.SimpleNamespace(model_name=model_name)
+        self.dim = dim
+
+    def _compute_embeddings(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vectors[row, 0 if 'light' in text or 'Plants' in text else 1] = 1
+        return torch.from_numpy(vectors)
+
+    _embed_texts = _compute_embeddings
+
+
+def test_index_of_another_model_is_rebuilt(tmp_path):
+    old = DocumentIndexStore(tmp_path, calculator=FakeCalculator('old-model', dim=3), chunk_words=5)
+    assert old.build('a' * 64, PAGES, 'notes.pdf').meta['model'] == 'old-model'
+
+    store = DocumentIndexStore(tmp_path, calculator=FakeCalculator('new-model'), chunk_words=5)
+    assert store.get('a' * 64) is None
+    assert store.find('notes.pdf') is None
+    index = store.build('a' * 64, PAGES, 'notes.pdf')
+    assert (index.meta['model'], index.meta['dim']) == ('new-model', 2)
+    assert store.search('notes.pdf', 'light', k=1)[0]['first_page'] == 1
+    assert not list(tmp_path.glob('.*'))
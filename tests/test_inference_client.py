@@ -0,0 +1,58 @@
+import pytest
+import requests
+
+from inference_client import AuthenticationError, InferenceClient, InferenceError, percentile
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status_code = status
+        self.headers = {}
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error")
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, statuses):
+        self.responses = [FakeResponse(status) for status in statuses]
+        self._next = iter(self.responses)
+
+    def post(self, *args, **kwargs):
+        return next(self._next)
+
+
+@pytest.mark.parametrize('pct, expected', [
+    (0, 1), (10, 1), (11, 2), (50, 5), (51, 6), (90, 9), (95, 10), (99, 10), (100, 10),
+])
+def test_percentile_is_nearest_rank(pct, expected):
+    assert percentile(list(range(10, 0, -1)), pct) == expected
+
+
+def test_percentile_odd_and_small_samples():
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile([7], 99) == 7
+    assert percentile([1, 2, 3, 4], 25) == 1
+    assert percentile([1, 2, 3, 4], 75) == 3
+
+
+def test_percentile_of_nothing():
+    assert percentile([], 50) == 0.0
+
+
+@pytest.mark.parametrize('statuses, error', [
+    ([401], AuthenticationError),
+    ([404], InferenceError),
+    ([503, 503], InferenceError),
+])
+def test_failed_streams_release_their_connections(statuses, error):
+    client = InferenceClient(rate=1000, burst=1000, max_retries=len(statuses), base_delay=0, max_delay=0)
+    client.session = FakeSession(statuses)
+    with pytest.raises(error):
+        client.post('http://model.test', {}, stream=True)
+    assert all(response.closed for response in client.session.responses)
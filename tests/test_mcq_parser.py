@@ -0,0 +1,38 @@
+import json
+
+from mcq_parser import MCQStreamParser, iter_mcqs, parse_mcqs
+
+QUESTION = {'question': 'What is the capital of France?', 'options': ['Berlin', 'Paris', 'Rome', 'Madrid'],
+            'answer': 'B'}
+EXPECTED = {'question': 'What is the capital of France?', 'options': ['Berlin', 'Paris', 'Rome', 'Madrid'],
+            'correct_answer': 'Paris'}
+
+
+def test_flat_question():
+    assert parse_mcqs('Here you go: ' + json.dumps(QUESTION) + ' Done.') == [EXPECTED]
+
+
+def test_dict_options():
+    data = dict(QUESTION, options={'A': 'Berlin', 'B': 'Paris', 'C': 'Rome', 'D': 'Madrid'})
+    assert parse_mcqs(json.dumps(data)) == [EXPECTED]
+
+
+def test_questions_inside_a_wrapper_object():
+    second = {'question': 'Which is a gas?', 'options': {'A': 'Iron', 'B': 'Helium'}, 'answer': 'Helium'}
+    parser = MCQStreamParser()
+    mcqs = parser.feed(json.dumps({'questions': [QUESTION, second]}))
+    assert mcqs == [EXPECTED, {'question': 'Which is a gas?', 'options': ['Iron', 'Helium'],
+                               'correct_answer': 'Helium'}]
+    assert (parser.ok, parser.rejected) == (2, 0)
+
+
+def test_questions_inside_a_wrapper_array_streamed():
+    text = json.dumps([QUESTION, QUESTION])
+    assert list(iter_mcqs(text[i:i + 7] for i in range(0, len(text), 7))) == [EXPECTED, EXPECTED]
+
+
+def test_malformed_question_costs_only_itself():
+    text = '{"question": "Broken?", "options": ["a", "b"], "answer": }\n' + json.dumps(QUESTION)
+    parser = MCQStreamParser()
+    assert parser.feed(text) == [EXPECTED]
+    assert (parser.ok, parser.rejected) == (1, 1)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+import torch
+
+from quality_gate import QualityGate, iter_gated
+
+CONTEXT = 'Marie Curie discovered polonium and radium with her husband Pierre Curie.'
+
+
+class ScriptedBackend:
+    """Answers each call with the next list of (question, answer) pairs"""
+
+    def __init__(self, *rounds):
+        self.rounds = list(rounds)
+        self.calls = []
+
+    def iter_question_answers(self, contexts, sample=False):
+        self.calls.append((len(contexts), sample))
+        for index, (question, answer) in enumerate(self.rounds.pop(0)):
+            yield index, question, answer, None
+
+
+class FakeCalculator:
+    """Embeds texts as fixed unit vectors"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def _embed_texts(self, texts):
+        return torch.tensor(np.array([self.vectors[text] for text in texts], dtype=np.float32))
+
+
+@pytest.mark.parametrize('n_segments, budget', [(0, 0), (1, 1), (2, 1), (3, 1), (4, 1), (5, 2)])
+def test_budget_covers_short_documents(n_segments, budget):
+    assert QualityGate(regeneration_budget=0.25).budget_for(n_segments) == budget
+
+
+def test_single_segment_document_is_regenerated():
+    backend = ScriptedBackend([('Curie?', 'radium')], [('What did Marie Curie discover?', 'polonium')])
+    gate = QualityGate()
+    results = list(iter_gated(backend, [CONTEXT], gate))
+    assert results == [(0, 'What did Marie Curie discover?', 'polonium', None)]
+    assert backend.calls == [(1, False), (1, True)]
+    assert gate.report() == {'accepted': 1, 'rejected': {'question_length': 1}, 'regenerated': 1}
+
+
+def test_relevance_check_is_on_by_default(monkeypatch):
+    monkeypatch.delenv('QG_MIN_RELEVANCE', raising=False)
+    gate = QualityGate.from_env()
+    calculator = FakeCalculator({'Who found radium?': [1, 0], 'Curie': [0.8, 0.6], 'Where is Paris?': [0, 1],
+                                 'radium': [1, 0]})
+    keep = gate.filter_scored(['Who found radium?', 'Where is Paris?'], ['Curie', 'radium'], calculator)
+    assert keep == [0]
+    assert gate.rejected == {'low_relevance': 1}
+
+
+def test_relevance_check_can_be_turned_off(monkeypatch):
+    monkeypatch.setenv('QG_MIN_RELEVANCE', 'off')
+    assert QualityGate.from_env().filter_pairs(['Where is Paris?'], ['radium']) == [0]
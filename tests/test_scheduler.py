@@ -0,0 +1,55 @@
+import pytest
+from flask import Flask
+
+from admission import Rejected
+from scheduler import BULK, FairScheduler, QuotaExceeded, scheduled
+
+
+def test_sequential_requests_release_their_slots(tmp_path):
+    scheduler = FairScheduler(tmp_path / 'scheduler.sqlite3', capacity=2, interactive_reserve=0,
+                              tenant_concurrency=2)
+    app = Flask(__name__)
+
+    @app.route('/generate', methods=['POST'])
+    @scheduled(scheduler, lambda: 'tenant', lambda: 100, timeout=0.2)
+    def generate():
+        return {'mcqs': []}
+
+    client = app.test_client()
+    for _ in range(scheduler.capacity * 3):
+        with client.post('/generate', json={}) as response:
+            assert response.status_code == 200
+    assert scheduler.stats()['interactive'] == {'queued': 0, 'running': 0}
+
+
+def test_acquire_times_out_while_full(tmp_path):
+    scheduler = FairScheduler(tmp_path / 'scheduler.sqlite3', capacity=1, interactive_reserve=0)
+    held = scheduler.acquire('a', 10, timeout=1)
+    with pytest.raises(Rejected) as rejected:
+        scheduler.acquire('b', 10, timeout=0.2)
+    assert rejected.value.status == 503
+    scheduler.release(held)
+    assert scheduler.stats()['interactive'] == {'queued': 0, 'running': 0}
+
+
+def test_failed_tasks_do_not_count_against_the_quota(tmp_path):
+    scheduler = FairScheduler(tmp_path / 'scheduler.sqlite3', tenant_tokens_per_hour=100)
+    scheduler.release(scheduler.acquire('a', 80, timeout=1), error='upstream failed')
+    scheduler.release(scheduler.acquire('a', 80, timeout=1))
+    with pytest.raises(QuotaExceeded):
+        scheduler.submit('a', BULK, 80)
+
+
+def test_running_jobs_do_not_hold_back_the_tenants_requests(tmp_path):
+    scheduler = FairScheduler(tmp_path / 'scheduler.sqlite3', capacity=4, interactive_reserve=1,
+                              tenant_concurrency=1)
+    scheduler.register('pdf', lambda task_id, payload: None)
+    job = scheduler.submit('a', BULK, 1000, handler='pdf')
+    assert scheduler._claim(lambda row: row['kind'] == BULK)['id'] == job
+    scheduler.submit('a', BULK, 1000, handler='pdf')
+    # The tenant's second job waits for its first; its request does not
+    assert scheduler._claim(lambda row: row['kind'] == BULK) is None
+    request = scheduler.acquire('a', 100, timeout=0.2)
+    assert scheduler.stats() == {'interactive': {'queued': 0, 'running': 1}, 'bulk': {'queued': 1, 'running': 1}}
+    scheduler.release(request)
+    scheduler.release(job)
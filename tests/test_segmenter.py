@@ -0,0 +1,29 @@
+import pytest
+
+from segmenter import split_segments, split_sentences
+
+
+@pytest.mark.parametrize('text, expected', [
+    # Sentence-final words that double as abbreviations
+    ('He said no. Next we left the house.', ['He said no.', 'Next we left the house.']),
+    ('A hot meal was served at sec. Then they ate.', ['A hot meal was served at sec.', 'Then they ate.']),
+    ('It happened in Jan. We moved on.', ['It happened in Jan.', 'We moved on.']),
+    # ...which are abbreviations when a number follows
+    ('See No. 5 for details. Then go.', ['See No. 5 for details.', 'Then go.']),
+    ('Read p. 12 now. Then stop.', ['Read p. 12 now.', 'Then stop.']),
+    ('Arrived on Jan. 5 in the morning. Good.', ['Arrived on Jan. 5 in the morning.', 'Good.']),
+    # A single capital letter ends a sentence unless it is an initial
+    ('It was called Plan B. The next plan failed.', ['It was called Plan B.', 'The next plan failed.']),
+    ('J. K. Rowling wrote it. Then she rested.', ['J. K. Rowling wrote it.', 'Then she rested.']),
+    ('Written by J. Smith in 1990. It sold well.', ['Written by J. Smith in 1990.', 'It sold well.']),
+    # Unambiguous abbreviations and decimals never split
+    ('Mr. Smith met Dr. Jones, e.g. at work. Fine.', ['Mr. Smith met Dr. Jones, e.g. at work.', 'Fine.']),
+    ('Pi is about 3.14 in value. Yes.', ['Pi is about 3.14 in value.', 'Yes.']),
+])
+def test_split_sentences(text, expected):
+    assert split_sentences(text) == expected
+
+
+def test_split_segments_filters_short_and_numeric_sentences():
+    text = 'Too short. 12 34 56 78 90 12 34. The mitochondria is the powerhouse of the cell.'
+    assert split_segments(text) == ['The mitochondria is the powerhouse of the cell']